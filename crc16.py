@@ -1,4 +1,7 @@
 import re
+import struct
+import binascii
+import numpy
 
 crc16tab = [0x0000, 0x1021, 0x2042, 0x3063, 0x4084, 0x50a5, 0x60c6, 0x70e7,
             0x8108, 0x9129, 0xa14a, 0xb16b, 0xc18c, 0xd1ad, 0xe1ce, 0xf1ef,
@@ -34,22 +37,38 @@ crc16tab = [0x0000, 0x1021, 0x2042, 0x3063, 0x4084, 0x50a5, 0x60c6, 0x70e7,
             0x6e17, 0x7e36, 0x4e55, 0x5e74, 0x2e93, 0x3eb2, 0x0ed1, 0x1ef0]
 
 
+############################
+# CCITT (запросы к ИТБ) #
+############################
+# crc16tab - таблица CRC-16/CCITT (полином 0x1021, без отражения); расчет по ней совпадает с binascii.crc_hqx,
+# который выполняется на C, поэтому таблица оставлена только для совместимости
+
+
+def ccitt(data, crc=0x1D0F):
+    """
+    CRC-16/CCITT по байтам.
+
+    :param data: bytes, bytearray, memoryview или list байт
+    """
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data)
+    return binascii.crc_hqx(data, crc)
+
+
+def words_to_bytes(buf, buf_len, endian="big"):
+    # каждый элемент buf - 16-битное слово (для запросов ИТБ старший байт равен 0)
+    if isinstance(buf, (bytes, bytearray, memoryview)):
+        words = bytearray(2 * buf_len)
+        words[1 if endian == "big" else 0::2] = buf[:buf_len]
+        return words
+    return struct.pack((">%dH" if endian == "big" else "<%dH") % buf_len, *[(var & 0xFFFF) for var in buf[:buf_len]])
+
+
 def calc(buf, buf_len, endian="big"):
-    crc = 0x1D0F  # initial value
-    global crc16tab
-    if endian == "big":
-        for i in range(buf_len):
-            index = ((crc >> 8) & 0xFFFF) ^ ((buf[i] >> 8) & 0x00FF)
-            crc = ((crc << 8) ^ (crc16tab[index])) & 0xFFFF
-            index = ((crc >> 8) & 0xFFFF) ^ ((buf[i] >> 0) & 0x00FF)
-            crc = ((crc << 8) ^ (crc16tab[index])) & 0xFFFF
-    elif endian == "little":
-        for i in range(buf_len):
-            index = ((crc >> 8) & 0xFFFF) ^ ((buf[i] >> 0) & 0x00FF)
-            crc = ((crc << 8) ^ (crc16tab[index])) & 0xFFFF
-            index = ((crc >> 8) & 0xFFFF) ^ ((buf[i] >> 8) & 0x00FF)
-            crc = ((crc << 8) ^ (crc16tab[index])) & 0xFFFF
-    return crc
+    """
+    CRC-16/CCITT с начальным значением 0x1D0F по 16-битным словам (так считается CRC запросов к ИТБ).
+    """
+    return binascii.crc_hqx(words_to_bytes(buf, buf_len, endian=endian), 0x1D0F)
 
 
 def calc_to_list(buf, buf_len, endian="big"):
@@ -60,22 +79,13 @@ def calc_to_list(buf, buf_len, endian="big"):
 def calc_str(buf_string, endian="big"):
     pattern = re.compile(r"([A-F0-9]{4})")
     data_list = pattern.findall(buf_string.replace(" ", "").upper())
-    data_int = []
-    for var in data_list:
-        data_int.append(int(var, 16))
-    crc16 = calc(data_int, len(data_int), endian=endian)
-    return crc16
+    data_int = [int(var, 16) for var in data_list]
+    return calc(data_int, len(data_int), endian=endian)
 
 
 def calc_bytes(buf, len):
-    d = 1
-    crc = 0x1D0F
-    for i in range(len):
-        index = ((crc >> 8) ^ buf[i + d]) & 0x00FF
-        crc = (crc << 8) ^ crc16tab[index]
-        crc &= 0xFFFF
-        d = -d
-    return crc
+    # байты обрабатываются попарно в обратном порядке: 1, 0, 3, 2, ...
+    return binascii.crc_hqx(bytes(buf[i + (1 if i % 2 == 0 else -1)] for i in range(len)), 0x1D0F)
 
 
 ############################
@@ -117,18 +127,151 @@ _CRC16TABLE = (
     0x8201, 0x42C0, 0x4380, 0x8341, 0x4100, 0x81C1, 0x8081, 0x4040)
 
 
-def calc_modbus_crc16_bytes(data):
-    # Preload a 16-bit register with ones
-    register = 0xFFFF
+_modbus_tab16 = None  # таблица для обработки сразу двух байт: _modbus_tab16[register ^ слово]
+
+
+def _get_modbus_tab16():
+    global _modbus_tab16
+    if _modbus_tab16 is None:
+        table = numpy.array(_CRC16TABLE, dtype=numpy.uint32)
+        register = numpy.arange(0x10000, dtype=numpy.uint32)
+        register = (register >> 8) ^ table[register & 0xFF]
+        register = (register >> 8) ^ table[register & 0xFF]
+        _modbus_tab16 = register.tolist()
+    return _modbus_tab16
+
+
+def modbus(data, register=0xFFFF):
+    """
+    CRC-16/MODBUS (отраженный полином 0x8005, начальное значение 0xFFFF).
+
+    :param data: bytes, bytearray, memoryview или list байт
+    :return: регистр CRC (в кадре передается младшим байтом вперед)
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data_len = len(data)
+        table16 = _modbus_tab16 or _get_modbus_tab16()
+        for word in struct.unpack_from("<%dH" % (data_len >> 1), data):
+            register = table16[register ^ word]
+        if data_len & 1:
+            register = (register >> 8) ^ _CRC16TABLE[(register ^ data[data_len - 1]) & 0xFF]
+        return register
     for byte in data:
         register = (register >> 8) ^ _CRC16TABLE[(register ^ byte) & 0xFF]
+    return register
+
+
+def calc_modbus_crc16_bytes(data):
+    register = modbus(data)
     return [((register >> 0) & 0xFF), ((register >> 8) & 0xFF)]
 
 
 def modbus_crc16(bytes_data):
-    crc_list = calc_modbus_crc16_bytes(bytes_data)
-    return (crc_list[0] << 8) + crc_list[1]
+    # CRC в порядке байт кадра; для кадра вместе с его CRC результат равен 0
+    register = modbus(bytes_data)
+    return ((register & 0xFF) << 8) | (register >> 8)
+
+
+############################
+# Пакетный расчет #
+############################
+
+def modbus_batch(frames):
+    """
+    CRC-16/MODBUS для множества кадров за один вызов: кадры одной длины складываются в матрицу,
+    и расчет идет по столбцам (по два байта за шаг) сразу для всех кадров.
+
+    :param frames: последовательность bytes-подобных кадров
+    :return: numpy.ndarray (uint16) со значениями в формате modbus_crc16
+    """
+    result = numpy.zeros(len(frames), dtype=numpy.uint16)
+    groups = {}
+    for num, frame in enumerate(frames):
+        groups.setdefault(len(frame), []).append(num)
+    for frame_len, index in groups.items():
+        data = numpy.frombuffer(b"".join([bytes(frames[num]) for num in index]), dtype=numpy.uint8)
+        result[index] = modbus_rows(data.reshape(len(index), frame_len))
+    return result
+
+
+_modbus_tables = None  # (_CRC16TABLE, _modbus_tab16) в numpy.ndarray для пакетного расчета
+
+
+def modbus_rows(data):
+    """
+    CRC-16/MODBUS строк матрицы байт (кадры одной длины).
+
+    :param data: numpy.ndarray (uint8) формы (кадров, длина кадра)
+    :return: numpy.ndarray (uint16) со значениями в формате modbus_crc16
+    """
+    global _modbus_tables
+    if _modbus_tables is None:
+        _modbus_tables = (numpy.array(_CRC16TABLE, dtype=numpy.uint32),
+                          numpy.array(_modbus_tab16 or _get_modbus_tab16(), dtype=numpy.uint32))
+    table, table16 = _modbus_tables
+    frame_len = data.shape[1]
+    data = data.astype(numpy.uint32)
+    register = numpy.full(data.shape[0], 0xFFFF, dtype=numpy.uint32)
+    for i in range(0, frame_len - 1, 2):
+        register = table16[register ^ (data[:, i] | (data[:, i + 1] << 8))]
+    if frame_len % 2:
+        register = (register >> 8) ^ table[(register ^ data[:, frame_len - 1]) & 0xFF]
+    return (((register & 0xFF) << 8) | (register >> 8)).astype(numpy.uint16)
+
+
+def modbus_check_batch(frames):
+    """
+    Проверка CRC ответов ИТБ.
+
+    :return: numpy.ndarray (bool): True - CRC кадра верна
+    """
+    return modbus_batch(frames) == 0
+
+
+def calc_check_batch(frames):
+    """
+    Проверка CRC запросов к ИТБ (CCITT по словам, CRC в двух последних байтах, старшим байтом вперед).
+    Как в modbus_batch: кадры группируются по длине, CRC группы считается по столбцам numpy.
+
+    :param frames: список кадров (bytes, bytearray, memoryview или list байт)
+    :return: numpy.ndarray (bool): True - CRC кадра верна
+    """
+    result = numpy.zeros(len(frames), dtype=bool)
+    groups = {}
+    for num, frame in enumerate(frames):
+        if len(frame) >= 2:
+            groups.setdefault(len(frame), []).append(num)
+    for frame_len, index in groups.items():
+        data = numpy.frombuffer(b"".join([bytes(frames[num]) for num in index]), dtype=numpy.uint8)
+        data = data.reshape(len(index), frame_len)
+        crc = calc_rows(data[:, :-2])
+        result[index] = crc == ((data[:, -2].astype(numpy.uint16) << 8) | data[:, -1])
+    return result
+
+
+_ccitt_tab16 = None  # таблица для обработки слова запроса (старший байт 0) за один шаг: _ccitt_tab16[crc ^ слово]
+
+
+def calc_rows(data):
+    """
+    CRC-16/CCITT запросов (как calc, слово - байт со старшим байтом 0) для строк матрицы байт.
+
+    :param data: numpy.ndarray (uint8) формы (кадров, длина кадра без CRC)
+    :return: numpy.ndarray (uint16)
+    """
+    global _ccitt_tab16
+    if _ccitt_tab16 is None:
+        # два шага таблицы crc16tab с нулевыми байтами: для CRC без отражения слово целиком входит в регистр
+        table = numpy.array(crc16tab, dtype=numpy.uint32)
+        register = numpy.arange(0x10000, dtype=numpy.uint32)
+        register = ((register << 8) ^ table[register >> 8]) & 0xFFFF
+        register = ((register << 8) ^ table[register >> 8]) & 0xFFFF
+        _ccitt_tab16 = register
+    register = numpy.full(data.shape[0], 0x1D0F, dtype=numpy.uint32)
+    for i in range(data.shape[1]):
+        register = _ccitt_tab16[register ^ data[:, i]]
+    return register.astype(numpy.uint16)
 
 
 if __name__ == '__main__':  # Если мы запускаем файл напрямую, а не импортируем
-    print(hex(modbus_crc16([0x00, 0x01, 0xC1, 0x00, 0x01, 0x00, 0x28, 0xCD], 6)))
+    print(hex(modbus_crc16([0x00, 0x01, 0xC1, 0x00, 0x01, 0x00])))
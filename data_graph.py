@@ -5,7 +5,6 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 import matplotlib.pyplot as plt
 import numpy as np
-import copy
 
 
 class Layout(QVBoxLayout):
@@ -13,9 +12,19 @@ class Layout(QVBoxLayout):
         super().__init__()
         self.figure = plt.figure()
         self.canvas = FigureCanvas(self.figure)
-        # self.toolbar = NavigationToolbar(self.canvas, root)
-        # self.addWidget(self.toolbar)
+        self.toolbar = NavigationToolbar(self.canvas, root)
+        self.addWidget(self.toolbar)
         self.addWidget(self.canvas)
+        self.time_range = None  # отображаемый диапазон времени (t_start, t_stop) после масштабирования, None - вся история
+
+    def get_time_range(self):
+        return self.time_range if self.time_range else (None, None)
+
+    def reset_time_range(self):
+        self.time_range = None
+
+    def _xlim_changed(self, axes):
+        self.time_range = tuple(axes.get_xlim())
 
     def plot_channel_current(self, channel_graph_data):  # graph_data в формате [["Имя1, ед.изм.", [data]], ["Имя2, ед.изм.", [data]]...]
         """
@@ -38,18 +47,14 @@ class Layout(QVBoxLayout):
             times_label = [var[0][0] for var in channel_graph_data]
             times_list = [var[0][1] for var in channel_graph_data]
             currents_label = [var[1][0] for var in channel_graph_data]
-            currents_list = [var[1][1] for var in channel_graph_data]
-            currents_pos_list = copy.deepcopy(currents_list)
-            currents_neg_list = copy.deepcopy(currents_list)
-            for j, currents in enumerate(currents_list):
-                for i, current in enumerate(currents):
-                    if current <= -current_min:
-                        currents_neg_list[j][i] = -current
-                    elif current >= current_min:
-                        currents_pos_list[j][i] = current
-                    else:
-                        currents_pos_list[j][i] = current_min
-                        currents_neg_list[j][i] = current_min
+            currents_list = [np.asarray(var[1][1], dtype=float) for var in channel_graph_data]
+            # положительная и отрицательная ветви для логарифмической шкалы: ток по модулю меньше current_min
+            # рисуется на уровне current_min, ток другого знака в ветвь не попадает (не отображается)
+            currents_small = [np.abs(currents) < current_min for currents in currents_list]
+            currents_pos_list = [np.where(small, current_min, currents)
+                                 for small, currents in zip(currents_small, currents_list)]
+            currents_neg_list = [np.where(small, current_min, -currents)
+                                 for small, currents in zip(currents_small, currents_list)]
             for num, time in enumerate(times_list):
                 axes.plot(time, currents_pos_list[num], line_type_from_index(2*num + 0), label=currents_label[num] + " +")
                 axes.plot(time, currents_neg_list[num], line_type_from_index(2*num + 1), label=currents_label[num] + " -")
@@ -60,6 +65,11 @@ class Layout(QVBoxLayout):
             axes.set_yscale("log")
             axes.legend(loc=2)
             axes.grid()
+            # масштаб, выбранный пользователем, сохраняется между перерисовками; данные для него запрашиваются
+            # с прореживанием только внутри диапазона (get_time_range)
+            if self.time_range:
+                axes.set_xlim(*self.time_range)
+            axes.callbacks.connect("xlim_changed", self._xlim_changed)
             # refresh canvas
             self.canvas.draw()
         except Exception as error:
@@ -0,0 +1,197 @@
+import asyncio
+import serial
+import itb_frame
+import itb_metrics
+import itb_ports
+import itb_serial
+
+
+class ITBCrcError(Exception):
+    pass
+
+
+class ITBLinkError(Exception):
+    pass
+
+
+class AsyncITBSerial:
+    """
+    Асинхронный (asyncio) транспорт ИТБ: чтение порта по готовности дескриптора (loop.add_reader),
+    без отдельного потока на порт. Требует цикл событий на селекторах (POSIX).
+
+    Пример:
+        itb = AsyncITBSerial(port="/dev/ttyUSB0")
+        await itb.open()
+        data = await itb.request("get_channel_data")
+    """
+    def __init__(self, **kw):
+        self.serial_numbers = []
+        self.baudrate = 9600
+        self.port = None
+        self.read_timeout = 0.5
+        self.window = 1  # число одновременно ожидающих ответа запросов на порт
+        self.debug = False
+        self.crc_check = True
+        for key in sorted(kw):
+            if key == "serial_numbers":
+                self.serial_numbers = kw.pop(key)
+            elif key == "baudrate":
+                self.baudrate = kw.pop(key)
+            elif key == "port":
+                self.port = kw.pop(key)
+            elif key == "timeout":
+                self.read_timeout = kw.pop(key)
+            elif key == "window":
+                self.window = max(1, min(255, kw.pop(key)))
+            elif key == "debug":
+                self.debug = kw.pop(key)
+            elif key == "crc":
+                self.crc_check = kw.pop(key)
+            else:
+                pass
+        self.s_addr = 0x00  # self address
+        self.d_addr = 0x01  # device address (по умолчанию)
+        self.seq_num = 0
+        self.serial = serial.Serial()
+        self.parser = itb_frame.FrameParser(crc_check=self.crc_check is not False, on_crc_error=self._crc_error)
+        self.pending = {}  # ожидающие ответа запросы: {seq_num: [cmd, future]}
+        self.nansw = 0  # неответы
+        self.rto = itb_serial.RTOEstimator(rto_init=self.read_timeout, rto_max=self.read_timeout)
+        self.metrics = itb_metrics.TransportMetrics()
+        self.loop = None
+        self._window_sem = None
+
+    def _print(self, *args):
+        if self.debug:
+            print(itb_serial.get_time() + " ", *args)
+
+    @property
+    def is_open(self):
+        return self.serial.is_open
+
+    async def open(self, port=None):
+        self.loop = asyncio.get_running_loop()
+        self._window_sem = asyncio.Semaphore(self.window)
+        self.serial.port = port or self.port
+        self.serial.baudrate = self.baudrate
+        self.serial.timeout = 0  # неблокирующее чтение: данные забираются только по готовности дескриптора
+        self.serial.open()
+        self.port = self.serial.port
+        self.loop.add_reader(self.serial.fileno(), self._on_readable)
+        self._print("Success connection:", self.port)
+
+    async def open_id(self):
+        for serial_number, device in itb_serial.find_ports(self.serial_numbers, debug_print=self._print):
+            try:
+                await self.open(port=device)
+                return True
+            except serial.serialutil.SerialException as error:
+                self._print("Fail connection", error)
+                itb_ports.port_index.invalidate(serial_number)
+        return False
+
+    def close(self, error=None):
+        """
+        :param error: исключение для ожидающих ответа запросов (None - запросы отменяются)
+        """
+        if self.serial.is_open:
+            try:
+                self.loop.remove_reader(self.serial.fileno())
+            except (OSError, ValueError) as remove_error:
+                self._print("Remove reader error:", remove_error)
+            self.serial.close()
+        for cmd, future in self.pending.values():
+            if not future.done():
+                if error is None:
+                    future.cancel()
+                else:
+                    future.set_exception(error)
+        self.pending = {}
+
+    async def request(self, req_type="mirror", data=None, address=None, timeout=None):
+        """
+        Отправка запроса и ожидание ответа на него.
+
+        :param address: адрес ИТБ на линии (по умолчанию self.d_addr)
+        :param timeout: время ожидания ответа, с (по умолчанию - по статистике RTT команды, не более self.read_timeout)
+        :return: bytes с данными ответа
+        :raise asyncio.TimeoutError: нет ответа
+        :raise ITBCrcError: ответ на запрос принят с неверной CRC
+        :raise ITBLinkError: ошибка порта (порт закрыт, запрос нужно повторить после open)
+        """
+        cmd, with_data = itb_serial.req_type_table.get(req_type, (0x00, False))
+        async with self._window_sem:
+            seq = self._next_seq()
+            data_to_send = itb_frame.form_frame(self.d_addr if address is None else address, self.s_addr, seq, cmd,
+                                                data=data if with_data else None)
+            future = self.loop.create_future()
+            self.pending[seq] = [cmd, future]
+            rto_key = (cmd, data_to_send[5])
+            try:
+                try:
+                    self.serial.write(bytes(data_to_send))
+                except (serial.serialutil.SerialException, OSError) as error:
+                    self.pending.pop(seq, None)
+                    future.cancel()
+                    self.close(error=ITBLinkError("Port %s error: %s" % (self.port, error)))
+                    raise ITBLinkError("Port %s error: %s" % (self.port, error))
+                self.metrics.sent(len(data_to_send))
+                if self.debug:
+                    self._print("Send packet:", itb_serial.bytes_array_to_str(data_to_send))
+                time_send = self.loop.time()
+                answer = await asyncio.wait_for(future, self.rto.timeout(rto_key) if timeout is None else timeout)
+                self.rto.update(rto_key, self.loop.time() - time_send)
+                self.metrics.answer(cmd, self.loop.time() - time_send)
+                return answer
+            except asyncio.TimeoutError:
+                self.nansw += 1
+                self.metrics.timeout()
+                self.rto.backoff(rto_key)
+                raise
+            finally:
+                self.pending.pop(seq, None)
+
+    def _next_seq(self):
+        # номер последовательности, не занятый ожидающими ответа запросами
+        for i in range(256):
+            seq = self.seq_num & 0xFF
+            self.seq_num += 1
+            if seq not in self.pending:
+                return seq
+        raise RuntimeError("No free sequence number")
+
+    def _on_readable(self):
+        try:
+            read_data = self.serial.read(self.serial.in_waiting or 1)
+        except (serial.serialutil.SerialException, OSError) as error:
+            # порт пропал (например, EIO): без закрытия дескриптор остается готовым и ошибка повторяется на каждом
+            # проходе цикла событий
+            self._print("Receive error:", error)
+            self.close(error=ITBLinkError("Port %s error: %s" % (self.port, error)))
+            return
+        if not read_data:
+            return
+        self.metrics.received(len(read_data))
+        self.parser.feed(read_data)
+        for seq, cmd, data in self.parser.frames():
+            request = self.pending.get(seq)
+            if request and request[0] == cmd and not request[1].done():
+                request[1].set_result(bytes(data))
+            else:
+                if self.debug:
+                    self._print("Answer error: unexpected answer seq <0x%02X> command <0x%02X>" % (seq, cmd))
+
+    def get_metrics(self):
+        metrics = self.metrics.snapshot()
+        metrics.update({"crc_errors": self.parser.crc_errors,
+                        "resync_bytes": self.parser.resync_bytes,
+                        "overflow_bytes": self.parser.overflow_bytes,
+                        "nansw": self.nansw,
+                        "in_flight": len(self.pending),
+                        "rto": self.rto.get_stat()})
+        return metrics
+
+    def _crc_error(self, frame):
+        request = self.pending.get(frame[2])
+        if request and request[0] == frame[4] and not request[1].done():
+            request[1].set_exception(ITBCrcError("CRC16 error: " + itb_serial.bytes_array_to_str(frame)))
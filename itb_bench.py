@@ -0,0 +1,688 @@
+import sys
+import json
+import argparse
+import os
+import time
+import shutil
+import tempfile
+import struct
+import threading
+import asyncio
+import statistics
+import random
+import timeit
+import subprocess
+import numpy
+import serial
+import serial.tools.list_ports
+import crc16
+import itb_serial
+import itb_data
+import itb_frame
+import itb_async
+import itb_metrics
+import itb_ports
+import itb_sim
+import itb_store
+import itb_lod
+
+
+def make_answer(seq, cmd, data):
+    answer = bytearray([0x00, 0x01, seq & 0xFF, 0x00, cmd, len(data)]) + bytes(data)
+    return answer + bytes(crc16.calc_modbus_crc16_bytes(answer))
+
+
+def make_stream(frames_num=20000, data_len=32, corrupt=0.0, garbage=0.0, seed=1):
+    """
+    Поток ответов ИТБ для проверки разборщика.
+
+    :param corrupt: доля кадров с испорченным байтом
+    :param garbage: доля кадров, перед которыми вставлен мусор
+    :return: (поток байт, число неиспорченных кадров)
+    """
+    rnd = random.Random(seed)
+    stream = bytearray()
+    valid = 0
+    for i in range(frames_num):
+        if rnd.random() < garbage:
+            stream += bytes(rnd.randrange(1, 256) for j in range(rnd.randrange(1, 16)))
+        frame = make_answer(i, 0x03, bytes(rnd.randrange(256) for j in range(data_len)))
+        if rnd.random() < corrupt:
+            frame[rnd.randrange(1, len(frame))] ^= 0x5A
+        else:
+            valid += 1
+        stream += frame
+    return bytes(stream), valid
+
+
+def legacy_parse(stream, chunk=64):
+    # повтор прежнего разбора из ITBSerial.thread_function: склейка буфера на каждом куске,
+    # сдвиг на один байт при неверном заголовке, срезы-копии для CRC и данных и прежний расчет CRC
+    frames = []
+    buf = bytearray(b"")
+    for pos in range(0, len(stream), chunk):
+        read_data = buf + bytes(stream[pos:pos + chunk])
+        while len(read_data) >= 8:
+            if read_data[0] == 0x00:
+                if len(read_data) >= read_data[5] + 8:
+                    if legacy_modbus_crc16(read_data[:read_data[5] + 8]) == 0:
+                        frames.append([read_data[4], read_data[6:6 + read_data[5]]])
+                        read_data = read_data[read_data[5] + 8:]
+                    else:
+                        read_data = read_data[1:]
+                else:
+                    break
+            else:
+                read_data = read_data[1:]
+        buf = read_data
+    return len(frames)
+
+
+def parser_parse(stream, chunk=64):
+    parser = itb_frame.FrameParser()
+    frames_num = 0
+    view = memoryview(stream)
+    for pos in range(0, len(stream), chunk):
+        parser.feed(view[pos:pos + chunk])
+        for seq, cmd, data in parser.frames():
+            frames_num += 1
+    return frames_num
+
+
+def bench_parser(frames_num=20000, data_len=32, chunks=(64, 4096), repeat=3):
+    """
+    Скорость разбора потока ответов (МБ/с) на чистом и на испорченном потоке при чтении порта
+    кусками разного размера.
+
+    :return: словарь {(поток, кусок, разборщик): [МБ/с, кадров разобрано, кадров ожидалось]}
+    """
+    streams = {"clean": make_stream(frames_num, data_len),
+               "corrupted": make_stream(frames_num, data_len, corrupt=0.05, garbage=0.05)}
+    result = {}
+    for stream_name, (stream, valid) in streams.items():
+        for chunk in chunks:
+            for parser_name, parse in (("legacy", legacy_parse), ("parser", parser_parse)):
+                parse_time = None
+                for i in range(repeat):
+                    time_start = time.perf_counter()
+                    parsed = parse(stream, chunk=chunk)
+                    parse_time = min(parse_time or 1E9, time.perf_counter() - time_start)
+                result[(stream_name, chunk, parser_name)] = [len(stream) / parse_time / 1E6, parsed, valid]
+    return result
+
+
+def legacy_modbus_crc16(bytes_data):
+    # прежний crc16.modbus_crc16: побайтный расчет со сборкой промежуточного списка
+    register = 0xFFFF
+    for byte in bytes_data:
+        register = (register >> 8) ^ crc16._CRC16TABLE[(register ^ byte) & 0xFF]
+    crc_list = [((register >> 0) & 0xFF), ((register >> 8) & 0xFF)]
+    return (crc_list[0] << 8) + crc_list[1]
+
+
+def legacy_calc(buf, buf_len):
+    # прежний crc16.calc: две табличные операции с масками на каждое слово
+    crc = 0x1D0F
+    for i in range(buf_len):
+        index = ((crc >> 8) & 0xFFFF) ^ ((buf[i] >> 8) & 0x00FF)
+        crc = ((crc << 8) ^ (crc16.crc16tab[index])) & 0xFFFF
+        index = ((crc >> 8) & 0xFFFF) ^ ((buf[i] >> 0) & 0x00FF)
+        crc = ((crc << 8) ^ (crc16.crc16tab[index])) & 0xFFFF
+    return crc
+
+
+def bench_crc(frames_num=5000, data_len=32, repeat=3):
+    """
+    Скорость расчета CRC: прежние функции, новые функции по одному кадру и пакетная проверка.
+    Перед замером результаты сверяются с прежними функциями.
+
+    :return: {название: кадров/с}
+    """
+    rnd = random.Random(2)
+    answers = [make_answer(i, 0x03, bytes(rnd.randrange(256) for j in range(data_len))) for i in range(frames_num)]
+    requests = [[rnd.randrange(256) for j in range(data_len + 6)] for i in range(frames_num)]
+    # сверка
+    assert all(crc16.modbus_crc16(frame) == legacy_modbus_crc16(frame) == 0 for frame in answers)
+    assert all(crc16.calc(frame, len(frame)) == legacy_calc(frame, len(frame)) for frame in requests)
+    assert crc16.modbus_check_batch(answers).all()
+    cases = {
+        "modbus legacy": lambda: [legacy_modbus_crc16(frame) for frame in answers],
+        "modbus": lambda: [crc16.modbus_crc16(frame) for frame in answers],
+        "modbus batch": lambda: crc16.modbus_check_batch(answers),
+        "ccitt legacy": lambda: [legacy_calc(frame, len(frame)) for frame in requests],
+        "ccitt": lambda: [crc16.calc(frame, len(frame)) for frame in requests],
+    }
+    result = {}
+    for name, case in cases.items():
+        case_time = min(timeit.repeat(case, number=1, repeat=repeat))
+        result[name] = frames_num / case_time
+    return result
+
+
+def legacy_transaction(port, data_to_send, read_timeout=0.5):
+    # повтор прежнего цикла ITBSerial.thread_function: сон 10 мс перед отправкой и на каждой итерации приема
+    time.sleep(0.010)
+    port.read(port.in_waiting)
+    port.write(bytes(data_to_send))
+    buf = bytearray(b"")
+    time_start = time.perf_counter()
+    while time.perf_counter() - time_start < read_timeout:
+        time.sleep(0.01)
+        buf += port.read(128)
+        if len(buf) >= 8 and len(buf) >= buf[5] + 8:
+            return True
+    return False
+
+
+def bench_receive_latency(cycles=200, baudrate=9600, data_len=8):
+    """
+    Сравнение задержки запрос-ответ прежнего (опрос со sleep) и текущего (блокирующее чтение) тракта приема
+    на имитаторе ИТБ.
+
+    :return: словарь {"legacy": [мс, ...], "event": [мс, ...]}
+    """
+    data = [i & 0xFF for i in range(data_len)]
+    result = {}
+    # прежний тракт
+    sim = itb_sim.ITBSimulator()
+    port = serial.Serial(port=sim.port, baudrate=baudrate, timeout=0.03)
+    itb = itb_serial.ITBSerial()
+    latency = []
+    for i in range(cycles):
+        time_start = time.perf_counter()
+        legacy_transaction(port, itb.data_to_send_form(cmd=0x00, data=data))
+        latency.append((time.perf_counter() - time_start) * 1000)
+    port.close()
+    sim.close()
+    result["legacy"] = latency
+    # текущий тракт
+    sim = itb_sim.ITBSimulator()
+    itb = itb_serial.ITBSerial(port=sim.port, baudrate=baudrate)
+    itb.open_port()
+    latency = []
+    for i in range(-1, cycles):  # первый запрос - прогрев (поток мог ждать открытия порта)
+        time_start = time.perf_counter()
+        itb.request(req_type="mirror", data=data)
+        itb.get_answer(timeout=1.)
+        if i >= 0:
+            latency.append((time.perf_counter() - time_start) * 1000)
+    itb._close_event.set()
+    itb.close()
+    sim.close()
+    result["event"] = latency
+    return result
+
+
+def bench_window_throughput(windows=(1, 2, 4, 8), commands=200, baudrate=9600, data_len=8):
+    """
+    Пропускная способность (команд/с) при разном размере окна неподтвержденных запросов
+    на имитаторе ИТБ с эмуляцией скорости линии.
+
+    :return: словарь {окно: [команд/с, неответы]}
+    """
+    data = [i & 0xFF for i in range(data_len)]
+    result = {}
+    for window in windows:
+        sim = itb_sim.ITBSimulator(baudrate=baudrate)
+        itb = itb_serial.ITBSerial(port=sim.port, baudrate=baudrate, window=window)
+        itb.com_queue.max_len = commands  # вся серия ставится в очередь сразу
+        itb.open_port()
+        answers = 0
+        time_start = time.perf_counter()
+        for i in range(commands):
+            itb.request(req_type="mirror", data=data)
+        while answers + itb.nansw < commands:
+            if itb.get_answer(timeout=0.01) is not None:
+                answers += 1
+        result[window] = [commands / (time.perf_counter() - time_start), itb.nansw]
+        itb._close_event.set()
+        itb.close()
+        sim.close()
+    return result
+
+
+def bench_drop_recovery(commands=200, drop=0.05, baudrate=9600):
+    """
+    Время выполнения серии команд на линии с потерей ответов при фиксированном и адаптивном таймауте.
+
+    :return: {"fixed": [команд/с, неответы], "adaptive": [команд/с, неответы, таймаут, с]}
+    """
+    result = {}
+    for name, adaptive in (("fixed", False), ("adaptive", True)):
+        sim = itb_sim.ITBSimulator(baudrate=baudrate, drop=drop)
+        itb = itb_serial.ITBSerial(port=sim.port, baudrate=baudrate, adaptive_timeout=adaptive)
+        itb.com_queue.max_len = commands  # вся серия ставится в очередь сразу
+        itb.open_port()
+        answers = 0
+        time_start = time.perf_counter()
+        for i in range(commands):
+            itb.request(req_type="mirror", data=[i & 0xFF] * 8)
+        while answers + itb.nansw < commands:
+            if itb.get_answer(timeout=0.01) is not None:
+                answers += 1
+        result[name] = [commands / (time.perf_counter() - time_start), itb.nansw,
+                        itb.rto.timeout((0x00, 8))]
+        itb._close_event.set()
+        itb.close()
+        sim.close()
+    return result
+
+
+def bench_async_requests(ports=4, requests=2000, window=4, baudrate=None):
+    """
+    Одновременные запросы через AsyncITBSerial к нескольким имитаторам ИТБ из одного потока.
+
+    :return: [запросов/с, ошибок, число потоков процесса во время теста]
+    """
+    async def run():
+        sims = [itb_sim.ITBSimulator(baudrate=baudrate) for i in range(ports)]
+        itbs = [itb_async.AsyncITBSerial(port=sim.port, window=window) for sim in sims]
+        for itb in itbs:
+            await itb.open()
+        time_start = time.perf_counter()
+        answers = await asyncio.gather(*[itbs[i % ports].request("mirror", data=[i & 0xFF] * 8)
+                                         for i in range(requests)], return_exceptions=True)
+        rate = requests / (time.perf_counter() - time_start)
+        threads = threading.active_count()
+        for itb in itbs:
+            itb.close()
+        for sim in sims:
+            sim.close()
+        return [rate, len([answer for answer in answers if isinstance(answer, Exception)]), threads]
+    return asyncio.run(run())
+
+
+def bench_port_discovery(cycles=100):
+    """
+    Время поиска порта по серийному номеру: полный опрос comports() (как прежний open_id) и индекс портов.
+
+    :return: {"comports": мс, "index": мс}
+    """
+    time_start = time.perf_counter()
+    for i in range(cycles):
+        list(serial.tools.list_ports.comports())
+    comports_time = (time.perf_counter() - time_start) / cycles * 1000
+    index = itb_ports.PortIndex()
+    index.refresh(force=True)
+    time_start = time.perf_counter()
+    for i in range(cycles):
+        index.resolve("207733835048", refresh=False)
+    index_time = (time.perf_counter() - time_start) / cycles * 1000
+    return {"comports": comports_time, "index": index_time}
+
+
+def make_channels_data(channel_num, samples=1000, seed=3):
+    # ответы на get_channel_data: КУ, температура, ток, сигнал, ноль
+    rnd = random.Random(seed)
+    answers = []
+    for i in range(samples):
+        answer = bytearray()
+        for num in range(channel_num):
+            counts = rnd.randrange(-30000, 30000)
+            answer += bytes([rnd.randrange(4), rnd.randrange(256)])
+            answer += counts.to_bytes(2, byteorder="big", signed=True)
+            answer += (counts // 2).to_bytes(2, byteorder="big", signed=True)
+            answer += (100).to_bytes(2, byteorder="big", signed=True)
+        answers.append(bytes(answer))
+    return answers
+
+
+def legacy_parc_channels_data(channels, ful_data):
+    # прежний itb_data.parc_channels_data: шесть int.from_bytes на канал, ток преобразуется дважды
+    for num, channel in enumerate(channels):
+        data = ful_data[0+num*8:8+num*8]
+        channel.data[0] = time.perf_counter()
+        channel.data[1] = channel.cal_a[data[0]]*int.from_bytes(data[2:4], signed=True, byteorder='big') + channel.cal_b[data[0]]
+        channel.data[2] = int.from_bytes(data[1:2], signed=True, byteorder='big')
+        channel.data[3] = int.from_bytes(data[2:4], signed=True, byteorder='big')
+        channel.data[4] = int.from_bytes(data[4:6], signed=True, byteorder='big')
+        channel.data[5] = int.from_bytes(data[6:8], signed=True, byteorder='big')
+        channel.data[6] = int.from_bytes(data[0:1], signed=False, byteorder='big')
+
+
+def bench_decode(channel_nums=(1, 2, 4), samples=1000, appends=100, repeat=3):
+    """
+    Скорость разбора ответов get_channel_data (ITBData.parc_channel_data, вместе с добавлением в графики;
+    samples не больше длины данных графика) и отдельно стоимость добавления appends точек в данные графика
+    канала сверх заполненного буфера.
+
+    :return: {число каналов: {"decode_samples_s": ответов/с, "graph_append_us": мкс на точку канала}}
+    """
+    result = {}
+    for channel_num in channel_nums:
+        itb = itb_data.ITBData(channel_num=channel_num)
+        itb.close()
+        answers = make_channels_data(channel_num, samples)
+        decode_time = None
+        for i in range(repeat):
+            itb.reset_channel_graph_data()
+            time_start = time.perf_counter()
+            for answer in answers:
+                itb.parc_channel_data(answer)
+            decode_time = min(decode_time or 1E9, time.perf_counter() - time_start)
+        # только разбор, без добавления в графики: прежний, по одному ответу и пакетный
+        legacy_time = min(timeit.repeat(lambda: [legacy_parc_channels_data(itb.channels, answer) for answer in answers],
+                                        number=1, repeat=repeat))
+        records = [itb_data.channel_record.unpack_from(answer, 0) for answer in answers]
+        struct_time = min(timeit.repeat(lambda: [list(itb_data.channel_record.iter_unpack(answer))
+                                                 for answer in answers], number=1, repeat=repeat))
+        batch = b"".join(answers)
+        batch_time = min(timeit.repeat(lambda: itb_data.decode_channels_data(batch, itb.channels),
+                                       number=1, repeat=repeat))
+        assert itb_data.decode_channels_data(batch, itb.channels)[0]["current"][:, 0].tolist() == \
+            [record[2] for record in records]
+        channel = itb.channels[0]
+        append_time = None
+        for i in range(repeat):
+            channel.reset_graph_data()
+            for j in range(channel.graph_data_max_len):
+                channel.create_graph_data()
+            append_time = min(append_time or 1E9, timeit.timeit(channel.create_graph_data, number=appends))
+        result[channel_num] = {"decode_samples_s": samples / decode_time,
+                               "unpack_legacy_samples_s": samples / legacy_time,
+                               "unpack_struct_samples_s": samples / struct_time,
+                               "unpack_batch_samples_s": samples / batch_time,
+                               "graph_append_us": append_time / appends * 1E6}
+    return result
+
+
+def bench_acquisition(channel_nums=(1, 2, 4), baudrates=(9600, 115200), commands=200, window=2):
+    """
+    Сквозной тест: ITBData опрашивает имитатор ИТБ командой get_channel_data.
+    Процессорное время - всего процесса, включая потоки имитатора. Задержки - по гистограмме транспорта
+    (верхняя граница интервала).
+
+    :return: {"каналов/скорость": {"cmd_s", "latency_p50_ms", "latency_p99_ms", "cpu_per_sample_us",
+              "lost"}}
+    """
+    result = {}
+    for channel_num in channel_nums:
+        for baudrate in baudrates:
+            sim = itb_sim.ITBSimulator(baudrate=baudrate, channel_num=channel_num)
+            itb = itb_data.ITBData(port=sim.port, baudrate=baudrate, channel_num=channel_num)
+            itb.serial.window = window
+            itb.serial.com_queue.max_len = commands  # вся серия ставится в очередь сразу
+            itb.serial.open_port()
+            itb.serial.request(req_type="mirror", data=[0])  # прогрев
+            while itb.serial.metrics.frames_received + itb.serial.nansw < 1:
+                time.sleep(0.001)
+            itb.serial.metrics = itb_metrics.TransportMetrics()
+            nansw = itb.serial.nansw
+            time_start, cpu_start = time.perf_counter(), time.process_time()
+            for i in range(commands):
+                # свой ключ у каждого запроса: очередь не объединяет повторные get_channel_data
+                itb.serial.com_queue.put(itb_serial.req_type_table["get_channel_data"][0], key=i)
+            while itb.serial.metrics.frames_received + itb.serial.nansw - nansw < commands:
+                time.sleep(0.001)
+            run_time, cpu_time = time.perf_counter() - time_start, time.process_time() - cpu_start
+            metrics = itb.serial.get_metrics()
+            latency = metrics["latency"].get(0x03, {"p50": 0., "p99": 0.})
+            result["%d/%d" % (channel_num, baudrate)] = {
+                "channels": channel_num,
+                "baudrate": baudrate,
+                "cmd_s": commands / run_time,
+                "latency_p50_ms": latency["p50"] * 1000,
+                "latency_p99_ms": latency["p99"] * 1000,
+                "cpu_per_sample_us": cpu_time / max(1, metrics["frames_received"]) * 1E6,
+                "lost": metrics["nansw"] - nansw}
+            itb.close()
+            sim.close()
+    return result
+
+
+def bench_dispatch(samples=1000, idle_time=1.):
+    """
+    Передача ответов от транспорта обработчикам ITBData: задержка от постановки ответа в очередь
+    до вызова обработчика и загрузка процессора при отсутствии ответов.
+
+    :return: {"latency_p50_us", "latency_p99_us", "idle_cpu_percent"}
+    """
+    sim = itb_sim.ITBSimulator()
+    itb = itb_data.ITBData(port=sim.port)
+    itb.serial.open_port()
+    latency = []
+    done = threading.Event()
+
+    def handler(data):
+        latency.append((time.perf_counter() - struct.unpack("<d", data)[0]) * 1E6)
+        done.set()
+
+    itb.register_handler(0xF0, handler)  # код, не используемый ИТБ
+    for i in range(samples):
+        done.clear()
+        itb.serial.answer_queue.put((0xF0, struct.pack("<d", time.perf_counter())))
+        done.wait(1.)
+    cpu_start = time.process_time()
+    time.sleep(idle_time)
+    idle_cpu = (time.process_time() - cpu_start) / idle_time * 100
+    itb.close()
+    sim.close()
+    latency.sort()
+    return {"latency_p50_us": latency[len(latency) // 2],
+            "latency_p99_us": latency[int(len(latency) * 0.99)],
+            "idle_cpu_percent": idle_cpu}
+
+
+def bench_store(rows=200000, channel_num=4, reads=1000, read_len=100):
+    """
+    Хранилище рядов на диске: добавление строк (все поля channel_num каналов) и чтение диапазонов времени
+    по read_len строк из разных мест истории.
+
+    :return: {"append_us", "read_us", "bytes_per_row"}
+    """
+    path = tempfile.mkdtemp(prefix="itb_store_")
+    try:
+        store = itb_store.ColumnStore(path, fields=itb_store.channels_fields(channel_num))
+        row = [0.] * len(store.fields)
+        time_start = time.perf_counter()
+        for i in range(rows):
+            row[0] = i * 0.01
+            store.append(row)
+        store.flush()
+        append_time = time.perf_counter() - time_start
+        rnd = random.Random(4)
+        starts = [rnd.randrange(rows - read_len) * 0.01 for i in range(reads)]
+        time_start = time.perf_counter()
+        for t_start in starts:
+            assert len(store.read(t_start, t_start + (read_len - 0.5) * 0.01)["time"]) == read_len
+        read_time = time.perf_counter() - time_start
+        store.close()
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    return {"append_us": append_time / rows * 1E6, "read_us": read_time / reads * 1E6, "bytes_per_row": size / rows}
+
+
+def bench_lod(samples=(10 ** 5, 10 ** 6, 5 * 10 ** 6), width=1000, queries=100):
+    """
+    Подготовка данных графика истории тока шириной width пикселей: пирамида минимумов/максимумов
+    против вывода всех точек.
+
+    :return: {число точек: {"append_us", "build_ms", "query_ms", "points", "spike_kept"}}
+    """
+    result = {}
+    for samples_num in samples:
+        times = numpy.arange(samples_num) * 0.1
+        values = numpy.sin(times / 100)
+        values[samples_num // 3] = 10.  # одиночный выброс
+        pyramid = itb_lod.MinMaxPyramid()
+        append_num = min(samples_num, 100000)
+        time_start = time.perf_counter()
+        for t, value in zip(times[:append_num].tolist(), values[:append_num].tolist()):
+            pyramid.append(t, value)
+        append_time = (time.perf_counter() - time_start) / append_num
+        pyramid.extend(times[append_num:], values[append_num:])
+        time_start = time.perf_counter()
+        pyramid.query(points=2 * width)
+        build_time = time.perf_counter() - time_start
+        rnd = random.Random(5)
+        time_start = time.perf_counter()
+        for i in range(queries):
+            t_start = rnd.uniform(0, times[-1] / 2)
+            pyramid.query(t_start, t_start + times[-1] / 2, points=2 * width)
+        query_time = (time.perf_counter() - time_start) / queries
+        lod_times, lod_values = pyramid.query(points=2 * width)
+        result[samples_num] = {"append_us": append_time * 1E6, "build_ms": build_time * 1000,
+                               "query_ms": query_time * 1000, "points": len(lod_times),
+                               "spike_kept": bool(lod_values.max() == 10.)}
+    return result
+
+
+startup_probe = """
+import sys, time
+time_start = time.perf_counter()
+import %s
+import_time = time.perf_counter() - time_start
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Linux: КБ
+except ImportError:
+    rss = -1
+print(import_time, rss, int(any(name.split(".")[0] in ("PyQt5", "matplotlib") for name in sys.modules)))
+"""
+
+
+def bench_startup(duration=2., modules=("itb_daemon", "main")):
+    """
+    Запуск сбора данных без интерфейса (itb_daemon) против интерфейса main.py: время импорта, пиковая память
+    процесса после импорта, импорт Qt/matplotlib; для itb_daemon на имитаторе - время от запуска процесса
+    до первых данных каналов и пиковая память за duration, с работы.
+
+    :return: {модуль: {"import_s", "max_rss_mb", "gui_imported"} или None (модуль не импортируется),
+              "daemon_run": {"first_data_s", "total_s", "max_rss_mb"}}
+    """
+    work_dir = os.path.dirname(os.path.abspath(__file__))
+    result = {}
+    for module in modules:
+        process = subprocess.run([sys.executable, "-c", startup_probe % module], cwd=work_dir,
+                                 stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+        if process.returncode:
+            result[module] = None
+            continue
+        import_time, rss, gui_imported = process.stdout.split()[-3:]
+        result[module] = {"import_s": float(import_time), "max_rss_mb": float(rss) / 1024 if float(rss) >= 0 else None,
+                          "gui_imported": bool(int(gui_imported))}
+    log_dir = tempfile.mkdtemp()
+    try:
+        time_start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(work_dir, "itb_daemon.py"), "--sim", "--baudrate",
+                                    "115200", "--period", "0.05", "--duration", str(duration), "--status-period", "0",
+                                    "--log-dir", log_dir], cwd=work_dir, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, universal_newlines=True)
+        first_data_time = None
+        for line in process.stdout:
+            if first_data_time is None and line.startswith("status"):
+                first_data_time = time.perf_counter() - time_start
+        process.wait()
+        total_time = time.perf_counter() - time_start
+    finally:
+        shutil.rmtree(log_dir, ignore_errors=True)
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024  # максимум по дочерним процессам
+    except ImportError:
+        rss = None
+    result["daemon_run"] = {"first_data_s": first_data_time, "total_s": total_time, "max_rss_mb": rss}
+    return result
+
+
+def print_latency(name, latency, file=None):
+    latency = sorted(latency)
+    print("%-8s mean %7.3f ms  p50 %7.3f ms  p99 %7.3f ms  max %7.3f ms" %
+          (name, statistics.mean(latency), latency[len(latency) // 2], latency[int(len(latency) * 0.99)],
+           latency[-1]), file=file)
+
+
+def json_ready(value):
+    # ключи-кортежи и числовые ключи словарей результатов в строки для json.dump
+    if isinstance(value, dict):
+        return {("/".join(str(var) for var in key) if isinstance(key, tuple) else str(key)): json_ready(var)
+                for key, var in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_ready(var) for var in value]
+    return value
+
+
+if __name__ == "__main__":
+    suites = ["latency", "window", "drop", "ports", "async", "crc", "parser", "decode", "dispatch", "store", "lod",
+              "startup", "acquisition"]
+    arg_parser = argparse.ArgumentParser(description="Бенчмарки транспорта и обработки данных ИТБ")
+    arg_parser.add_argument("--json", help="файл для результатов в формате JSON ('-' - stdout)")
+    arg_parser.add_argument("--only", nargs="+", choices=suites, default=suites, help="выполняемые тесты")
+    arg_parser.add_argument("--channels", nargs="+", type=int, default=[1, 2, 4], help="числа каналов")
+    arg_parser.add_argument("--baudrates", nargs="+", type=int, default=[9600, 115200], help="скорости линии")
+    arg_parser.add_argument("--commands", type=int, default=200, help="число команд в сквозных тестах")
+    args = arg_parser.parse_args()
+    out = sys.stderr if args.json == "-" else sys.stdout
+    results = {"time": time.time(), "python": sys.version.split()[0]}
+    if "latency" in args.only:
+        results["latency"] = bench_receive_latency()
+        for name, latency in results["latency"].items():
+            print_latency(name, latency, file=out)
+    if "window" in args.only:
+        results["window"] = bench_window_throughput(commands=args.commands)
+        for window, (rate, nansw) in results["window"].items():
+            print("window %-3d %8.1f cmd/s  lost %d" % (window, rate, nansw), file=out)
+    if "drop" in args.only:
+        results["drop"] = bench_drop_recovery(commands=args.commands)
+        for name, (rate, nansw, rto) in results["drop"].items():
+            print("drop recovery %-8s %6.1f cmd/s  lost %d  timeout %.3f s" % (name, rate, nansw, rto), file=out)
+    if "ports" in args.only:
+        results["ports"] = bench_port_discovery()
+        print("port discovery: comports %.3f ms, index %.4f ms" % tuple(results["ports"].values()), file=out)
+    if "async" in args.only:
+        results["async"] = bench_async_requests()
+        print("async %d req/s, errors %d, threads %d" % tuple(results["async"]), file=out)
+    if "crc" in args.only:
+        results["crc"] = bench_crc()
+        for name, rate in results["crc"].items():
+            print("crc %-14s %10.0f frames/s" % (name, rate), file=out)
+    if "parser" in args.only:
+        results["parser"] = bench_parser()
+        for (stream_name, chunk, parser_name), (rate, parsed, valid) in results["parser"].items():
+            print("%-9s chunk %-4d %-6s %7.3f MB/s  frames %d/%d" % (stream_name, chunk, parser_name, rate, parsed,
+                                                                     valid), file=out)
+    if "decode" in args.only:
+        results["decode"] = bench_decode(channel_nums=args.channels)
+        for channel_num, result in results["decode"].items():
+            print("decode %d ch %10.0f samples/s  unpack legacy %10.0f struct %10.0f batch %10.0f samples/s  "
+                  "graph append %.3f us" % (channel_num, result["decode_samples_s"], result["unpack_legacy_samples_s"],
+                                           result["unpack_struct_samples_s"], result["unpack_batch_samples_s"],
+                                           result["graph_append_us"]), file=out)
+    if "dispatch" in args.only:
+        results["dispatch"] = bench_dispatch()
+        print("dispatch p50 %.1f us  p99 %.1f us  idle cpu %.2f %%" % tuple(results["dispatch"].values()), file=out)
+    if "store" in args.only:
+        results["store"] = bench_store()
+        print("store append %.2f us/row  read %.1f us  %.1f bytes/row" % tuple(results["store"].values()), file=out)
+    if "lod" in args.only:
+        results["lod"] = bench_lod()
+        for samples_num, result in results["lod"].items():
+            print("lod %8d samples  append %.2f us  build %.1f ms  query %.3f ms  %d points  spike kept %s" %
+                  (samples_num, result["append_us"], result["build_ms"], result["query_ms"], result["points"],
+                   result["spike_kept"]), file=out)
+    if "startup" in args.only:
+        results["startup"] = bench_startup()
+        for module, result in results["startup"].items():
+            if module == "daemon_run":
+                print("startup daemon run: first data %s s  total %.2f s  max rss %s MB" %
+                      ("%.3f" % result["first_data_s"] if result["first_data_s"] is not None else "-", result["total_s"],
+                       "%.1f" % result["max_rss_mb"] if result["max_rss_mb"] is not None else "-"), file=out)
+            elif result is None:
+                print("startup %-10s import failed" % module, file=out)
+            else:
+                print("startup %-10s import %.3f s  max rss %s MB  Qt/matplotlib %s" %
+                      (module, result["import_s"], "%.1f" % result["max_rss_mb"] if result["max_rss_mb"] is not None
+                       else "-", result["gui_imported"]), file=out)
+    if "acquisition" in args.only:
+        results["acquisition"] = bench_acquisition(channel_nums=args.channels, baudrates=args.baudrates,
+                                                   commands=args.commands)
+        for result in results["acquisition"].values():
+            print("acquisition %d ch %6d baud %8.1f cmd/s  p50 %.3f ms  p99 %.3f ms  cpu %.1f us/sample  lost %d" %
+                  (result["channels"], result["baudrate"], result["cmd_s"], result["latency_p50_ms"],
+                   result["latency_p99_ms"], result["cpu_per_sample_us"], result["lost"]), file=out)
+    if args.json == "-":
+        json.dump(json_ready(results), sys.stdout, indent=1)
+    elif args.json:
+        with open(args.json, "w") as file:
+            json.dump(json_ready(results), file, indent=1)
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+import serial
+import itb_async
+import itb_data
+
+
+class ITBDevice:
+    """
+    ИТБ на шине: серийный номер преобразователя (порт) + адрес на линии.
+    """
+    def __init__(self, serial_number, address=1, channel_num=2, port=None):
+        self.serial_number = serial_number
+        self.address = address
+        self.port = port  # явное имя порта (если не задано - поиск по серийному номеру)
+        self.channel_num = channel_num
+        self.channels = [itb_data.ITBChannel(history_len=0) for i in range(channel_num)]
+        self.state = 0  # как ITBSerial.state
+        self.answers = 0
+        self.nansw = 0
+        self.nansw_in_row = 0  # неответы подряд
+        self.crc_errors = 0
+
+    @property
+    def key(self):
+        return self.serial_number, self.address
+
+
+class ITBBus:
+    """
+    Менеджер множества ИТБ на множестве COM-портов.
+
+    Все порты обслуживаются одним потоком с циклом asyncio (AsyncITBSerial, чтение по готовности
+    дескриптора), поэтому число потоков и загрузка процессора не растут с числом устройств.
+    На одном порту может быть несколько ИТБ с разными адресами - для них используется общий транспорт.
+    """
+    def __init__(self, **kw):
+        self.period = 1.0  # период опроса данных каналов, с
+        self.baudrate = 9600
+        self.window = 1
+        self.timeout = 0.5
+        self.reconnect_period = 2.0
+        self.max_nansw = 3  # неответов подряд, после которых порт переоткрывается
+        self.debug = False
+        for key in sorted(kw):
+            if key == "period":
+                self.period = kw.pop(key)
+            elif key == "baudrate":
+                self.baudrate = kw.pop(key)
+            elif key == "window":
+                self.window = kw.pop(key)
+            elif key == "timeout":
+                self.timeout = kw.pop(key)
+            elif key == "reconnect_period":
+                self.reconnect_period = kw.pop(key)
+            elif key == "max_nansw":
+                self.max_nansw = kw.pop(key)
+            elif key == "debug":
+                self.debug = kw.pop(key)
+            else:
+                pass
+        self.devices = {}  # {(serial_number, address): ITBDevice}
+        self.transports = {}  # {serial_number: AsyncITBSerial}
+        self.data_lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self._tasks = {}
+        self.io_thread = threading.Thread(target=self.loop.run_forever, args=(), daemon=True)
+        self.io_thread.start()
+
+    def add_device(self, serial_number, address=1, channel_num=2, port=None):
+        # повторное добавление того же (serial_number, address) заменяет устройство: прежний опрос останавливается
+        device = ITBDevice(serial_number, address=address, channel_num=channel_num, port=port)
+        with self.data_lock:
+            self.devices[device.key] = device
+        asyncio.run_coroutine_threadsafe(self._start_polling(device), self.loop).result()
+        return device
+
+    def remove_device(self, serial_number, address=1):
+        with self.data_lock:
+            device = self.devices.pop((serial_number, address), None)
+        if device:
+            asyncio.run_coroutine_threadsafe(self._stop_polling(device.key), self.loop).result()
+
+    def request(self, serial_number, address, req_type="mirror", data=None):
+        """
+        Запрос к ИТБ из любого потока.
+
+        :return: concurrent.futures.Future с данными ответа
+        """
+        async def run():
+            transport = await self._get_transport(self.devices[(serial_number, address)])
+            return await transport.request(req_type, data=data, address=address)
+        return asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+    async def _start_polling(self, device):
+        await self._stop_polling(device.key)
+        self._tasks[device.key] = self.loop.create_task(self._poll_device(device))
+
+    async def _stop_polling(self, key):
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _get_transport(self, device):
+        transport = self.transports.get(device.serial_number)
+        if transport is None:
+            transport = itb_async.AsyncITBSerial(serial_numbers=[device.serial_number], port=device.port,
+                                                 baudrate=self.baudrate, window=self.window, timeout=self.timeout,
+                                                 debug=self.debug)
+            self.transports[device.serial_number] = transport
+        if not transport.is_open:
+            if device.port:
+                await transport.open(port=device.port)
+            elif not await transport.open_id():
+                raise serial.serialutil.SerialException("Port for %s not found" % device.serial_number)
+        return transport
+
+    def _drop_transport(self, device, error):
+        # закрытие транспорта устройства: при следующем запросе порт открывается заново (в т.ч. поиском
+        # по серийному номеру - порт мог смениться); запросы других ИТБ на этом порту завершаются ITBLinkError
+        transport = self.transports.pop(device.serial_number, None)
+        if transport is not None:
+            transport.close(error=itb_async.ITBLinkError("Port %s closed: %s" % (transport.port, error)))
+
+    async def _poll_device(self, device):
+        time_next = time.perf_counter()
+        while True:
+            try:
+                transport = await self._get_transport(device)
+                data = await transport.request("get_channel_data", address=device.address)
+                if len(data) >= 8 * device.channel_num:
+                    with self.data_lock:
+                        itb_data.parc_channels_data(device.channels, data)
+                device.answers += 1
+                device.nansw_in_row = 0
+                device.state = 1
+            except asyncio.TimeoutError:
+                device.nansw += 1
+                device.nansw_in_row += 1
+                device.state = -3
+                if device.nansw_in_row >= self.max_nansw:
+                    device.nansw_in_row = 0
+                    self._drop_transport(device, "no answer")
+                    await asyncio.sleep(self.reconnect_period)
+            except itb_async.ITBCrcError:
+                device.crc_errors += 1
+                device.state = -3
+            except (serial.serialutil.SerialException, OSError, itb_async.ITBLinkError) as error:
+                device.state = -1
+                self._drop_transport(device, error)
+                await asyncio.sleep(self.reconnect_period)
+            time_next = max(time_next + self.period, time.perf_counter())
+            await asyncio.sleep(time_next - time.perf_counter())
+
+    def get_channels_data(self):
+        """
+        Сводные данные каналов всех устройств.
+
+        :return: {(serial_number, address): [channel.data (копия), ...]}
+        """
+        with self.data_lock:
+            return {key: [list(channel.data) for channel in device.channels] for key, device in self.devices.items()}
+
+    def get_state(self):
+        return {key: [device.state, device.answers, device.nansw, device.crc_errors]
+                for key, device in self.devices.items()}
+
+    def close(self):
+        async def stop():
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            for transport in self.transports.values():
+                transport.close()
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.io_thread.join()
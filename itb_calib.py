@@ -0,0 +1,255 @@
+import time
+import threading
+import numpy
+import itb_serial
+import itb_stats
+
+
+class Calibration:
+    """
+    Калибровка тока каналов ИТБ по образцовому току: I = cal_a[КУ] * ток, кв. + cal_b[КУ].
+
+    Точки (канал, КУ, образцовый ток, ток в квантах) набираются пакетами: на каждом значении образцового тока
+    после паузы settle_time и одного полного периода измерения (время измерения + мертвое время, ITBData.param)
+    набирается samples новых измерений get_channel_data, и каждое дает точку сразу для всех каналов
+    с КУ, выбранным прибором. Ответ, повторяющий предыдущее измерение (прибор еще не закончил следующее),
+    точек не дает. Коэффициенты всех пар (канал, КУ) считаются одним проходом - методом
+    наименьших квадратов по суммам, собранным numpy.bincount.
+
+    Прибор сам выбирает КУ по току, поэтому КУ, которые на данном токе не выбираются, остаются без точек.
+    При force_ku=True каждый КУ на каждом значении тока задается командой dbg_start (отладочный режим,
+    после калибровки измерения нужно перезапустить cmd_start_measure), а в расчет идут только ответы
+    с заданным КУ. Пары (канал, КУ), для которых коэффициенты не рассчитаны, возвращает missing().
+
+    Пример:
+        calibration = Calibration(itb, set_reference=source.set_current)
+        calibration.sweep([1E-9, 1E-8, 1E-7, ...], samples=20)
+        report = calibration.fit()
+        calibration.apply(file_name="ITB config/itb_1.cfg")
+    """
+    def __init__(self, itb, set_reference=None, settle_time=0.5, timeout=1., saturation=32000, measure_period=None):
+        """
+        :param itb: itb_data.ITBData с открытым портом
+        :param set_reference: функция set_reference(ток, А) установки образцового тока (None - ток выставляется
+                              вручную до вызова collect)
+        :param settle_time: пауза после установки образцового тока, с
+        :param timeout: предельное время ожидания одного ответа, с
+        :param saturation: точки с током по модулю от saturation квантов (насыщение АЦП) в расчет не входят
+        :param measure_period: период измерения прибора, с (None - по параметрам ITBData.param)
+        """
+        self.itb = itb
+        self.set_reference = set_reference
+        self.settle_time = settle_time
+        self.timeout = timeout
+        self.saturation = saturation
+        self.measure_period = measure_period
+        self.points = []  # [канал, КУ, образцовый ток, ток, кв.]
+        self.result = {}  # {(канал, КУ): {"a", "b", "count", "rms", "max_residual", "relative_rms"}}
+        self._reference = 0.
+        self._ku = None  # КУ, заданный dbg_start (None - выбор КУ прибором)
+        self._samples_left = 0
+        self._accepted = 0  # точек, принятых текущим collect
+        self._last_measure = None  # сырые данные каналов последнего нового измерения
+        self._last_measure_time = 0.
+        self._measure_period = 0.
+        self._answer = threading.Event()
+        self._lock = threading.Lock()
+
+    def get_measure_period(self):
+        if self.measure_period is not None:
+            return self.measure_period
+        return self.itb.param[0] + self.itb.param[1] / 1000
+
+    def _sink(self, channels):
+        with self._lock:
+            # те же данные раньше, чем через период измерения, - повтор прежнего измерения; позже - новое
+            # измерение с теми же кодами (например, насыщение АЦП)
+            measure = tuple([tuple(channel.data[2:7]) for channel in channels])
+            time_now = time.perf_counter()
+            new_measure = (measure != self._last_measure or
+                           time_now - self._last_measure_time >= self._measure_period)
+            if new_measure:
+                self._last_measure = measure
+                self._last_measure_time = time_now
+            if self._samples_left <= 0 or not new_measure:
+                self._answer.set()
+                return
+            for num, channel in enumerate(channels):
+                ku = int(channel.data[6])
+                if self._ku is None or ku == self._ku:
+                    self.points.append([num, ku, self._reference, channel.data[3]])
+                    self._accepted += 1
+            self._samples_left -= 1
+            self._answer.set()
+
+    def collect(self, reference, samples=20, ku=None):
+        """
+        Набор точек при установленном образцовом токе reference, А (один и тот же ток на всех каналах):
+        пауза в один период измерения (измерение, начатое до установки тока, в точки не попадает), затем
+        запросы get_channel_data, пока не набрано samples новых измерений. Повторные запросы одного
+        измерения идут не чаще, чем 4 раза за период измерения.
+
+        :param ku: КУ, задаваемый всем каналам командой dbg_start (None - КУ выбирает прибор)
+        :return: число принятых точек (по всем каналам, без отброшенных по КУ)
+        """
+        cmd = itb_serial.req_type_table["get_channel_data"][0]
+        if ku is not None:
+            for num in range(len(self.itb.channels)):
+                self.itb.cmd_dbg_start(channel=num, ku=ku, zero=0)
+        measure_period = self.get_measure_period()
+        time.sleep(measure_period)
+        with self._lock:
+            self._reference = reference
+            self._ku = ku
+            self._samples_left = samples
+            self._accepted = 0
+            self._measure_period = measure_period
+            self._last_measure = None
+        self.itb.add_sink(self._sink)
+        try:
+            time_stop = time.perf_counter() + (self.timeout + measure_period) * samples
+            i = 0
+            while self._samples_left > 0 and time.perf_counter() < time_stop:
+                with self._lock:
+                    samples_left = self._samples_left
+                    self._answer.clear()
+                # свой ключ у каждого запроса: очередь не объединяет повторные get_channel_data
+                self.itb.serial.com_queue.put(cmd, key=("calibration", i))
+                i += 1
+                self._answer.wait(self.timeout)
+                if self._samples_left == samples_left:
+                    time.sleep(measure_period / 4)
+        finally:
+            self.itb.remove_sink(self._sink)
+            with self._lock:
+                received = self._accepted
+                self._samples_left = 0
+                self._ku = None
+        return received
+
+    def sweep(self, references, samples=20, force_ku=False):
+        """
+        Набор точек по списку образцовых токов (для всех КУ - с перекрытием диапазонов по декадам).
+
+        :param force_ku: на каждом токе набрать samples измерений для каждого КУ (dbg_start)
+        :return: {образцовый ток: число принятых точек}
+        """
+        received = {}
+        for reference in references:
+            if self.set_reference is not None:
+                self.set_reference(reference)
+                time.sleep(self.settle_time)
+            if force_ku:
+                received[reference] = sum([self.collect(reference, samples=samples, ku=ku)
+                                           for ku in range(itb_stats.ku_num)])
+            else:
+                received[reference] = self.collect(reference, samples=samples)
+        return received
+
+    def fit(self):
+        """
+        Расчет коэффициентов для всех пар (канал, КУ), для которых набраны точки без насыщения минимум
+        при двух разных значениях тока в квантах.
+
+        :return: {(канал, КУ): {"a", "b", "count", "rms", "max_residual", "relative_rms"}}, невязки в А
+        """
+        if not self.points:
+            self.result = {}
+            return self.result
+        points = numpy.array(self.points, dtype=float)
+        points = points[numpy.abs(points[:, 3]) < self.saturation]
+        if not len(points):
+            self.result = {}
+            return self.result
+        channel, ku, y, x = points[:, 0].astype(int), points[:, 1].astype(int), points[:, 2], points[:, 3]
+        group = channel * itb_stats.ku_num + ku
+        groups_num = int(group.max()) + 1
+        n = numpy.bincount(group, minlength=groups_num)
+        sx = numpy.bincount(group, x, groups_num)
+        sy = numpy.bincount(group, y, groups_num)
+        sxx = numpy.bincount(group, x * x, groups_num)
+        sxy = numpy.bincount(group, x * y, groups_num)
+        det = n * sxx - sx * sx
+        valid = (n >= 2) & (det > 0)
+        a = numpy.divide(n * sxy - sx * sy, det, out=numpy.zeros(groups_num), where=valid)
+        b = numpy.divide(sy - a * sx, n, out=numpy.zeros(groups_num), where=valid)
+        residual = y - (a[group] * x + b[group])
+        rms = numpy.sqrt(numpy.divide(numpy.bincount(group, residual * residual, groups_num), n,
+                                      out=numpy.zeros(groups_num), where=n > 0))
+        max_residual = numpy.zeros(groups_num)
+        numpy.maximum.at(max_residual, group, numpy.abs(residual))
+        mean_y = numpy.divide(numpy.bincount(group, numpy.abs(y), groups_num), n, out=numpy.zeros(groups_num),
+                              where=n > 0)
+        self.result = {}
+        for num in numpy.nonzero(valid)[0]:
+            self.result[(int(num) // itb_stats.ku_num, int(num) % itb_stats.ku_num)] = {
+                "a": float(a[num]),
+                "b": float(b[num]),
+                "count": int(n[num]),
+                "rms": float(rms[num]),
+                "max_residual": float(max_residual[num]),
+                "relative_rms": float(rms[num] / mean_y[num]) if mean_y[num] else 0.}
+        return self.result
+
+    def apply(self, file_name=None):
+        """
+        Запись рассчитанных коэффициентов в каналы ITBData и, если задано, в файл конфигурации ИТБ
+        (ITBData.save_conf_to_file). Коэффициенты пар (канал, КУ) без расчета не меняются.
+        """
+        for (channel, ku), result in self.result.items():
+            if channel < len(self.itb.channels):
+                self.itb.channels[channel].cal_a[ku] = result["a"]
+                self.itb.channels[channel].cal_b[ku] = result["b"]
+        if file_name:
+            self.itb.save_conf_to_file(file_name=file_name)
+
+    def missing(self):
+        """
+        :return: список пар (канал, КУ) каналов ITBData, для которых коэффициенты не рассчитаны (нет точек
+                 или точки только при одном значении тока) - их cal_a/cal_b apply() не меняет
+        """
+        return [(channel, ku) for channel in range(len(self.itb.channels)) for ku in range(itb_stats.ku_num)
+                if (channel, ku) not in self.result]
+
+    def report(self):
+        lines = ["Канал  КУ      a           b           точек  СКО невязки, А  макс. невязка, А  СКО, %"]
+        for (channel, ku), result in sorted(self.result.items()):
+            lines.append("%5d  %-6d  %.4E  %+.3E  %5d  %.3E       %.3E         %.3f" %
+                         (channel, 10 ** ku, result["a"], result["b"], result["count"], result["rms"],
+                          result["max_residual"], result["relative_rms"] * 100))
+        missing = self.missing()
+        if missing:
+            lines.append("Без калибровки (канал, КУ): " +
+                         ", ".join(["(%d, %d)" % (channel, 10 ** ku) for channel, ku in missing]))
+        return "\n".join(lines)
+
+    def clear(self):
+        self.points = []
+        self.result = {}
+
+
+if __name__ == "__main__":
+    # калибровка на имитаторе: образцовый ток задается постоянным током всех каналов имитатора
+    import itb_data
+    import itb_sim
+    channels = [itb_sim.SimChannel(waveform="dc", noise=1E-12) for i in range(4)]
+    sim = itb_sim.ITBSimulator(channels=channels, baudrate=115200)
+    itb = itb_data.ITBData(port=sim.port, baudrate=115200, channel_num=4)
+    itb.serial.window = 2
+    itb.serial.open_port()
+
+    def set_reference(current):
+        for sim_channel in channels:
+            sim_channel.offset = current
+
+    # имитатор считает ток в момент запроса: ждать окончания измерения не нужно
+    calibration = Calibration(itb, set_reference=set_reference, settle_time=0., measure_period=0.)
+    time_start = time.perf_counter()
+    calibration.sweep([sign * mantissa * 10 ** power for power in range(-10, -1) for mantissa in (2, 5)
+                       for sign in (1, -1)], samples=20, force_ku=True)
+    calibration.fit()
+    print(calibration.report())
+    itb.cmd_start_measure(mode="stop")
+    print("Calibration time %.1f s" % (time.perf_counter() - time_start))
+    itb.close()
+    sim.close()
@@ -0,0 +1,118 @@
+import collections
+import struct
+import threading
+import time
+
+DIR_TX = 0  # ПК -> ИТБ
+DIR_RX = 1  # ИТБ -> ПК
+
+file_magic = b"ITBCAP1\n"
+file_header = struct.Struct("<dd")  # time.time() и time.monotonic() в момент создания файла
+record_header = struct.Struct("<dBH")  # time.monotonic(), направление, длина данных
+
+
+class TrafficCapture:
+    """
+    Запись обмена с ИТБ: кольцевой буфер последних max_records записей (время time.monotonic(), направление,
+    байты) и, при необходимости, потоковая запись в двоичный файл. Перевод в hex-строки выполняется только
+    при чтении записей (format_record).
+    """
+    def __init__(self, max_records=10000, file_name=None):
+        self.records = collections.deque(maxlen=max_records)
+        self.time_offset = time.time() - time.monotonic()  # для перевода времени записей в местное время
+        self.file = None
+        self.file_lock = threading.Lock()
+        self.records_num = 0
+        if file_name:
+            self.open_file(file_name)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(list(self.records))
+
+    def append(self, direction, data):
+        record = (time.monotonic(), direction, bytes(data))
+        self.records.append(record)
+        self.records_num += 1
+        if self.file:
+            with self.file_lock:
+                if self.file:
+                    self.file.write(record_header.pack(record[0], direction, len(record[2])))
+                    self.file.write(record[2])
+
+    def drain(self):
+        """
+        :return: list с записями, накопленными с прошлого вызова (буфер очищается)
+        """
+        records = []
+        while self.records:
+            try:
+                records.append(self.records.popleft())
+            except IndexError:
+                break
+        return records
+
+    def open_file(self, file_name):
+        self.close_file()
+        with self.file_lock:
+            self.file = open(file_name, "wb")
+            self.file.write(file_magic)
+            self.file.write(file_header.pack(time.time(), time.monotonic()))
+
+    def flush(self):
+        with self.file_lock:
+            if self.file:
+                self.file.flush()
+
+    def close_file(self):
+        with self.file_lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+    def format_record(self, record):
+        return format_record(record, self.time_offset)
+
+
+def format_record(record, time_offset=0.):
+    record_time = record[0] + time_offset
+    time_str = time.strftime("%H-%M-%S", time.localtime(record_time)) + (".%03d:" % ((record_time % 1) * 1000))
+    return time_str + ("TX" if record[1] == DIR_TX else "RX") + bytes_to_str(record[2])
+
+
+def bytes_to_str(data):
+    # тот же вид, что у itb_serial.bytes_array_to_str: пробел перед каждой парой байт
+    hex_str = data.hex().upper()
+    return "".join([" " + hex_str[i:i + 4] for i in range(0, len(hex_str), 4)])
+
+
+def read_capture(file_name):
+    """
+    Чтение файла записи обмена.
+
+    :return: генератор записей (time.monotonic(), направление, bytes); смещение для перевода в местное время -
+             в атрибуте time_offset генератора недоступно, см. read_capture_time_offset()
+    """
+    with open(file_name, "rb") as file:
+        if file.read(len(file_magic)) != file_magic:
+            raise ValueError("%s is not ITB capture file" % file_name)
+        file.read(file_header.size)
+        while True:
+            header = file.read(record_header.size)
+            if len(header) < record_header.size:
+                return
+            record_time, direction, data_len = record_header.unpack(header)
+            data = file.read(data_len)
+            if len(data) < data_len:
+                return
+            yield record_time, direction, data
+
+
+def read_capture_time_offset(file_name):
+    with open(file_name, "rb") as file:
+        if file.read(len(file_magic)) != file_magic:
+            raise ValueError("%s is not ITB capture file" % file_name)
+        wall_time, monotonic_time = file_header.unpack(file.read(file_header.size))
+    return wall_time - monotonic_time
@@ -0,0 +1,203 @@
+import sys
+import os
+import time
+import argparse
+import configparser
+import threading
+import itb_data
+import itb_events
+import itb_store
+
+# Сбор данных ИТБ без графического интерфейса (испытательные стенды): не импортирует PyQt5 и matplotlib.
+#
+# python itb_daemon.py --cfg "ITB config/itb_1.cfg" --serial 207733835048 --period 1 --log-dir Logs
+# python itb_daemon.py --sim --period 0.1 --duration 10 --store itb_store
+
+
+class LogFileSink:
+    """
+    Запись данных в лог-файл .csv в формате лога main.py (ITBData.get_log_file_title/get_log_file_data).
+    Подключается подпиской на EVENT_CHANNELS с доставкой в пуле потоков: запись на диск не задерживает разбор.
+    """
+    def __init__(self, itb, dir_name="Logs", prefix="ИТБ", extension=".csv"):
+        self.itb = itb
+        sub_dir_name = os.path.join(dir_name, time.strftime("%Y_%m_%d", time.localtime()) + " Лог",
+                                    time.strftime("%Y_%m_%d %H-%M-%S ", time.localtime()) + "Лог")
+        os.makedirs(sub_dir_name, exist_ok=True)
+        self.file_name = os.path.join(sub_dir_name, time.strftime("%Y_%m_%d %H-%M-%S ", time.localtime()) +
+                                      prefix + " " + extension)
+        self.file = open(self.file_name, "a")
+        self.file.write(itb.get_log_file_title() + "\n")
+        self.lines = 0
+
+    def __call__(self, event):
+        self.file.write(self.itb.get_log_file_data(event.data) + "\n")
+        self.lines += 1
+
+    def close(self):
+        try:
+            self.file.close()
+        except OSError as error:
+            print(error)
+
+
+class Daemon:
+    """
+    Циклические измерения: запуск режима "cycle" прибора и чтение данных каналов с периодом period, с;
+    данные - в приемники (лог .csv, хранилище itb_store), состояние - в stdout каждые status_period, с.
+    Если данных нет дольше reconnect_timeout, с, порт переоткрывается (попытки - не чаще reconnect_period, с),
+    и после подключения режим "cycle" запускается заново.
+    """
+    def __init__(self, itb, period=1., status_period=5., duration=None, reconnect_timeout=None, reconnect_period=2.,
+                 out=sys.stdout):
+        self.itb = itb
+        self.period = period
+        self.status_period = status_period
+        self.duration = duration
+        self.reconnect_timeout = reconnect_timeout if reconnect_timeout is not None else max(3 * period, 3.)
+        self.reconnect_period = reconnect_period
+        self.out = out
+        self.time_start = time.perf_counter()
+        self.time_last_data = self.time_start
+        self.first_data_time = None
+        self.frames = 0
+        self.reconnects = 0
+        self._stop_event = threading.Event()
+        self.itb.subscribe([itb_events.EVENT_CHANNELS], self._count)
+        self.itb.subscribe([itb_events.EVENT_LINK], self._link)
+
+    def _count(self, event):
+        self.frames += 1
+        self.time_last_data = event.time
+        if self.first_data_time is None:
+            self.first_data_time = event.time - self.time_start
+            self.status()
+
+    def _link(self, event):
+        print("link: %s" % self.itb.serial.state_string.get(event.data, event.data), file=self.out, flush=True)
+
+    def status(self):
+        snapshot = self.itb.get_snapshot()
+        currents = " ".join(["K%d %.3E A" % (num, channel[1]) for num, channel in enumerate(snapshot.channels)])
+        print("status t=%.1f s  link=%d  frames=%d  lost=%d  %s" %
+              (time.perf_counter() - self.time_start, self.itb.serial.state, self.frames,
+               sum(self.itb.serial.lost_answers.values()), currents), file=self.out, flush=True)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def reconnect(self):
+        self.reconnects += 1
+        print("reconnect: attempt %d, no data %.1f s" % (self.reconnects, time.perf_counter() - self.time_last_data),
+              file=self.out, flush=True)
+        if self.itb.serial.reconnect():
+            print("reconnect: %s opened" % self.itb.serial.port, file=self.out, flush=True)
+            self.itb.cmd_start_measure(mode="cycle")
+            # новый отсчет ожидания данных от момента подключения
+            self.time_last_data = time.perf_counter()
+            return True
+        print("reconnect: failed", file=self.out, flush=True)
+        return False
+
+    def run(self):
+        self.itb.cmd_start_measure(mode="cycle")
+        time_next_read = time.perf_counter()
+        time_next_status = time_next_read + (self.status_period or 0.)
+        time_next_reconnect = time_next_read
+        try:
+            while not self._stop_event.is_set():
+                time_now = time.perf_counter()
+                if self.duration is not None and time_now - self.time_start >= self.duration:
+                    break
+                if time_now >= time_next_read:
+                    self.itb.cmd_read_chan_data()
+                    time_next_read += self.period
+                if time_now - self.time_last_data >= self.reconnect_timeout and time_now >= time_next_reconnect:
+                    self.reconnect()
+                    time_next_reconnect = time.perf_counter() + self.reconnect_period
+                if self.status_period and time_now >= time_next_status:
+                    self.status()
+                    time_next_status += self.status_period
+                self._stop_event.wait(max(0., min(time_next_read, time_next_status if self.status_period
+                                                  else time_next_read) - time.perf_counter()))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.itb.cmd_start_measure(mode="stop")
+            time.sleep(min(0.2, self.period))
+            self.status()
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Сбор данных ИТБ без графического интерфейса")
+    arg_parser.add_argument("--cfg", help="файл конфигурации ИТБ (.cfg)")
+    link = arg_parser.add_mutually_exclusive_group(required=True)
+    link.add_argument("--serial", nargs="+", help="серийные номера адаптера")
+    link.add_argument("--port", help="имя порта (без поиска по серийному номеру)")
+    link.add_argument("--sim", action="store_true", help="работа с имитатором ИТБ")
+    arg_parser.add_argument("--baudrate", type=int, default=9600, help="скорость линии")
+    arg_parser.add_argument("--channels", type=int, default=2, help="число каналов")
+    arg_parser.add_argument("--period", type=float, default=1., help="период чтения данных каналов, с")
+    arg_parser.add_argument("--adc-period", type=float, help="период опроса АЦП, с")
+    arg_parser.add_argument("--duration", type=float, help="длительность работы, с (без ограничения - до Ctrl+C)")
+    arg_parser.add_argument("--status-period", type=float, default=5., help="период вывода состояния, с (0 - нет)")
+    arg_parser.add_argument("--reconnect-timeout", type=float,
+                            help="время без данных до переоткрытия порта, с (по умолчанию - 3 периода, не меньше 3 с)")
+    arg_parser.add_argument("--reconnect-period", type=float, default=2., help="период попыток переоткрытия порта, с")
+    arg_parser.add_argument("--log-dir", default="Logs", help="каталог лог-файлов .csv ('' - без лога)")
+    arg_parser.add_argument("--store", help="каталог хранилища itb_store")
+    args = arg_parser.parse_args(argv)
+    config = None
+    if args.cfg:
+        # ITBData.load_conf_from_file не используется: она создает каталог "ITB config" по пути для Windows
+        config = configparser.ConfigParser()
+        if not config.read(args.cfg):
+            arg_parser.error("файл конфигурации не найден: %s" % args.cfg)
+
+    sim = None
+    if args.sim:
+        import itb_sim
+        sim = itb_sim.ITBSimulator(channel_num=args.channels, baudrate=args.baudrate)
+        itb = itb_data.ITBData(port=sim.port, baudrate=args.baudrate, channel_num=args.channels,
+                               adc_period=args.adc_period, history_len=0)
+    else:
+        itb = itb_data.ITBData(serial_numbers=args.serial or [], port=args.port or "COM0",
+                               baudrate=args.baudrate, channel_num=args.channels, adc_period=args.adc_period,
+                               history_len=0)
+    if config is not None:
+        itb.set_cfg(config)
+    sinks = []
+    if args.log_dir:
+        log_sink = LogFileSink(itb, dir_name=args.log_dir)
+        itb.subscribe([itb_events.EVENT_CHANNELS], log_sink, delivery=itb_events.DELIVERY_THREAD, max_len=1000)
+        sinks.append(log_sink)
+        print("log: %s" % log_sink.file_name, flush=True)
+    if args.store:
+        store_sink = itb_store.StoreSink(itb_store.ColumnStore(args.store,
+                                                              fields=itb_store.channels_fields(args.channels)))
+        itb.add_sink(store_sink)
+        sinks.append(store_sink)
+    daemon = Daemon(itb, period=args.period, status_period=args.status_period, duration=args.duration,
+                    reconnect_timeout=args.reconnect_timeout, reconnect_period=args.reconnect_period)
+    if sim or args.port:
+        opened = itb.serial.open_port()
+    else:
+        opened = itb.serial.open_id()
+    if opened:
+        daemon.run()
+    else:
+        # без связи при запуске не работаем: стенд должен увидеть ошибку, а не пустой лог
+        print("link: failed to open %s" % (args.port or sim and sim.port or ", ".join(args.serial)), file=sys.stderr,
+              flush=True)
+    itb.close()
+    for sink in sinks:
+        sink.close()
+    if sim:
+        sim.close()
+    if daemon.first_data_time is not None:
+        print("first data %.3f s" % daemon.first_data_time, flush=True)
+    return 0 if opened else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
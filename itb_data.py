@@ -1,11 +1,17 @@
 import time
+import struct
+import collections
 import numpy
-import copy
 from ctypes import c_int8, c_int16
 import threading
 import configparser
 import os
 import itb_serial
+import itb_scheduler
+import itb_events
+import itb_ring
+import itb_lod
+import itb_stats
 
 
 class ITBData:
@@ -15,7 +21,13 @@ class ITBData:
         self.fabrication_number = 0
         self.address = 1
         self.channel_num = 2  # максимум 4
+        self.graph_data_max_len = 1000  # число точек графиков каналов
+        self.history_len = 2 ** 18  # число точек истории тока каналов для графика с прореживанием (0 - без истории)
+        self.stats_windows = [60.]  # длины скользящих окон статистики тока, с
+        self.adc_history_len = 1000  # число точек истории данных АЦП
+        self.adc_period = None  # период фонового опроса АЦП, с (None - без опроса)
         self.baudrate = 9600
+        self.port = "COM0"
         self.serial_numbers = []
         self.debug = []
         self.crc_check = []
@@ -34,30 +46,65 @@ class ITBData:
                 self.crc_check = kw.pop(key)
             elif key == "channel_num":
                 self.channel_num = kw.pop(key)
+            elif key == "graph_data_max_len":
+                self.graph_data_max_len = kw.pop(key)
+            elif key == "history_len":
+                self.history_len = kw.pop(key)
+            elif key == "stats_windows":
+                self.stats_windows = kw.pop(key)
+            elif key == "adc_history_len":
+                self.adc_history_len = kw.pop(key)
+            elif key == "adc_period":
+                self.adc_period = kw.pop(key)
             else:
                 pass
         # интерфейс работы с ITB - virtual com port
         self.serial = itb_serial.ITBSerial(baudrate=self.baudrate, serial_numbers=self.serial_numbers, debug=self.debug,
-                                           crc=self.crc_check)
+                                           crc=self.crc_check, port=self.port)
         # заготовка для хранения данных прибора
         self.data_name = ["Время, с", "Напряжение, В", "Потребление, мА", "Температура МК, °С", "U подложки, В"]
         self.data = [0 for i in range(len(self.data_name))]
         self.adc_data = [0 for i in range(16)]
+        # пересчет данных АЦП в data[1:]: data[n + 1] = adc_a[n] * adc_data[adc_index[n]] + adc_b[n];
+        # коэффициенты задаются для каждого прибора в файле конфигурации, по умолчанию - коды АЦП без пересчета
+        self.adc_cfg_names = ["voltage", "consumption", "mcu temperature", "substrate voltage"]  # секции файла конфигурации
+        self.adc_index = numpy.arange(len(self.data_name) - 1)
+        self.adc_a = numpy.ones(len(self.data_name) - 1)
+        self.adc_b = numpy.zeros(len(self.data_name) - 1)
+        self.adc_history = itb_ring.RingBuffer(len(self.data_name), self.adc_history_len)
         # заготовка для хранения и отображения параметров работы прибора
         self.param_name = ["Время измерения, с", "Мертове время, мс"]
         self.param_default = [1.0, 100]  # следить за значениями по умолчанию!
         self.param = self.param_default
         # данные для графиков
-        self.graph_data_max_len = 1000
         self.graph_data = [[], [], []]
         # каналы
-        self.channels = [ITBChannel() for i in range(self.channel_num)]
+        self.channels = [ITBChannel(graph_data_max_len=self.graph_data_max_len, history_len=self.history_len)
+                         for i in range(self.channel_num)]
+        # обработчики ответов по кодам команд
+        self.handlers = {}
+        self.register_handler(0x01, self.parc_adc_data)  # получение данных АЦП
+        self.register_handler(0x03, self.parc_channel_data)  # получение данных измерений по каналам
+        self.register_handler(0x06, self.parc_itb_parameters)  # получение параметров измерения
+        # статистика тока каналов по КУ
+        self.stats = [itb_stats.ChannelStats(windows=self.stats_windows) for i in range(self.channel_num)]
+        # события: разобранные ответы (EVENT_CHANNELS, EVENT_ADC, EVENT_PARAMS) и состояние связи (EVENT_LINK)
+        self.events = itb_events.EventBus()
+        self.serial.state_callbacks.append(lambda state: self.events.publish(itb_events.EVENT_LINK, state))
+        # приемники данных каналов: {sink(channels): подписка на EVENT_CHANNELS}
+        self.sinks = {}
+        # снимок данных для чтения из других потоков: публикуется потоком разбора после каждого ответа
+        self.snapshot = None
+        self._publish(channels_updated=False)
         #
-        self._close_event = threading.Event()
         self.parc_thread = threading.Thread(target=self.parc_data, args=(), daemon=True)
         self.data_lock = threading.Lock()
         # инициализация
         self.parc_thread.start()
+        self.adc_thread = None
+        self._adc_stop_event = threading.Event()
+        if self.adc_period:
+            self.start_adc_polling(self.adc_period)
         pass
 
     def save_conf_to_file(self, file_name="itb_default.cfg"):
@@ -91,8 +138,22 @@ class ITBData:
     def get_cfg(self, config):
         for j in range(self.channel_num):
             for i in range(4):
-                config["Channel %d: current calibration KU = %d" % (j, 10**i)] = {"a": "%.3E" % self.channels[j].cal_a[i],
-                                                                         "b": "%.3E" % self.channels[j].cal_b[i]}
+                config["Channel %d: current calibration KU = %d" % (j, 10**i)] = {"a": "%.9E" % self.channels[j].cal_a[i],
+                                                                         "b": "%.9E" % self.channels[j].cal_b[i]}
+        for j in range(self.channel_num):
+            for i in range(4):
+                section = "Channel %d: temperature calibration KU = %d" % (j, 10**i)
+                if i in self.channels[j].temp_grid:
+                    temps, gain, offset = self.channels[j].temp_grid[i]
+                    config[section] = {"t": ", ".join(["%.1f" % var for var in temps]),
+                                       "a": ", ".join(["%.6E" % var for var in gain]),
+                                       "b": ", ".join(["%.6E" % var for var in offset])}
+                elif section in config:
+                    config.remove_section(section)
+        for num, name in enumerate(self.adc_cfg_names):
+            config["ADC calibration: %s" % name] = {"adc": "%d" % self.adc_index[num],
+                                                    "a": "%.6E" % self.adc_a[num],
+                                                    "b": "%.6E" % self.adc_b[num]}
         config["General parameters"] = {"fabrication number": "%s" % self.fabrication_number,
                                         "address": "%d" % self.address}
         return config
@@ -103,6 +164,20 @@ class ITBData:
                 for i in range(4):
                     self.channels[j].cal_a[i] = float(config["Channel %d: current calibration KU = %d" % (j, 10**i)]["a"])
                     self.channels[j].cal_b[i] = float(config["Channel %d: current calibration KU = %d" % (j, 10**i)]["b"])
+            for j in range(self.channel_num):
+                for i in range(4):
+                    section = "Channel %d: temperature calibration KU = %d" % (j, 10**i)
+                    if section in config:
+                        self.channels[j].set_temp_calibration(i, *[[float(var) for var in config[section][key].split(",")]
+                                                                   for key in ("t", "a", "b")])
+                    else:
+                        self.channels[j].clear_temp_calibration(i)
+            for num, name in enumerate(self.adc_cfg_names):
+                section = "ADC calibration: %s" % name
+                if section in config:
+                    self.adc_index[num] = int(config[section]["adc"])
+                    self.adc_a[num] = float(config[section]["a"])
+                    self.adc_b[num] = float(config[section]["b"])
             self.fabrication_number = config["General parameters"]["fabrication number"]
             self.address = int(config["General parameters"]["address"])
         except KeyError as error:
@@ -112,6 +187,29 @@ class ITBData:
     def cmd_get_adc_data(self):
         self.serial.request(req_type="get_adc")
 
+    def start_adc_polling(self, period=1.):
+        """
+        Фоновый опрос АЦП (get_adc) с периодом period, с. Запросы ставятся в очередь с наименьшим приоритетом
+        и отправляются только при отсутствии других команд, не более одного запроса в очереди - опрос
+        не задерживает чтение данных каналов.
+        """
+        self.stop_adc_polling()
+        self.adc_period = period
+        self._adc_stop_event.clear()
+        self.adc_thread = threading.Thread(target=self.adc_polling, args=(), daemon=True)
+        self.adc_thread.start()
+
+    def stop_adc_polling(self):
+        self._adc_stop_event.set()
+        if self.adc_thread is not None:
+            self.adc_thread.join()
+            self.adc_thread = None
+
+    def adc_polling(self):
+        cmd = itb_serial.req_type_table["get_adc"][0]
+        while not self._adc_stop_event.wait(self.adc_period):
+            self.serial.com_queue.put(cmd, priority=itb_scheduler.PRIORITY_BACKGROUND)
+
     def cmd_start_measure(self, mode="stop"):
         if mode in "stop":
             self.serial.request(req_type="measure_mode", data=[0x00])
@@ -146,49 +244,120 @@ class ITBData:
     def cmd_dbg_start(self, channel=0, ku=0, zero=0):
         self.serial.request(req_type="dbg_start", data=[channel, ku, zero])
 
+    def register_handler(self, cmd, handler):
+        """
+        Назначение обработчика ответов на команду. Обработчик вызывается из потока разбора с данными ответа
+        (bytes) и не должен надолго блокироваться.
+
+        :param cmd: код команды
+        :param handler: функция handler(data) или None для отключения обработки
+        """
+        if handler is None:
+            self.handlers.pop(cmd, None)
+        else:
+            self.handlers[cmd] = handler
+
     def parc_data(self):
+        # поток спит в очереди ответов транспорта до прихода ответа или признака завершения (None)
         while True:
-            time.sleep(0.01)
-            data = []
-            with self.serial.ans_data_lock:
-                if self.serial.answer_data:
-                    data = copy.deepcopy(self.serial.answer_data)
-                    self.serial.answer_data = []
-            for var in data:
-                if var[0] == 0x01:  # получение данных АЦП
-                    for i in range(len(var[1]) // 2):
-                        with self.data_lock:
-                            self.adc_data[i] = int.from_bytes(var[1][2*i:2*i+2], signed=False, byteorder='big')
-                    self.parc_adc_data()
-                elif var[0] == 0x03:  # получение данных измерений по каналам
-                    self.parc_channel_data(var[1])
-                elif var[0] == 0x06:  # получение параметров измерения
-                    self.parc_itb_parameters(var[1])
-            if self._close_event.is_set() is True:
-                self._close_event.clear()
+            answer = self.serial.get_answer()
+            if answer is None:
                 return
-        pass
-
-    def parc_adc_data(self):
-        # todo
-        pass
+            handler = self.handlers.get(answer[0])
+            if handler is None:
+                continue
+            try:
+                handler(answer[1])
+            except (IndexError, ValueError, KeyError) as error:
+                print("Answer <0x%02X> parcing error:" % answer[0], error)
+
+    def close(self):
+        self.stop_adc_polling()
+        self.serial.answer_queue.put(None)
+        # поток обмена останавливается до закрытия порта: последние принятые байты успевают попасть в запись обмена,
+        # файл которой закрывает close_id
+        self.serial._close_event.set()
+        self.serial.read_write_thread.join(1.)
+        self.serial.close_id()
+        self.events.close()
+
+    def parc_adc_data(self, data):
+        adc_data = numpy.frombuffer(data, dtype=adc_record_dtype, count=min(16, len(data) // 2))
+        values = self.adc_a * adc_data[self.adc_index] + self.adc_b
+        time_now = time.perf_counter()
+        with self.data_lock:
+            self.adc_data = adc_data.tolist()
+            self.data = [time_now] + values.tolist()
+            self.adc_history.append(self.data)
+        self._publish(channels_updated=False)
+        self.events.publish(itb_events.EVENT_ADC, self.snapshot)
+
+    def _publish(self, channels_updated=True):
+        # новый снимок собирается целиком и заменяет предыдущий одним присваиванием ссылки:
+        # читатель без блокировок получает либо старый, либо новый снимок, но не их смесь
+        previous = self.snapshot
+        generation = previous.generation + 1 if previous else 0
+        channels_generation = previous.channels_generation if previous else 0
+        if channels_updated:
+            channels_generation = generation
+            channels = tuple(tuple(channel.data) for channel in self.channels)
+        else:
+            channels = previous.channels if previous else tuple(tuple(channel.data) for channel in self.channels)
+        self.snapshot = ITBSnapshot(generation, channels_generation, time.perf_counter(), tuple(self.data),
+                                    tuple(self.adc_data), tuple(self.param), channels)
+
+    def get_snapshot(self):
+        """
+        Согласованные данные прибора и всех каналов на момент последнего разобранного ответа (O(1), без блокировок).
+        Снимок не меняется; generation растет с каждым ответом, channels_generation - с каждым ответом
+        get_channel_data, поэтому сравнение с generation прошлого снимка показывает, есть ли новые данные.
+
+        :return: ITBSnapshot
+        """
+        return self.snapshot
+
+    def get_adc_history(self, n=None):
+        """
+        :param n: число последних точек (None - вся история)
+        :return: [[название, numpy.ndarray], ...] по полям data_name (копии данных)
+        """
+        with self.data_lock:
+            history = self.adc_history.view(n=n).copy()
+        return [[name, history[num]] for num, name in enumerate(self.data_name)]
+
+    def subscribe(self, event_types, callback, delivery=itb_events.DELIVERY_SYNC, max_len=100):
+        """
+        Подписка на события ITBData (itb_events.EVENT_*), см. itb_events.EventBus.subscribe.
+
+        :return: itb_events.Subscription (отписка - subscription.cancel())
+        """
+        return self.events.subscribe(event_types, callback, delivery=delivery, max_len=max_len)
+
+    def add_sink(self, sink):
+        """
+        :param sink: функция sink(channels) (например, itb_store.StoreSink); вызывается из потока разбора
+                     после обновления данных каналов и не должна надолго блокироваться
+        """
+        self.remove_sink(sink)
+        self.sinks[sink] = self.subscribe([itb_events.EVENT_CHANNELS], lambda event: sink(self.channels))
+
+    def remove_sink(self, sink):
+        subscription = self.sinks.pop(sink, None)
+        if subscription is not None:
+            subscription.cancel()
 
     def parc_channel_data(self, ful_data):
-        for num, channel in enumerate(self.channels):
-            data = ful_data[0+num*8:8+num*8]
-            channel.data[0] = time.perf_counter()
-            channel.data[1] = channel.cal_a[data[0]]*int.from_bytes(data[2:4], signed=True, byteorder='big') + channel.cal_b[data[0]]
-            channel.data[2] = int.from_bytes(data[1:2], signed=True, byteorder='big')  # Temperature
-            channel.data[3] = int.from_bytes(data[2:4], signed=True, byteorder='big')
-            channel.data[4] = int.from_bytes(data[4:6], signed=True, byteorder='big')
-            channel.data[5] = int.from_bytes(data[6:8], signed=True, byteorder='big')
-            channel.data[6] = int.from_bytes(data[0:1], signed=False, byteorder='big')  # КУ
-            # не забываем сделать данные для графиков
-            channel.create_graph_data()
+        parc_channels_data(self.channels, ful_data)
+        for channel, stats in zip(self.channels, self.stats):
+            stats.add(channel.data[0], channel.data[6], channel.data[1])
+        self._publish()
+        self.events.publish(itb_events.EVENT_CHANNELS, self.snapshot)
 
     def parc_itb_parameters(self, data):
         self.param[0] = int.from_bytes(data[0:4], signed=False, byteorder='big') / 1000  # время измерения
         self.param[1] = int.from_bytes(data[4:8], signed=False, byteorder='big')  # мертвое измерения
+        self._publish(channels_updated=False)
+        self.events.publish(itb_events.EVENT_PARAMS, self.snapshot)
 
     def create_graph_data(self):
         # добавляем данные
@@ -202,10 +371,10 @@ class ITBData:
                     break
         pass
 
-    def get_channels_graph_data(self):
+    def get_channels_graph_data(self, points=None, t_start=None, t_stop=None):
         graph_data = []
         for num, channel in enumerate(self.channels):
-            ch_gr_data = channel.get_current_graph_data()
+            ch_gr_data = channel.get_current_graph_data(points=points, t_start=t_start, t_stop=t_stop)
             ch_gr_data[1][0] = ("K%d:" % num) + ch_gr_data[1][0]
             graph_data.append(ch_gr_data)
         return graph_data
@@ -225,10 +394,11 @@ class ITBData:
             name_str += ";".join([(("К%d: " % num) + name) for name in channel.data_name]) + ";"
         return name_str
 
-    def get_log_file_data(self):
-        name_str = ";".join([("%.2g" % var) for var in self.data]) + ";"
-        for num, channel in enumerate(self.channels):
-            chan_list = [("%.3g" % var) for var in channel.data]
+    def get_log_file_data(self, snapshot=None):
+        snapshot = self.snapshot if snapshot is None else snapshot
+        name_str = ";".join([("%.2g" % var) for var in snapshot.data]) + ";"
+        for num, channel_data in enumerate(snapshot.channels):
+            chan_list = [("%.3g" % var) for var in channel_data]
             name_str += ";".join(chan_list) + ";"
         return name_str
 
@@ -236,16 +406,41 @@ class ITBData:
         self.graph_data = [[] for i in range(len(self.data_name))]
         pass
 
+    def get_stats_snapshot(self):
+        """
+        Статистика тока (среднее, СКО, минимум, максимум, число точек) по каналам и КУ.
+
+        :return: list по каналам: {КУ: {"run": {...}, "window": {длина окна, с: {...}}}}
+        """
+        time_now = time.perf_counter()
+        return [stats.snapshot(time_now) for stats in self.stats]
+
+    def reset_stats(self):
+        for stats in self.stats:
+            stats.reset()
+
     def reset_channel_graph_data(self):
         for channel in self.channels:
             channel.reset_graph_data()
         pass
 
 
+# неизменяемый снимок данных ITBData: data - данные прибора (data_name), adc_data - коды АЦП, param - параметры
+# измерения, channels - данные каналов (ITBChannel.data_name) по каналам
+ITBSnapshot = collections.namedtuple("ITBSnapshot", ["generation", "channels_generation", "time", "data", "adc_data",
+                                                     "param", "channels"])
+
+
 class ITBChannel:
-    def __init__(self):
-        self.cal_a = [1., 1., 1., 1.]
-        self.cal_b = [0., 0., 0., 0.]
+    def __init__(self, graph_data_max_len=1000, history_len=2 ** 18):
+        self.cal_a = numpy.array([1., 1., 1., 1.])  # калибровка тока по КУ: I = cal_a[КУ] * ток, кв. + cal_b[КУ]
+        self.cal_b = numpy.array([0., 0., 0., 0.])
+        # температурная поправка калибровки: I = cal_a[КУ] * temp_gain[T, КУ] * ток, кв. + cal_b[КУ] + temp_offset[T, КУ],
+        # таблицы на все значения байта температуры (индекс - байт температуры как uint8)
+        self.temp_grid = {}  # {КУ: (температуры, °С, множители cal_a, добавки к cal_b, А)}
+        self.temp_gain = numpy.ones((256, 4))
+        self.temp_offset = numpy.zeros((256, 4))
+        self.temp_compensation = False
         self.current = 1E-8
         self.adc_measure = 1E-8
         self.adc_signal = 1E-8
@@ -253,26 +448,75 @@ class ITBChannel:
         # заготовка для хранения данных измерительных каналов
         self.data_name = ["Время, с", "I, А", "Т,°С", "Ток,кв.", "Сигнал,кв.", "Ноль,кв.", "КУ"]
         self.data = [0. for i in range(len(self.data_name))]
-        # данные графика
-        self.graph_data_max_len = 1000
-        self.graph_data = [[] for i in range(len(self.data_name))]
+        # данные графика: кольцевые буферы последних точек по всем полям data, первый - для отрисовки
+        self.graph_data_max_len = graph_data_max_len
+        self.graph_buffers = [itb_ring.RingBuffer(len(self.data_name), self.graph_data_max_len)]
+        # последние history_len точек тока для отрисовки с прореживанием (None - без истории)
+        self.history = itb_lod.MinMaxPyramid(max_len=history_len) if history_len else None
         self.graph_need_to_redraw = 0
 
+    def set_temp_calibration(self, ku, temps, gain, offset):
+        """
+        Температурная поправка калибровки для КУ по узлам: между узлами - линейная интерполяция, за крайними
+        узлами - значения крайних узлов. Таблица поправок на все температуры рассчитывается здесь, при разборе
+        ответов выполняется только выборка из нее.
+
+        :param ku: индекс КУ (0..3)
+        :param temps: температуры узлов, °С (по возрастанию)
+        :param gain: множители cal_a[ku] в узлах
+        :param offset: добавки к cal_b[ku] в узлах, А
+        """
+        temps, gain, offset = (numpy.array(var, dtype=float) for var in (temps, gain, offset))
+        if not (len(temps) == len(gain) == len(offset) > 0):
+            raise ValueError("Temperature calibration nodes must have equal non-zero length")
+        order = numpy.argsort(temps)
+        self.temp_grid[ku] = (temps[order], gain[order], offset[order])
+        table_temps = numpy.arange(256).astype(numpy.uint8).view(numpy.int8).astype(float)
+        self.temp_gain[:, ku] = numpy.interp(table_temps, *self.temp_grid[ku][0:2])
+        self.temp_offset[:, ku] = numpy.interp(table_temps, self.temp_grid[ku][0], self.temp_grid[ku][2])
+        self.temp_compensation = True
+
+    def clear_temp_calibration(self, ku=None):
+        for num in (range(4) if ku is None else [ku]):
+            self.temp_grid.pop(num, None)
+            self.temp_gain[:, num] = 1.
+            self.temp_offset[:, num] = 0.
+        self.temp_compensation = bool(self.temp_grid)
+
+    @property
+    def graph_data(self):
+        # срезы без копирования: graph_data[номер поля] - последние точки поля
+        return self.graph_buffers[0].view()
+
+    def add_graph_buffer(self, capacity):
+        """
+        Дополнительный буфер данных графика другой длины (например, длинная история рядом с оперативным графиком).
+
+        :return: itb_ring.RingBuffer
+        """
+        graph_buffer = itb_ring.RingBuffer(len(self.data_name), capacity)
+        self.graph_buffers.append(graph_buffer)
+        return graph_buffer
+
     def create_graph_data(self):
-        # добавляем данные
+        # добавляем данные: длина буферов фиксирована, старые точки затираются
         self.graph_need_to_redraw = 1
-        for num, var in enumerate(self.graph_data):
-            var.append(float(self.data[num]))
-            # ограничивываем длину данных для отрисовки
-            while 1:
-                if len(var) > self.graph_data_max_len:
-                    var = var[1:]
-                else:
-                    break
-        pass
-
-    def get_current_graph_data(self):
-        return [self.data_name[0], self.graph_data[0]], [self.data_name[1], self.graph_data[1]]
+        for graph_buffer in self.graph_buffers:
+            graph_buffer.append(self.data)
+        if self.history is not None:
+            self.history.append(self.data[0], self.data[1])
+
+    def get_current_graph_data(self, buffer_num=0, points=None, t_start=None, t_stop=None):
+        """
+        :param buffer_num: номер буфера графика (последние точки)
+        :param points: если задано - данные истории тока (или диапазона t_start - t_stop) с прореживанием
+                       по минимуму/максимуму до не более points точек (для N пикселей по ширине - 2 * N)
+        """
+        if points and self.history is not None:
+            times, currents = self.history.query(t_start, t_stop, points)
+            return [self.data_name[0], times], [self.data_name[1], currents]
+        graph_data = self.graph_buffers[buffer_num].view()
+        return [self.data_name[0], graph_data[0]], [self.data_name[1], graph_data[1]]
 
     def get_redraw_status(self):
         if self.graph_need_to_redraw:
@@ -282,8 +526,63 @@ class ITBChannel:
             return 0
 
     def reset_graph_data(self):
-        self.graph_data = [[] for i in range(len(self.data_name))]
-        pass
+        for graph_buffer in self.graph_buffers:
+            graph_buffer.clear()
+        if self.history is not None:
+            self.history.clear()
+
+
+adc_record_dtype = numpy.dtype(">u2")  # значение АЦП в ответе на get_adc
+# запись канала в ответе на get_channel_data: КУ (индекс 0..3), температура, °С, ток, сигнал и ноль АЦП, кв.
+channel_record = struct.Struct(">Bbhhh")
+channel_record_dtype = numpy.dtype([("ku", "u1"), ("temp", "i1"), ("current", ">i2"), ("signal", ">i2"),
+                                    ("zero", ">i2")])
+
+
+def parc_channels_data(channels, ful_data):
+    # разбор ответа на get_channel_data: 8 байт на канал
+    time_now = time.perf_counter()
+    records_num = min(len(ful_data) // channel_record.size, len(channels))
+    for channel, record in zip(channels, channel_record.iter_unpack(ful_data[:records_num * channel_record.size])):
+        ku, temp, current, signal, zero = record
+        channel.data[0] = time_now
+        if channel.temp_compensation:
+            channel.data[1] = float(channel.cal_a[ku] * channel.temp_gain[temp & 0xFF, ku] * current +
+                                    channel.cal_b[ku] + channel.temp_offset[temp & 0xFF, ku])
+        else:
+            channel.data[1] = float(channel.cal_a[ku] * current + channel.cal_b[ku])
+        channel.data[2:7] = [temp, current, signal, zero, ku]
+        # не забываем сделать данные для графиков
+        channel.create_graph_data()
+
+
+def decode_channels_data(frames, channels):
+    """
+    Пакетный разбор ответов на get_channel_data (например, при повторной обработке записи обмена).
+
+    :param frames: данные ответов (bytes со склеенными ответами или list из bytes), в каждом ответе
+                   по 8 байт на каждый из channels
+    :param channels: list ITBChannel, калибровка которых (с температурной поправкой) применяется к току
+    :return: (структурированный numpy.ndarray формы (ответов, каналов) с полями channel_record_dtype,
+              numpy.ndarray тока, А, той же формы)
+    """
+    if not isinstance(frames, (bytes, bytearray, memoryview)):
+        frames = b"".join(frames)
+    records = numpy.frombuffer(frames, dtype=channel_record_dtype).reshape(-1, len(channels))
+    cal_a = numpy.array([channel.cal_a for channel in channels])
+    cal_b = numpy.array([channel.cal_b for channel in channels])
+    index = numpy.arange(len(channels))
+    ku = records["ku"]
+    # коэффициенты выбираются по (канал, КУ) один раз; температурная поправка меняет только множитель и смещение
+    gain = cal_a[index, ku]
+    offset = cal_b[index, ku]
+    if any(channel.temp_compensation for channel in channels):
+        temp_gain = numpy.array([channel.temp_gain for channel in channels])
+        temp_offset = numpy.array([channel.temp_offset for channel in channels])
+        temp = records["temp"].view(numpy.uint8)
+        gain = gain * temp_gain[index, temp, ku]
+        offset = offset + temp_offset[index, temp, ku]
+    return records, gain * records["current"] + offset
 
 
 def value_from_bound(val, val_min, val_max):
@@ -0,0 +1,179 @@
+import time
+import collections
+import threading
+import concurrent.futures
+
+# типы событий ITBData
+EVENT_CHANNELS = "channels"  # разобран ответ get_channel_data, данные - ITBSnapshot
+EVENT_ADC = "adc"  # разобран ответ get_adc, данные - ITBSnapshot
+EVENT_PARAMS = "params"  # прочитаны параметры измерения, данные - ITBSnapshot
+EVENT_LINK = "link"  # изменилось состояние связи, данные - ITBSerial.state
+
+# способы доставки событий подписчику
+DELIVERY_SYNC = "sync"  # вызов в потоке публикации (поток разбора ответов) - обработчик не должен блокироваться
+DELIVERY_THREAD = "thread"  # вызов в пуле потоков
+DELIVERY_QT = "qt"  # вызов в потоке Qt, в котором создана подписка (queued connection)
+
+Event = collections.namedtuple("Event", ["type", "time", "data"])
+
+_qt_invoker_class = None
+
+
+def _qt_invoker(callback):
+    # PyQt5 импортируется только при подписке с доставкой в поток Qt
+    global _qt_invoker_class
+    if _qt_invoker_class is None:
+        from PyQt5 import QtCore
+
+        class QtInvoker(QtCore.QObject):
+            signal = QtCore.pyqtSignal()
+
+            def __init__(self, function):
+                QtCore.QObject.__init__(self)
+                self.function = function
+                self.signal.connect(self.run, QtCore.Qt.QueuedConnection)
+
+            @QtCore.pyqtSlot()
+            def run(self):
+                self.function()
+
+        _qt_invoker_class = QtInvoker
+    return _qt_invoker_class(callback)
+
+
+class Subscription:
+    """
+    Подписка на события: обработчик callback(event) и очередь событий подписчика.
+
+    Для доставки в пуле потоков и в потоке Qt события копятся в очереди длиной не больше max_len
+    (при переполнении отбрасывается самое старое событие, счетчик dropped), и обработчик вызывается
+    по очереди для каждого события, не более одного вызова одновременно. Медленный подписчик теряет
+    старые события, но не задерживает публикацию.
+    """
+    def __init__(self, bus, event_types, callback, delivery=DELIVERY_SYNC, max_len=100):
+        self.bus = bus
+        self.event_types = frozenset(event_types)
+        self.callback = callback
+        self.delivery = delivery
+        self.max_len = max(1, max_len)
+        self.queue = collections.deque()
+        self.lock = threading.Lock()
+        self.scheduled = False  # вызов обработки очереди уже запланирован
+        self.active = True
+        # статистика
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        if delivery == DELIVERY_QT:
+            self._invoker = _qt_invoker(self._drain)
+        elif delivery not in (DELIVERY_SYNC, DELIVERY_THREAD):
+            raise ValueError("Unknown event delivery <%s>" % delivery)
+
+    def put(self, event):
+        if self.delivery == DELIVERY_SYNC:
+            self._call(event)
+            return
+        with self.lock:
+            if len(self.queue) >= self.max_len:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(event)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        if self.delivery == DELIVERY_QT:
+            self._invoker.signal.emit()
+        else:
+            try:
+                self.bus.executor().submit(self._drain)
+            except RuntimeError:  # пул остановлен (EventBus.close)
+                with self.lock:
+                    self.scheduled = False
+
+    def _drain(self):
+        while True:
+            with self.lock:
+                if not self.queue or not self.active:
+                    self.scheduled = False
+                    return
+                event = self.queue.popleft()
+            self._call(event)
+
+    def _call(self, event):
+        try:
+            self.callback(event)
+            self.delivered += 1
+        except Exception as error:
+            self.errors += 1
+            print("Event <%s> handler error:" % event.type, error)
+
+    def cancel(self):
+        self.bus.unsubscribe(self)
+
+    def get_metrics(self):
+        with self.lock:
+            return {"delivery": self.delivery,
+                    "depth": len(self.queue),
+                    "delivered": self.delivered,
+                    "dropped": self.dropped,
+                    "errors": self.errors}
+
+
+class EventBus:
+    """
+    Публикация событий подписчикам. Список подписок заменяется целиком при изменении, поэтому publish()
+    не берет блокировок; при отсутствии подписчиков на тип события публикация - один проход по списку.
+
+    Пример:
+        subscription = bus.subscribe([EVENT_CHANNELS], callback, delivery=DELIVERY_THREAD, max_len=10)
+        bus.publish(EVENT_CHANNELS, snapshot)
+        subscription.cancel()
+    """
+    def __init__(self, max_workers=2):
+        self.max_workers = max_workers
+        self.subscriptions = []
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers,
+                                                                       thread_name_prefix="itb_events")
+            return self._executor
+
+    def subscribe(self, event_types, callback, delivery=DELIVERY_SYNC, max_len=100):
+        """
+        :param event_types: типы событий (EVENT_*)
+        :param callback: функция callback(event), event - Event(type, time, data)
+        :param delivery: DELIVERY_SYNC, DELIVERY_THREAD или DELIVERY_QT (подписка создается в потоке Qt)
+        :param max_len: длина очереди событий подписчика (кроме DELIVERY_SYNC)
+        :return: Subscription
+        """
+        subscription = Subscription(self, event_types, callback, delivery=delivery, max_len=max_len)
+        with self._lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.active = False
+        with self._lock:
+            self.subscriptions = [var for var in self.subscriptions if var is not subscription]
+
+    def publish(self, event_type, data=None):
+        event = None
+        for subscription in self.subscriptions:
+            if event_type in subscription.event_types:
+                if event is None:
+                    event = Event(event_type, time.perf_counter(), data)
+                subscription.put(event)
+
+    def close(self):
+        # публикация прекращается сразу, события, уже стоящие в очередях пула потоков, доставляются
+        with self._lock:
+            subscriptions, self.subscriptions = self.subscriptions, []
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        for subscription in subscriptions:
+            subscription.active = False
@@ -0,0 +1,188 @@
+import numpy
+import crc16
+
+
+def form_frame(d_addr, s_addr, seq_num, cmd, data=None, cmd_type=0x00):
+    """
+    Формирование запроса к ИТБ: [адрес ИТБ, адрес ПК, seq_num, cmd_type, cmd, длина данных N, данные (N байт),
+    CRC16 (2 байта)].
+
+    :return: list с байтами запроса
+    """
+    if data:
+        data_len = len(data) if len(data) < 256 else 255
+    else:
+        data_len = 0
+    data_to_send = [d_addr, s_addr, seq_num & 0xFF, cmd_type, cmd, data_len]
+    if data_len > 0:
+        data_to_send.extend(data[0:data_len])
+    data_to_send.extend(crc16.calc_to_list(data_to_send, len(data_to_send)))
+    return data_to_send
+
+
+class FrameParser:
+    """
+    Потоковый разборщик ответов ИТБ.
+
+    Формат ответа: [0x00 (адрес ПК), адрес ИТБ, seq_num, cmd_type, cmd, длина данных N, данные (N байт),
+    CRC16 modbus (2 байта)] - минимум 8 байт.
+
+    Принятые байты копируются в заранее выделенный буфер; разобранные байты не удаляются, а сдвигается
+    указатель начала, буфер уплотняется только при достижении его конца. Полезные данные выдаются как
+    memoryview на буфер без копирования и действительны только до следующего вызова feed().
+    """
+    min_frame_len = 8
+    max_frame_len = 255 + 8
+    batch_frames = 8  # от этого числа подряд идущих кадров в буфере CRC проверяется пакетно (crc16.modbus_rows)
+
+    def __init__(self, capacity=65536, crc_check=True, header=0x00, on_crc_error=None):
+        self.capacity = max(capacity, 2 * self.max_frame_len)
+        self.buf = bytearray(self.capacity)
+        self.view = memoryview(self.buf)
+        self.head = 0  # начало неразобранных данных
+        self.tail = 0  # конец принятых данных
+        self.crc_check = crc_check
+        self.header = bytes([header])
+        self.on_crc_error = on_crc_error  # вызывается с memoryview на кадр с неверной CRC
+        # статистика
+        self.frames_num = 0
+        self.crc_errors = 0
+        self.resync_bytes = 0  # байты, отброшенные при поиске заголовка
+        self.overflow_bytes = 0  # байты, потерянные из-за переполнения буфера
+
+    def __len__(self):
+        return self.tail - self.head
+
+    def reset(self):
+        self.head = 0
+        self.tail = 0
+
+    def feed(self, data):
+        data_len = len(data)
+        if self.tail + data_len > self.capacity:
+            self._compact()
+            if self.tail + data_len > self.capacity:
+                # переполнение: оставляем только последние capacity байт
+                lost = self.tail + data_len - self.capacity
+                if lost >= self.tail:
+                    data = memoryview(data)[lost - self.tail:]
+                    self.overflow_bytes += lost
+                    self.tail = 0
+                else:
+                    self.buf[:self.tail - lost] = self.buf[lost:self.tail]
+                    self.tail -= lost
+                    self.overflow_bytes += lost
+                data_len = len(data)
+        self.buf[self.tail:self.tail + data_len] = data
+        self.tail += data_len
+
+    def _compact(self):
+        # перенос неразобранного хвоста в начало буфера (размер буфера не меняется)
+        size = self.tail - self.head
+        if self.head and size:
+            self.buf[:size] = self.buf[self.head:self.tail]
+        self.head = 0
+        self.tail = size
+
+    def need(self):
+        """
+        :return: сколько байт не хватает до окончания текущего кадра (или до минимального кадра)
+        """
+        size = self.tail - self.head
+        if size < self.min_frame_len or self.buf[self.head] != self.header[0]:
+            return max(1, self.min_frame_len - size)
+        return max(1, self.buf[self.head + 5] + 8 - size)
+
+    def frames(self):
+        """
+        Генератор разобранных кадров.
+
+        :return: кортежи (seq_num, cmd, memoryview на данные)
+        """
+        buf = self.buf
+        view = self.view
+        header = self.header
+        header_byte = header[0]
+        modbus_crc16 = crc16.modbus_crc16
+        head = self.head
+        tail = self.tail
+        verified = {}  # {начало кадра: CRC верна} - результаты пакетной проверки
+        batch_frames = self.batch_frames
+        batch_stop = head  # до этой позиции пакетная проверка уже выполнялась
+        while tail - head >= 8:
+            if buf[head] != header_byte:
+                # поиск заголовка одним вызовом find вместо побайтового сдвига
+                start = buf.find(header, head, tail)
+                if start < 0:
+                    start = tail
+                self.resync_bytes += start - head
+                head = start
+                continue
+            frame_end = head + buf[head + 5] + 8
+            if frame_end > tail:
+                break
+            if self.crc_check:
+                crc_ok = None
+                if head < batch_stop:
+                    crc_ok = verified.get(head)
+                elif tail - head >= batch_frames * (frame_end - head):
+                    batch_stop = self._verify_chain(head, tail, verified)
+                    crc_ok = verified.get(head)
+                if crc_ok is None:
+                    crc_ok = modbus_crc16(view[head:frame_end]) == 0
+            else:
+                crc_ok = True
+            if not crc_ok:
+                self.crc_errors += 1
+                if self.on_crc_error:
+                    self.on_crc_error(view[head:frame_end])
+                # заголовок мог быть ложным: сдвигаемся на один байт и ищем дальше
+                self.resync_bytes += 1
+                head += 1
+                continue
+            self.head = frame_end
+            self.frames_num += 1
+            yield buf[head + 2], buf[head + 4], view[head + 6:frame_end - 2]
+            head = self.head
+        self.head = head
+        if head == self.tail:
+            self.head = self.tail = 0
+
+    def _verify_chain(self, head, tail, verified):
+        """
+        Пакетная проверка CRC кадров, найденных в буфере от head так же, как в frames() (заголовок, длина
+        из байта len, пропуск мусора до следующего заголовка): при чтении порта большими кусками один вызов
+        numpy вместо расчета CRC на каждый кадр. Результат для позиции не зависит от остальных кадров, поэтому
+        если frames() после ошибки CRC пойдет по другим позициям, для них CRC считается обычным образом.
+
+        :return: позиция, до которой просмотрен буфер
+        """
+        buf = self.buf
+        header_byte = self.header[0]
+        starts = []
+        lengths = []
+        pos = head
+        header = self.header
+        while tail - pos >= 8:
+            if buf[pos] != header_byte:
+                # мусор между кадрами пропускается, как в frames()
+                pos = buf.find(header, pos, tail)
+                if pos < 0:
+                    pos = tail
+                continue
+            frame_len = buf[pos + 5] + 8
+            if pos + frame_len > tail:
+                break
+            starts.append(pos)
+            lengths.append(frame_len)
+            pos += frame_len
+        if len(starts) < self.batch_frames:
+            return pos
+        data = numpy.frombuffer(buf, dtype=numpy.uint8, count=pos)
+        starts = numpy.array(starts)
+        lengths = numpy.array(lengths)
+        for frame_len in numpy.unique(lengths).tolist():
+            group = starts[lengths == frame_len]
+            crc_ok = crc16.modbus_rows(data[group[:, None] + numpy.arange(frame_len)]) == 0
+            verified.update(zip(group.tolist(), crc_ok.tolist()))
+        return pos
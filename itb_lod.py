@@ -0,0 +1,202 @@
+import threading
+import numpy
+
+
+class MinMaxPyramid:
+    """
+    История ряда (время, значение) с пирамидой минимумов/максимумов для отрисовки длинных записей.
+
+    Уровень 0 - исходные точки, точка уровня k (k >= 1) описывает factor**k исходных точек минимумом и максимумом
+    вместе с их временами, поэтому выбросы не теряются при прореживании. Добавление точки - O(1) (запись
+    в массив), новые точки уровней рассчитываются пакетно при следующем запросе. Память - около
+    16 + 32 / (factor - 1) байт на исходную точку.
+
+    query(t_start, t_stop, points) возвращает около points (от points / 2 до points) точек на диапазон времени:
+    для ширины графика в N пикселей достаточно points = 2 * N.
+
+    max_len ограничивает историю: при заполнении отбрасывается старейшая половина точек (сдвигом массивов
+    в выделенной памяти, в среднем O(1) на точку), и память остается постоянной.
+    """
+    def __init__(self, factor=4, capacity=4096, max_len=None):
+        self.factor = max(2, factor)
+        self.lock = threading.Lock()
+        self.max_len = max(4 * self.factor, max_len) if max_len else None
+        self.capacity = min(capacity, self.max_len) if self.max_len else capacity
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        with self.lock:
+            self.times = numpy.zeros(self.capacity)
+            self.values = numpy.zeros(self.capacity)
+            self.count = 0
+            self.levels = []  # levels[k - 1] - уровень k: [время min, min, время max, max, число точек]
+
+    def append(self, t, value):
+        with self.lock:
+            if self.max_len and self.count >= self.max_len:
+                self._trim(self.count - self.max_len // 2)
+            if self.count >= len(self.times):
+                self._grow_raw(self.count + 1)
+            self.times[self.count] = t
+            self.values[self.count] = value
+            self.count += 1
+
+    def extend(self, times, values):
+        times, values = numpy.asarray(times, dtype=float), numpy.asarray(values, dtype=float)
+        with self.lock:
+            if self.max_len and self.count + len(times) > self.max_len:
+                if len(times) > self.max_len // 2:
+                    self.count = 0
+                    self.levels = []
+                    times, values = times[-(self.max_len // 2):], values[-(self.max_len // 2):]
+                else:
+                    self._trim(self.count + len(times) - self.max_len // 2)
+            if self.count + len(times) > len(self.times):
+                self._grow_raw(self.count + len(times))
+            self.times[self.count:self.count + len(times)] = times
+            self.values[self.count:self.count + len(times)] = values
+            self.count += len(times)
+
+    def _grow_raw(self, size):
+        size = max(size, 2 * len(self.times))
+        if self.max_len:
+            size = min(size, self.max_len)
+        self.times = numpy.concatenate((self.times[:self.count], numpy.zeros(size - self.count)))
+        self.values = numpy.concatenate((self.values[:self.count], numpy.zeros(size - self.count)))
+
+    def _trim(self, drop_min):
+        # отбрасывание не менее drop_min старейших точек: число точек кратно размеру блока уровня top,
+        # поэтому уровни до top остаются выровненными и сдвигаются, а более высокие уровни рассчитываются заново
+        self._build()
+        top = 0
+        while self.factor ** (top + 1) <= self.max_len // 4:
+            top += 1
+        size = self.factor ** top
+        drop = min(self.count // size * size, -(-drop_min // size) * size)
+        self.times[:self.count - drop] = self.times[drop:self.count]
+        self.values[:self.count - drop] = self.values[drop:self.count]
+        self.count -= drop
+        del self.levels[top:]
+        for k, level in enumerate(self.levels, 1):
+            level_drop = drop // self.factor ** k
+            for num in range(4):
+                level[num][:level[4] - level_drop] = level[num][level_drop:level[4]]
+            level[4] -= level_drop
+
+    def _level(self, k):
+        if k == 0:
+            return self.times, self.values, self.times, self.values, self.count
+        return self.levels[k - 1]
+
+    def _build(self):
+        # расчет точек уровней, для которых набрались все точки предыдущего уровня
+        k = 1
+        while True:
+            t_lo, lo, t_hi, hi, count = self._level(k - 1)
+            parents_num = count // self.factor
+            if parents_num == 0:
+                return
+            if len(self.levels) < k:
+                self.levels.append([numpy.zeros(0), numpy.zeros(0), numpy.zeros(0), numpy.zeros(0), 0])
+            level = self.levels[k - 1]
+            done = level[4]
+            if parents_num > done:
+                if parents_num > len(level[0]):
+                    size = max(parents_num, 2 * len(level[0]))
+                    for num in range(4):
+                        level[num] = numpy.concatenate((level[num][:done], numpy.zeros(size - done)))
+                start, stop = done * self.factor, parents_num * self.factor
+                rows = numpy.arange(parents_num - done)
+                index = lo[start:stop].reshape(-1, self.factor).argmin(axis=1)
+                level[0][done:parents_num] = t_lo[start:stop].reshape(-1, self.factor)[rows, index]
+                level[1][done:parents_num] = lo[start:stop].reshape(-1, self.factor)[rows, index]
+                index = hi[start:stop].reshape(-1, self.factor).argmax(axis=1)
+                level[2][done:parents_num] = t_hi[start:stop].reshape(-1, self.factor)[rows, index]
+                level[3][done:parents_num] = hi[start:stop].reshape(-1, self.factor)[rows, index]
+                level[4] = parents_num
+            k += 1
+
+    def _segments(self, start, stop, top):
+        """
+        Покрытие исходных точек [start, stop) точками уровней: от уровня 0 до top у начала диапазона,
+        уровень top в середине и обратно до уровня 0 у конца.
+
+        :return: список (уровень, первая точка уровня, точка уровня после последней)
+        """
+        segments = []
+        pos = start
+        for k in range(top):
+            size = self.factor ** k
+            target = min(-(-pos // (size * self.factor)) * size * self.factor, stop // size * size,
+                         self._level(k)[4] * size)
+            if target > pos:
+                segments.append((k, pos // size, target // size))
+                pos = target
+        for k in range(top, -1, -1):
+            size = self.factor ** k
+            target = min(stop // size * size, self._level(k)[4] * size)
+            if target > pos:
+                segments.append((k, pos // size, target // size))
+                pos = target
+        return segments
+
+    def query(self, t_start=None, t_stop=None, points=1000):
+        """
+        :param t_start: начало диапазона времени (None - с первой точки)
+        :param t_stop: конец диапазона времени (None - до последней точки)
+        :param points: число точек результата: от points / 2 до points (при меньшем числе точек в диапазоне -
+                       все точки)
+        :return: (numpy.ndarray времен, numpy.ndarray значений) в порядке возрастания времени
+        """
+        with self.lock:
+            self._build()
+            times = self.times[:self.count]
+            start = 0 if t_start is None else int(numpy.searchsorted(times, t_start, side="left"))
+            stop = self.count if t_stop is None else int(numpy.searchsorted(times, t_stop, side="right"))
+            if stop <= start:
+                return numpy.zeros(0), numpy.zeros(0)
+            top = 0
+            while top < len(self.levels) and 2 * (stop - start) / self.factor ** (top + 1) >= points / 2:
+                top += 1
+            result_times, result_values = [], []
+            for k, first, last in self._segments(start, stop, top):
+                t_lo, lo, t_hi, hi, count = self._level(k)
+                if k == 0:
+                    result_times.append(t_lo[first:last].copy())
+                    result_values.append(lo[first:last].copy())
+                    continue
+                # минимум и максимум точки уровня - в порядке их времени
+                swap = t_lo[first:last] > t_hi[first:last]
+                result_times.append(numpy.column_stack((numpy.where(swap, t_hi[first:last], t_lo[first:last]),
+                                                        numpy.where(swap, t_lo[first:last], t_hi[first:last]))).ravel())
+                result_values.append(numpy.column_stack((numpy.where(swap, hi[first:last], lo[first:last]),
+                                                         numpy.where(swap, lo[first:last], hi[first:last]))).ravel())
+        return self._reduce(numpy.concatenate(result_times), numpy.concatenate(result_values), points)
+
+    @staticmethod
+    def _reduce(times, values, points):
+        # точки уровня дают от points / 2 до factor * points / 2 точек: окончательное прореживание группами
+        # по минимуму/максимуму до не более points точек (не более points // 2 групп, включая неполную последнюю)
+        group = -(-len(times) // max(1, points // 2))
+        if group < 3:
+            return times, values
+        groups_num = len(times) // group
+        head = groups_num * group
+        if len(times) - head > 2:
+            tail = times[head:], values[head:]
+            tail_index = numpy.unique([tail[1].argmin(), tail[1].argmax()])
+            times = numpy.concatenate((times[:head], tail[0][tail_index]))
+            values = numpy.concatenate((values[:head], tail[1][tail_index]))
+        rows = numpy.arange(groups_num)
+        group_times = times[:head].reshape(-1, group)
+        group_values = values[:head].reshape(-1, group)
+        index_min = group_values.argmin(axis=1)
+        index_max = group_values.argmax(axis=1)
+        first = numpy.minimum(index_min, index_max)
+        last = numpy.maximum(index_min, index_max)
+        result_times = numpy.column_stack((group_times[rows, first], group_times[rows, last])).ravel()
+        result_values = numpy.column_stack((group_values[rows, first], group_values[rows, last])).ravel()
+        return numpy.concatenate((result_times, times[head:])), numpy.concatenate((result_values, values[head:]))
@@ -0,0 +1,89 @@
+import bisect
+import threading
+
+# границы интервалов гистограммы задержек, с (последний интервал - все, что больше)
+latency_bounds = [0.0005 * 2 ** i for i in range(12)]  # 0.5 мс ... 1.024 с
+
+
+class Histogram:
+    def __init__(self, bounds=None):
+        self.bounds = latency_bounds if bounds is None else bounds
+        self.counts = [0 for i in range(len(self.bounds) + 1)]
+        self.count = 0
+        self.sum = 0.
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        # оценка по верхней границе интервала
+        if not self.count:
+            return 0.
+        threshold = self.count * percent / 100
+        total = 0
+        for num, count in enumerate(self.counts):
+            total += count
+            if total >= threshold:
+                return min(self.bounds[num], self.max) if num < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {"count": self.count,
+                "mean": self.sum / self.count if self.count else 0.,
+                "min": self.min or 0.,
+                "max": self.max or 0.,
+                "p50": self.percentile(50),
+                "p99": self.percentile(99),
+                "bounds": list(self.bounds),
+                "counts": list(self.counts)}
+
+
+class TransportMetrics:
+    """
+    Счетчики транспорта и гистограммы задержки запрос-ответ по кодам команд. Обновляются только потоком
+    транспорта, snapshot() можно вызывать из любого потока.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.timeouts = 0
+        self.latency = {}  # {cmd: Histogram}
+
+    def sent(self, frame_len):
+        self.frames_sent += 1
+        self.bytes_sent += frame_len
+
+    def received(self, data_len):
+        self.bytes_received += data_len
+
+    def answer(self, cmd, latency):
+        self.frames_received += 1
+        histogram = self.latency.get(cmd)
+        if histogram is None:
+            with self.lock:
+                histogram = self.latency.setdefault(cmd, Histogram())
+        histogram.add(latency)
+
+    def timeout(self):
+        self.timeouts += 1
+
+    def snapshot(self):
+        with self.lock:
+            latency = dict(self.latency)
+        return {"frames_sent": self.frames_sent,
+                "frames_received": self.frames_received,
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "timeouts": self.timeouts,
+                "latency": {cmd: histogram.snapshot() for cmd, histogram in latency.items()}}
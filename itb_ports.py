@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+import serial.tools.list_ports
+
+
+class PortIndex:
+    """
+    Индекс COM-портов: серийный номер преобразователя -> имя устройства.
+
+    Полный опрос serial.tools.list_ports.comports() выполняется только при изменении набора устройств:
+    на Linux изменение определяется по содержимому /dev/serial/by-id (udev): имена ссылок вместе с их целями,
+    т.к. при переподключении адаптер может получить другой ttyUSBn под тем же by-id именем; на остальных системах
+    опрос повторяется не чаще refresh_period. Поиск порта по серийному номеру - O(1) по словарю.
+    """
+    by_id_dir = "/dev/serial/by-id"
+
+    def __init__(self, refresh_period=1.0):
+        self.refresh_period = refresh_period
+        self.index = {}  # {serial_number: device}
+        self.lock = threading.Lock()
+        self._signature = None
+        self._refresh_time = 0.
+        self.refresh_duration = 0.  # длительность последнего полного опроса, с
+        self.refresh_num = 0
+        self._close_event = threading.Event()
+        self.watch_thread = None
+
+    def _get_signature(self):
+        try:
+            names = sorted(os.listdir(self.by_id_dir))
+        except OSError:
+            return None
+        signature = []
+        for name in names:
+            try:
+                signature.append((name, os.readlink(os.path.join(self.by_id_dir, name))))
+            except OSError:  # ссылка удалена между listdir и readlink
+                signature.append((name, None))
+        return tuple(signature)
+
+    def refresh(self, force=False):
+        """
+        Обновление индекса при изменении набора устройств.
+
+        :return: (добавленные серийные номера, удаленные серийные номера)
+        """
+        signature = self._get_signature()
+        if not force:
+            if signature is not None and signature == self._signature:
+                return set(), set()
+            if signature is None and time.perf_counter() - self._refresh_time < self.refresh_period:
+                return set(), set()
+        time_start = time.perf_counter()
+        index = {com.serial_number: com.device for com in serial.tools.list_ports.comports()
+                 if com.serial_number is not None}
+        with self.lock:
+            added = set(index) - set(self.index)
+            removed = set(self.index) - set(index)
+            self.index = index
+            self._signature = signature
+            self._refresh_time = time.perf_counter()
+            self.refresh_duration = self._refresh_time - time_start
+            self.refresh_num += 1
+        return added, removed
+
+    def resolve(self, serial_number, refresh=True):
+        """
+        :param serial_number: серийный номер или его часть (как в ITBSerial.serial_numbers)
+        :param refresh: при отсутствии в индексе выполнить полный опрос и повторить поиск
+        :return: имя устройства или None
+        """
+        if refresh and self.watch_thread is None:
+            self.refresh()  # дешевая проверка изменения набора устройств
+        with self.lock:
+            device = self.index.get(serial_number)
+            if device is None:
+                for number, number_device in self.index.items():
+                    if number.find(serial_number) >= 0:
+                        device = number_device
+                        break
+        if device is None and refresh:
+            self.refresh(force=True)
+            return self.resolve(serial_number, refresh=False)
+        return device
+
+    def invalidate(self, serial_number):
+        # устройство по индексу не открылось (переподключение USB): следующий resolve выполнит полный опрос
+        with self.lock:
+            for number in [number for number in self.index if number.find(serial_number) >= 0]:
+                self.index.pop(number)
+            self._signature = None
+
+    def start(self):
+        # фоновое отслеживание подключения/отключения устройств
+        if self.watch_thread is None:
+            self.watch_thread = threading.Thread(target=self.watch_function, args=(), daemon=True)
+            self.watch_thread.start()
+
+    def watch_function(self):
+        while not self._close_event.wait(self.refresh_period):
+            self.refresh()
+
+    def stop(self):
+        self._close_event.set()
+
+
+port_index = PortIndex()  # общий индекс для всех транспортов
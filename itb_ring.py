@@ -0,0 +1,75 @@
+import numpy
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер фиксированной емкости: fields рядов по capacity последних точек.
+
+    Каждая точка записывается дважды - в позиции pos и pos + capacity, поэтому последние n точек любого ряда
+    всегда лежат в памяти подряд и выдаются срезом без копирования (view). Добавление точки - O(1),
+    занимаемая память не меняется.
+
+    Пример:
+        ring = RingBuffer(fields=2, capacity=1000)
+        ring.append([time, current])
+        times, currents = ring.view()
+    """
+    def __init__(self, fields=1, capacity=1000, dtype=numpy.float64):
+        self.fields = fields
+        self.capacity = max(1, int(capacity))
+        self.buffer = numpy.zeros((fields, 2 * self.capacity), dtype=dtype)
+        self.pos = 0  # позиция следующей записи
+        self.count = 0  # число точек в буфере
+        self.appended = 0  # всего добавлено точек
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row):
+        """
+        :param row: значения всех рядов для одной точки (fields значений)
+        """
+        column = self.buffer[:, self.pos]
+        column[:] = row  # преобразование row выполняется один раз
+        self.buffer[:, self.pos + self.capacity] = column
+        self.pos = (self.pos + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.appended += 1
+
+    def extend(self, rows):
+        """
+        :param rows: массив формы (fields, n) - n точек для всех рядов
+        """
+        rows = numpy.asarray(rows, dtype=self.buffer.dtype).reshape(self.fields, -1)
+        rows_num = rows.shape[1]
+        if rows_num > self.capacity:
+            # остаются только последние capacity точек
+            self.pos = (self.pos + rows_num - self.capacity) % self.capacity
+            self.appended += rows_num - self.capacity
+            rows = rows[:, -self.capacity:]
+            rows_num = self.capacity
+        index = (self.pos + numpy.arange(rows_num)) % self.capacity
+        self.buffer[:, index] = rows
+        self.buffer[:, index + self.capacity] = rows
+        self.pos = (self.pos + rows_num) % self.capacity
+        self.count = min(self.count + rows_num, self.capacity)
+        self.appended += rows_num
+
+    def view(self, field=None, n=None):
+        """
+        Последние точки без копирования. Данные среза остаются верными, пока в буфер не добавлено
+        еще capacity - n точек; для долгого хранения срез нужно скопировать.
+
+        :param field: номер ряда (None - все ряды, массив формы (fields, n))
+        :param n: число последних точек (None - все точки буфера)
+        :return: numpy.ndarray только для чтения
+        """
+        n = self.count if n is None else max(0, min(n, self.count))
+        start = self.pos + self.capacity - n
+        view = self.buffer[:, start:start + n] if field is None else self.buffer[field, start:start + n]
+        view.flags.writeable = False
+        return view
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
@@ -0,0 +1,108 @@
+import collections
+import threading
+import time
+
+# классы приоритета (меньше - важнее)
+PRIORITY_CONTROL = 0  # управление: режим измерения, ЦАП, запись параметров, отладка
+PRIORITY_READ = 1  # чтение данных и зеркало
+PRIORITY_BACKGROUND = 2  # фоновый опрос служебных данных: отправляется, только когда нет других команд
+
+
+class CommandScheduler:
+    """
+    Очередь команд на отправку с классами приоритета.
+
+    Команды управления отправляются раньше опроса и никогда не отбрасываются. Одинаковые запросы чтения
+    (idempotent_cmds), уже стоящие в очереди, повторно не добавляются. Очередь опроса ограничена
+    max_len: при переполнении отбрасывается самая старая команда (overflow="drop_oldest") или новая
+    (overflow="drop_new").
+    """
+    control_cmds = {0x02, 0x04, 0x05, 0x07}
+    idempotent_cmds = {0x01, 0x03, 0x06}
+
+    def __init__(self, max_len=64, overflow="drop_oldest", priorities_num=3):
+        self.max_len = max_len
+        self.overflow = overflow
+        self.queues = [collections.deque() for i in range(priorities_num)]
+        self.queued_keys = set()  # команды чтения, уже стоящие в очереди
+        self.cond = threading.Condition()
+        # статистика
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.dequeued = 0
+        self.wait_sum = 0.
+        self.wait_max = 0.
+
+    def __len__(self):
+        return sum(len(queue) for queue in self.queues)
+
+    def default_priority(self, cmd):
+        return PRIORITY_CONTROL if cmd in self.control_cmds else PRIORITY_READ
+
+    def put(self, cmd, data=None, priority=None, key=None):
+        """
+        :param key: ключ объединения одинаковых запросов (по умолчанию - код команды для idempotent_cmds)
+        :return: True - команда поставлена в очередь, False - объединена с уже стоящей или отброшена
+        """
+        if priority is None:
+            priority = self.default_priority(cmd)
+        if key is None and cmd in self.idempotent_cmds:
+            key = cmd
+        with self.cond:
+            if key is not None and key in self.queued_keys:
+                self.coalesced += 1
+                return False
+            queue = self.queues[priority]
+            if priority != PRIORITY_CONTROL and len(queue) >= self.max_len:
+                self.dropped += 1
+                if self.overflow == "drop_new":
+                    return False
+                self.queued_keys.discard(queue.popleft()[3])
+            queue.append([cmd, data, time.perf_counter(), key])
+            if key is not None:
+                self.queued_keys.add(key)
+            self.enqueued += 1
+            self.cond.notify()
+        return True
+
+    def get(self, timeout=None):
+        """
+        Извлечение самой приоритетной команды; ожидание не дольше timeout (None - без ограничения, 0 - без ожидания).
+
+        :return: (cmd, data) или None, если очередь пуста
+        """
+        with self.cond:
+            if not self.cond.wait_for(self.__len__, timeout=timeout):
+                return None
+            for queue in self.queues:
+                if queue:
+                    cmd, data, time_put, key = queue.popleft()
+                    break
+            self.queued_keys.discard(key)
+            wait = time.perf_counter() - time_put
+            self.dequeued += 1
+            self.wait_sum += wait
+            self.wait_max = max(self.wait_max, wait)
+        return cmd, data
+
+    def notify(self):
+        # пробуждение ожидающего get() без команды (например, при закрытии)
+        with self.cond:
+            self.cond.notify_all()
+
+    def clear(self):
+        with self.cond:
+            for queue in self.queues:
+                queue.clear()
+            self.queued_keys.clear()
+
+    def get_metrics(self):
+        with self.cond:
+            return {"depth": [len(queue) for queue in self.queues],
+                    "enqueued": self.enqueued,
+                    "coalesced": self.coalesced,
+                    "dropped": self.dropped,
+                    "dequeued": self.dequeued,
+                    "wait_mean": self.wait_sum / self.dequeued if self.dequeued else 0.,
+                    "wait_max": self.wait_max}
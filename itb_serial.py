@@ -1,9 +1,26 @@
 import serial
-import serial.tools.list_ports
 import threading
+import queue
 import time
-import crc16
-import copy
+import itb_frame
+import itb_capture
+import itb_metrics
+import itb_ports
+import itb_scheduler
+import collections
+
+
+# тип запроса: код команды, наличие данных в запросе
+req_type_table = {
+    "mirror": (0x00, True),
+    "get_adc": (0x01, False),
+    "measure_mode": (0x02, True),
+    "get_channel_data": (0x03, False),
+    "dac_set": (0x04, True),
+    "itb_param_write": (0x05, True),
+    "itb_param_read": (0x06, False),
+    "dbg_start": (0x07, True),
+}
 
 
 class ITBSerial(serial.Serial):
@@ -14,9 +31,12 @@ class ITBSerial(serial.Serial):
         self.timeout = 0.03
         self.port = "COM0"
         self.row_data = b""
-        self.read_timeout = 0.5
+        self.read_timeout = 0.5  # начальный (до набора статистики) и максимальный таймаут ответа
+        self.read_timeout_min = 0.05  # минимальный таймаут ответа (не меньше self.timeout)
+        self.adaptive_timeout = True
         self.debug = False
         self.crc_check = True
+        self.window = 1  # число запросов, отправляемых без ожидания ответа на предыдущие
         for key in sorted(kw):
             if key == "serial_numbers":
                 self.serial_numbers = kw.pop(key)
@@ -30,15 +50,33 @@ class ITBSerial(serial.Serial):
                 self.debug = kw.pop(key)
             elif key == "crc":
                 self.crc_check = kw.pop(key)
+            elif key == "window":
+                self.window = max(1, min(255, kw.pop(key)))
+            elif key == "read_timeout":
+                self.read_timeout = kw.pop(key)
+            elif key == "read_timeout_min":
+                self.read_timeout_min = kw.pop(key)
+            elif key == "adaptive_timeout":
+                self.adaptive_timeout = kw.pop(key)
             else:
                 pass
         # общие переменные
         self.s_addr = 0x00  # self address
         self.d_addr = 0x01  # device address
         self.seq_num = 0
-        self.com_queue = []  # очередь отправки
+        self.com_queue = itb_scheduler.CommandScheduler()  # очередь отправки
+        self.idle_timeout = 0.1  # период проверки флага завершения потока при простое
         self.nansw = 0  # неответы
-        self.answer_data = []
+        self.in_flight = collections.OrderedDict()  # отправленные запросы без ответа: {seq_num: [cmd, time, rto_key]}
+        self._answer_time = 0.  # время последнего ответа или неответа
+        self.lost_answers = collections.Counter()  # неответы по номерам последовательности
+        self.out_of_order_answers = collections.Counter()  # ответы, пришедшие раньше ответов на более старые запросы
+        self.unexpected_answers = 0  # ответы, не соответствующие ни одному запросу (в т.ч. опоздавшие)
+        self.rto = RTOEstimator(rto_init=self.read_timeout, rto_min=max(self.read_timeout_min, self.timeout),
+                                rto_max=self.read_timeout, adaptive=self.adaptive_timeout)
+        # проверка CRC отключается только явным crc=False (как в прежнем разборе ответов)
+        self.parser = itb_frame.FrameParser(crc_check=self.crc_check is not False, on_crc_error=self._crc_error)
+        self.answer_queue = queue.SimpleQueue()  # принятые ответы (cmd, bytes); None - признак завершения приема
         self.com_rec_flag = 0
         self.read_data = b""
         self.read_flag = 0
@@ -49,40 +87,80 @@ class ITBSerial(serial.Serial):
             +0: "Подключите устройство",
             +1: "Связь в норме",
         }
-        self.state = 0
-        self.log_buffer = []
+        self.state_callbacks = []  # функции callback(state), вызываемые при изменении состояния связи
+        self._state = 0
+        self.connect_time = 0.  # длительность последнего open_id, с
+        self.capture = itb_capture.TrafficCapture()  # запись обмена
+        self.metrics = itb_metrics.TransportMetrics()
         # для работы с потоками
         self.read_write_thread = None
         self._close_event = threading.Event()
         self.read_write_thread = threading.Thread(target=self.thread_function, args=(), daemon=True)
         self.read_write_thread.start()
-        self.log_lock = threading.Lock()
-        self.com_send_lock = threading.Lock()
-        self.ans_data_lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        # состояние обновляется на каждом ответе: обработчики вызываются только при изменении
+        if state == self._state:
+            return
+        self._state = state
+        for callback in self.state_callbacks:
+            try:
+                callback(state)
+            except Exception as error:
+                print("State callback error:", error)
 
     def open_id(self):  # функция для установки связи с КПА
-        com_list = serial.tools.list_ports.comports()
-        for com in com_list:
-            self._print("Find:", str(com), com.serial_number)
-            for serial_number in self.serial_numbers:
-                self._print("ID comparison:", com.serial_number, serial_number)
-                if com.serial_number is not None:
-                    if com.serial_number.find(serial_number) >= 0:
-                        self._print("Connection to:", com.device)
-                        self.port = com.device
-                        try:
-                            self.open()
-                            self._print("Success connection!")
-                            self.state = 1
-                            self.nansw = 0
-                            return True
-                        except serial.serialutil.SerialException as error:
-                            self._print("Fail connection")
-                            self._print(error)
+        time_start = time.perf_counter()
+        for attempt in range(2):
+            open_error = False
+            for serial_number, device in find_ports(self.serial_numbers, debug_print=self._print):
+                self._print("Connection to:", device)
+                self.port = device
+                try:
+                    self.open()
+                    self.connect_time = time.perf_counter() - time_start
+                    self._print("Success connection! Connect time %.3f ms" % (self.connect_time * 1000))
+                    self.state = 1
+                    self.nansw = 0
+                    return True
+                except serial.serialutil.SerialException as error:
+                    self._print("Fail connection")
+                    self._print(error)
+                    # порт мог смениться после переподключения USB: повторяем поиск по свежему списку портов
+                    itb_ports.port_index.invalidate(serial_number)
+                    open_error = True
+            if not open_error:
+                break
+        self.connect_time = time.perf_counter() - time_start
+        self.state = -1
+        return False
+
+    def open_port(self, port=None):  # установка связи по имени порта (без поиска по серийному номеру)
+        time_start = time.perf_counter()
+        if port is not None:
+            self.port = port
+        self._print("Connection to:", self.port)
+        try:
+            self.open()
+            self.connect_time = time.perf_counter() - time_start
+            self._print("Success connection! Connect time %.3f ms" % (self.connect_time * 1000))
+            self.state = 1
+            self.nansw = 0
+            return True
+        except serial.serialutil.SerialException as error:
+            self._print("Fail connection")
+            self._print(error)
+        self.connect_time = time.perf_counter() - time_start
         self.state = -1
         return False
 
     def _print(self, *args):
+        # в горячих местах вызов дополнительно обернут в "if self.debug:", чтобы не форматировать аргументы зря
         if self.debug:
             print_str = get_time() + " "
             for arg in args:
@@ -92,132 +170,49 @@ class ITBSerial(serial.Serial):
     def close_id(self):
         self.close()
         self.state = 0
-        pass
+        # файл записи обмена закрывается вместе с транспортом, иначе конец записи теряется при выходе
+        self.capture.close_file()
 
     def reconnect(self):
-        self.close_id()
-        self.open_id()
-
-    def request(self, req_type="mirror", data=None):
-
-        if req_type == "mirror":
-            data_to_send = self.data_to_send_form(cmd=0x00, data=data)
-        elif req_type == "get_adc":
-            data_to_send = self.data_to_send_form(cmd=0x01)
-        elif req_type == "measure_mode":
-            data_to_send = self.data_to_send_form(cmd=0x02, data=data)
-        elif req_type == "get_channel_data":
-            data_to_send = self.data_to_send_form(cmd=0x03)
-        elif req_type == "dac_set":
-            data_to_send = self.data_to_send_form(cmd=0x04, data=data)
-        elif req_type == "itb_param_write":
-            data_to_send = self.data_to_send_form(cmd=0x05, data=data)
-        elif req_type == "itb_param_read":
-            data_to_send = self.data_to_send_form(cmd=0x06)
-        elif req_type == "dbg_start":
-            data_to_send = self.data_to_send_form(cmd=0x07, data=data)
+        # запись обмена в файл продолжается после переподключения
+        self.close()
+        self.state = 0
+        self.capture.flush()
+        if self.serial_numbers:
+            return self.open_id()
         else:
-            data_to_send = self.data_to_send_form(cmd=0x00)
-        self._print("Try to send command <%s>:" % req_type, bytes_array_to_str(data_to_send))
-        with self.com_send_lock:
-            self.com_queue.append(data_to_send)
-        pass
+            return self.open_port()
+
+    def request(self, req_type="mirror", data=None, priority=None):
+        cmd, with_data = req_type_table.get(req_type, (0x00, False))
+        data = data if with_data else None
+        if self.debug:
+            self._print("Try to send command <%s>:" % req_type, bytes_array_to_str(data or []))
+        return self.com_queue.put(cmd, data, priority=priority)
 
     def data_to_send_form(self, cmd_type=0x00, cmd=0x01, data=None):  # data to send form
-        if data:
-            data_len = len(data) if len(data) < 256 else 255
-        else:
-            data_len = 0
-        data_to_send = [self.d_addr, self.s_addr, self.seq_num & 0xFF, cmd_type, cmd, data_len]
-        if data_len > 0:
-            data_to_send.extend(data[0:data_len])
-        com_crc16 = crc16.calc_to_list(data_to_send, len(data_to_send))
-        data_to_send.extend(com_crc16)
+        data_to_send = itb_frame.form_frame(self.d_addr, self.s_addr, self.seq_num, cmd, data=data, cmd_type=cmd_type)
         self.seq_num += 1
         return data_to_send
 
     def thread_function(self):
         try:
             while True:
-                nansw = 0
                 if self.is_open is True:
-                    time.sleep(0.010)
-                    # отправка команд
-                    if self.com_queue:
-                        with self.com_send_lock:
-                            data_to_send = self.com_queue.pop(0)
-                            comm = data_to_send[4]
-                        if self.in_waiting:
-                            print("In input buffer %d bytes" % self.in_waiting)
-                            self.read(self.in_waiting)
-                        try:
-                            self.read(self.in_waiting)
-                            self.write(bytes(data_to_send))
-                            nansw = 1
-                            self._print("Send packet: ", bytes_array_to_str(data_to_send))
-                        except serial.serialutil.SerialException as error:
-                            self.state = -3
-                            self._print("Send error: ", error)
-                            pass
-                        with self.log_lock:
-                            self.log_buffer.append(get_time() + bytes_array_to_str(bytes(data_to_send)))
-                        # прием ответа: ждем ответа timeout ms
-                        buf = bytearray(b"")
-                        read_data = bytearray(b"")
-                        time_start = time.perf_counter()
-                        while True:
-                            time.sleep(0.01)
-                            timeout = time.perf_counter() - time_start
-                            if timeout >= self.read_timeout:
-                                break
-                            try:
-                                read_data = self.read(128)
-                                self.read_data = read_data
-                            except (TypeError, serial.serialutil.SerialException, AttributeError) as error:
-                                self.state = -3
-                                self._print("Receive error: ", error)
-                                pass
-                            if read_data:
-                                self._print("Receive data with timeout <%.3f>: " % self.timeout, bytes_array_to_str(read_data))
-                                with self.log_lock:
-                                    self.log_buffer.append(get_time() + bytes_array_to_str(read_data))
-                                read_data = buf + bytes(read_data)  # прибавляем к новому куску старый кусок
-                                self._print("Data to process: ", bytes_array_to_str(read_data))
-                                if len(read_data) >= 8:
-                                    if read_data[0] == 0x00:
-                                        if len(read_data) >= read_data[5] + 8:  # проверка на запрос
-                                            self._print("CRC16 check (0 is valid): ",
-                                                        hex(crc16.modbus_crc16(read_data[:read_data[5] + 8])))
-                                            if crc16.modbus_crc16(read_data[:read_data[5] + 8]) == 0 or self.crc_check is False:
-                                                if comm == read_data[4]:
-                                                    nansw -= 1
-                                                    self.state = 1
-                                                    with self.ans_data_lock:
-                                                        self.answer_data.append([read_data[4], read_data[6:6+read_data[5]]])
-                                                        self._print("Command <0x%02X> was read: " % read_data[4],
-                                                                    bytes_array_to_str(read_data[6:6+read_data[5]]))
-                                                    break
-                                                else:
-                                                    self._print("Answer error")
-                                                    self.state = -3
-                                        else:
-                                            buf = read_data
-                                            read_data = bytearray(b"")
-                                    else:
-                                        buf = read_data[1:]
-                                        read_data = bytearray(b"")
-                                else:
-                                    buf = read_data
-                                    read_data = bytearray(b"")
-                                pass
-                            else:
-                                pass
+                    # отправка команд, пока есть место в окне неподтвержденных запросов;
+                    # при простое поток спит в очереди, а не опрашивает ее по таймеру
+                    while len(self.in_flight) < self.window:
+                        command = self.com_queue.get(timeout=0 if self.in_flight else self.idle_timeout)
+                        if command is None:
+                            break
+                        self.send_frame(self.data_to_send_form(cmd=command[0], data=command[1]))
+                    # прием ответов: для каждого запроса ждем не дольше таймаута, вычисленного по статистике RTT
+                    if self.in_flight:
+                        self.read_frames()
+                        self.check_answer_timeouts()
                 else:
-                    pass
-                if nansw == 1:
-                    self.state = -3
-                    self.nansw += 1
-                    self._print("Timeout error")
+                    # порт закрыт: ждем без загрузки процессора
+                    self._close_event.wait(self.idle_timeout)
                 if self._close_event.is_set() is True:
                     self._close_event.clear()
                     return
@@ -225,11 +220,191 @@ class ITBSerial(serial.Serial):
             self._print(error)
         pass
 
+    def send_frame(self, data_to_send):
+        try:
+            if not self.in_flight:
+                # входной буфер сбрасываем только если не ждем ответов на уже отправленные запросы;
+                # опоздавшие ответы перед сбросом разбираются и учитываются в unexpected_answers
+                if self.in_waiting:
+                    self._print("In input buffer %d bytes" % self.in_waiting)
+                    self.read_frames(size=self.in_waiting)
+                self.parser.reset()
+            self.write(bytes(data_to_send))
+            self.metrics.sent(len(data_to_send))
+            self.in_flight[data_to_send[2]] = [data_to_send[4], time.perf_counter(), (data_to_send[4], data_to_send[5])]
+            if self.debug:
+                self._print("Send packet: ", bytes_array_to_str(data_to_send))
+        except serial.serialutil.SerialException as error:
+            self.state = -3
+            self._print("Send error: ", error)
+            pass
+        self.capture.append(itb_capture.DIR_TX, data_to_send)
+
+    def read_frames(self, size=None):
+        """
+        Блокирующий прием: read() ждет в драйвере ровно столько байт, сколько не хватает до конца текущего кадра
+        (но не дольше self.timeout), поэтому ответ обрабатывается сразу после приема полного кадра.
+
+        :param size: число читаемых байт (None - до конца текущего кадра или все принятые)
+        """
+        try:
+            read_data = self.read(max(self.parser.need(), self.in_waiting) if size is None else size)
+            self.read_data = read_data
+        except (TypeError, serial.serialutil.SerialException, AttributeError) as error:
+            self.state = -3
+            self._print("Receive error: ", error)
+            return
+        if not read_data:
+            return
+        self.metrics.received(len(read_data))
+        if self.debug:
+            self._print("Receive data with timeout <%.3f>: " % self.timeout, bytes_array_to_str(read_data))
+        self.capture.append(itb_capture.DIR_RX, read_data)
+        self.parser.feed(read_data)
+        for seq, comm, data in self.parser.frames():
+            self.check_answer(seq, comm, data)
+
+    def check_answer(self, seq, comm, data):
+        # сопоставление ответа с запросом по номеру последовательности и коду команды
+        request = self.in_flight.get(seq)
+        if request is None or request[0] != comm:
+            if self.debug:
+                self._print("Answer error: unexpected answer seq <0x%02X> command <0x%02X>" % (seq, comm))
+            self.unexpected_answers += 1
+            return
+        if next(iter(self.in_flight)) != seq:
+            if self.debug:
+                self._print("Answer out of order: seq <0x%02X>" % seq)
+            self.out_of_order_answers[seq] += 1
+        del self.in_flight[seq]
+        # время ответа считаем от момента, когда ИТБ мог начать обработку запроса (после предыдущего ответа)
+        time_now = time.perf_counter()
+        self.rto.update(request[2], time_now - max(request[1], self._answer_time))
+        self.metrics.answer(comm, time_now - request[1])
+        self._answer_time = time_now
+        self.state = 1
+        data = bytes(data)  # единственная копия: данные парсера действительны только до следующего приема
+        self.answer_queue.put((comm, data))
+        if self.debug:
+            self._print("Command <0x%02X> was read: " % comm, bytes_array_to_str(data))
+
+    def get_answer(self, timeout=None):
+        """
+        Ожидание следующего принятого ответа.
+
+        :param timeout: время ожидания, с (None - без ограничения)
+        :return: (код команды, bytes с данными) или None при истечении таймаута или завершении приема
+        """
+        try:
+            return self.answer_queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _crc_error(self, frame):
+        if self.debug:
+            self._print("CRC16 error: ", bytes_array_to_str(frame))
+
+    def check_answer_timeouts(self):
+        # ИТБ отвечает на запросы по очереди, поэтому таймаут отсчитывается только для самого старого запроса
+        # от момента его отправки или предыдущего ответа/неответа
+        time_now = time.perf_counter()
+        while self.in_flight:
+            seq, (comm, time_send, rto_key) = next(iter(self.in_flight.items()))
+            if time_now < max(time_send, self._answer_time) + self.rto.timeout(rto_key):
+                break
+            del self.in_flight[seq]
+            self._answer_time = time_now
+            self.rto.backoff(rto_key)
+            self.metrics.timeout()
+            self.lost_answers[seq] += 1
+            self.state = -3
+            self.nansw += 1
+            if self.debug:
+                self._print("Timeout error: seq <0x%02X> command <0x%02X>" % (seq, comm))
+
+    def get_metrics(self):
+        """
+        Снимок счетчиков транспорта: кадры и байты, ошибки CRC, отброшенные при поиске заголовка байты,
+        неответы, гистограммы задержки по командам, состояние очереди команд.
+        """
+        metrics = self.metrics.snapshot()
+        metrics.update({"crc_errors": self.parser.crc_errors,
+                        "resync_bytes": self.parser.resync_bytes,
+                        "overflow_bytes": self.parser.overflow_bytes,
+                        "nansw": self.nansw,
+                        "unexpected_answers": self.unexpected_answers,
+                        "out_of_order_answers": sum(self.out_of_order_answers.values()),
+                        "in_flight": len(self.in_flight),
+                        "queue": self.com_queue.get_metrics(),
+                        "rto": self.rto.get_stat()})
+        return metrics
+
     def get_log(self):
-        with self.log_lock:
-            log = copy.deepcopy(self.log_buffer)
-            self.log_buffer = []
-        return log
+        # записи обмена с прошлого вызова в виде строк
+        return [self.capture.format_record(record) for record in self.capture.drain()]
+
+
+class RTOEstimator:
+    """
+    Таймаут ответа по статистике времени запрос-ответ (как RTO в TCP, RFC 6298) отдельно для каждого ключа
+    (код команды, длина данных запроса): timeout = SRTT + max(G, k * RTTVAR) в пределах [rto_min, rto_max].
+    Запас G (granularity) не дает таймауту сжаться до SRTT на стабильной линии, где RTTVAR почти 0
+    и ответ теряется из-за джиттера планировщика ОС в доли миллисекунды.
+    После неответа таймаут по ключу удваивается до прихода следующего ответа.
+    """
+    def __init__(self, rto_init=0.5, rto_min=0.05, rto_max=0.5, alpha=1/8, beta=1/4, k=4, granularity=0.02,
+                 adaptive=True):
+        self.rto_init = rto_init
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.granularity = granularity
+        self.alpha = alpha
+        self.beta = beta
+        self.k = k
+        self.adaptive = adaptive
+        self.stat = {}  # {key: [srtt, rttvar, множитель отката, число измерений]}
+
+    def timeout(self, key):
+        stat = self.stat.get(key)
+        if not self.adaptive or stat is None:
+            return self.rto_init
+        rto = (stat[0] + max(self.granularity, self.k * stat[1])) * stat[2]
+        return min(max(rto, self.rto_min), self.rto_max)
+
+    def update(self, key, rtt):
+        stat = self.stat.get(key)
+        if stat is None:
+            self.stat[key] = [rtt, rtt / 2, 1, 1]
+        else:
+            stat[1] = (1 - self.beta) * stat[1] + self.beta * abs(stat[0] - rtt)
+            stat[0] = (1 - self.alpha) * stat[0] + self.alpha * rtt
+            stat[2] = 1
+            stat[3] += 1
+
+    def backoff(self, key):
+        stat = self.stat.get(key)
+        if stat is not None:
+            stat[2] = min(stat[2] * 2, 64)
+
+    def get_stat(self):
+        """
+        :return: {key: [srtt, rttvar, timeout, число измерений]}
+        """
+        return {key: [stat[0], stat[1], self.timeout(key), stat[3]] for key, stat in self.stat.items()}
+
+
+def find_ports(serial_numbers, debug_print=None):
+    """
+    Поиск COM-портов по серийным номерам преобразователей (совпадение подстроки) через общий индекс портов.
+
+    :return: генератор пар (серийный номер, имя устройства (COMx, /dev/ttyUSBx))
+    """
+    for serial_number in serial_numbers:
+        device = itb_ports.port_index.resolve(serial_number)
+        if debug_print:
+            debug_print("ID comparison:", serial_number, device)
+        if device is not None:
+            yield serial_number, device
 
 
 def get_time():
@@ -255,18 +430,28 @@ def bytes_array_to_str(bytes_array):
 
 
 if __name__ == "__main__":
-    itb_serial = ITBSerial(serial_numbers=["207733835048"], debug=True)
-    itb_serial.open_id()
+    # python itb_serial.py [серийный номер]: без серийного номера проверка выполняется на имитаторе ИТБ
+    import sys
+    if len(sys.argv) > 1:
+        sim = None
+        itb_serial = ITBSerial(serial_numbers=[sys.argv[1]], debug=True)
+        itb_serial.open_id()
+    else:
+        import itb_sim
+        sim = itb_sim.ITBSimulator(baudrate=9600)
+        itb_serial = ITBSerial(port=sim.port, debug=True)
+        itb_serial.open_port()
     # Проверка коанды зеркала
     itb_serial.request(req_type="mirror", data=[0, 1, 2, 3, 4])
     time.sleep(0.1)
-    # Проверка коанды set_channel_gpio
-    # itb_serial.request(req_type="set_channel_gpio", data=[0, 0, 1])
-    # time.sleep(0.5)
-    # itb_serial.request(req_type="set_channel_gpio", data=[0, 0, 0])
-    # time.sleep(0.5)
-    # itb_serial.request(req_type="set_channel_gpio", data=[0, 0, 1])
-    # time.sleep(0.5)
-    # itb_serial.request(req_type="set_channel_gpio", data=[0, 0, 0])
-    # time.sleep(0.5)
-    pass
+    # Проверка команд чтения
+    itb_serial.request(req_type="get_adc")
+    itb_serial.request(req_type="get_channel_data")
+    itb_serial.request(req_type="itb_param_read")
+    time.sleep(0.3)
+    while not itb_serial.answer_queue.empty():
+        comm, data = itb_serial.get_answer()
+        print("Answer <0x%02X>:" % comm, bytes_array_to_str(data))
+    itb_serial.close_id()
+    if sim:
+        sim.close()
@@ -0,0 +1,258 @@
+import os
+import sys
+import math
+import time
+import queue
+import random
+import threading
+import crc16
+
+
+class SimChannel:
+    """
+    Синтетический ток канала ИТБ.
+
+    waveform: "dc" - offset; "sine" - offset + amplitude*sin(2*pi*t/period); "step" - offset, а на второй
+    половине каждого периода offset + amplitude; "ramp" - пила от offset до offset + amplitude за период.
+    К току добавляется гауссов шум со СКО noise, к температуре - линейный дрейф temp_drift (°С/с).
+    """
+    def __init__(self, waveform="sine", offset=1E-9, amplitude=1E-9, period=10., noise=0., temperature=25.,
+                 temp_drift=0., zero=100):
+        self.waveform = waveform
+        self.offset = offset
+        self.amplitude = amplitude
+        self.period = period
+        self.noise = noise
+        self.temperature = temperature
+        self.temp_drift = temp_drift
+        self.zero = zero  # уровень нуля АЦП, кв.
+        self.random = random.Random()
+
+    def current(self, t):
+        phase = (t % self.period) / self.period
+        if self.waveform == "sine":
+            current = self.offset + self.amplitude * math.sin(2 * math.pi * phase)
+        elif self.waveform == "step":
+            current = self.offset + (self.amplitude if phase >= 0.5 else 0.)
+        elif self.waveform == "ramp":
+            current = self.offset + self.amplitude * phase
+        else:
+            current = self.offset
+        if self.noise:
+            current += self.random.gauss(0., self.noise)
+        return current
+
+    def get_temperature(self, t):
+        return self.temperature + self.temp_drift * t
+
+
+class ITBSimulator:
+    """
+    Имитатор ИТБ на псевдотерминале (только POSIX): принимает запросы в формате ITBSerial
+    и отвечает на команды 0x00-0x07. Имя порта для подключения - self.port.
+
+    Ответ: [0x00, адрес ИТБ, seq_num, cmd_type, cmd, длина, данные, CRC16 modbus (младшим байтом вперед)].
+    При заданном baudrate время передачи запроса и ответа (10 бит на байт) учитывается отдельно
+    для приема и передачи (полный дуплекс); delay - время обработки запроса, drop - вероятность не ответить.
+
+    Ток канала переводится в кванты с автовыбором КУ (индекс 0..3, усиление 10**КУ):
+    counts = (I - cal_b[КУ]) / cal_a[КУ], выбирается наибольший КУ, при котором |counts| < 30000.
+    Команда dbg_start [канал, КУ, zero] фиксирует КУ канала (с насыщением counts), measure_mode снимает фиксацию.
+    """
+    def __init__(self, **kw):
+        self.address = 1
+        self.channel_num = 2
+        self.channels = None
+        self.baudrate = None
+        self.delay = 0.
+        self.drop = 0.
+        self.seed = 1
+        self.cal_a = [1E-9 * 10 ** (3 - ku) for ku in range(4)]
+        self.cal_b = [0., 0., 0., 0.]
+        for key in sorted(kw):
+            if key == "address":
+                self.address = kw.pop(key)
+            elif key == "channel_num":
+                self.channel_num = kw.pop(key)
+            elif key == "channels":
+                self.channels = kw.pop(key)
+            elif key == "baudrate":
+                self.baudrate = kw.pop(key)
+            elif key == "delay":
+                self.delay = kw.pop(key)
+            elif key == "drop":
+                self.drop = kw.pop(key)
+            elif key == "seed":
+                self.seed = kw.pop(key)
+            elif key == "cal_a":
+                self.cal_a = kw.pop(key)
+            elif key == "cal_b":
+                self.cal_b = kw.pop(key)
+            else:
+                pass
+        if self.channels is None:
+            self.channels = [SimChannel(offset=1E-9 * 10 ** num) for num in range(self.channel_num)]
+        self.channel_num = len(self.channels)
+        self.random = random.Random(self.seed)
+        for num, channel in enumerate(self.channels):
+            channel.random.seed(self.seed + num + 1)
+        # состояние прибора
+        self.measure_mode = 0  # 0 - стоп, 1 - циклический, 2 - однократный
+        self.dac = [0, 0]  # мВ
+        self.param = [1000, 100]  # время измерения, мс; мертвое время, мс
+        self.dbg = [0, 0, 0]
+        self.forced_ku = {}  # {канал: КУ}, заданные dbg_start
+        self.adc_data = [0 for i in range(16)]
+        self.time_start = time.perf_counter()
+        # статистика
+        self.requests = 0
+        self.answers = 0
+        self.dropped = 0
+        self.crc_errors = 0
+        # псевдотерминал
+        self.master, self.slave = os.openpty()
+        self.port = os.ttyname(self.slave)
+        self._close_event = threading.Event()
+        self.tx_queue = queue.Queue()  # ответы с моментом окончания их передачи по линии
+        self.handlers = {0x00: self.cmd_mirror,
+                         0x01: self.cmd_get_adc,
+                         0x02: self.cmd_measure_mode,
+                         0x03: self.cmd_get_channel_data,
+                         0x04: self.cmd_dac_set,
+                         0x05: self.cmd_itb_param_write,
+                         0x06: self.cmd_itb_param_read,
+                         0x07: self.cmd_dbg_start}
+        self.rx_thread = threading.Thread(target=self.rx_thread_function, args=(), daemon=True)
+        self.rx_thread.start()
+        self.tx_thread = threading.Thread(target=self.tx_thread_function, args=(), daemon=True)
+        self.tx_thread.start()
+
+    def get_time(self):
+        return time.perf_counter() - self.time_start
+
+    # команды #
+    def cmd_mirror(self, data):
+        return data
+
+    def cmd_get_adc(self, data):
+        t = self.get_time()
+        # синтетическая телеметрия: медленно меняющиеся значения в квантах АЦП
+        self.adc_data = [(2048 + int(100 * math.sin(t / 10 + num)) + num * 16) & 0xFFFF for num in range(16)]
+        return b"".join([var.to_bytes(2, byteorder="big") for var in self.adc_data])
+
+    def cmd_measure_mode(self, data):
+        if data:
+            self.measure_mode = data[0]
+        self.forced_ku = {}
+        return data
+
+    def cmd_get_channel_data(self, data):
+        t = self.get_time()
+        answer = bytearray()
+        for num, channel in enumerate(self.channels):
+            current = channel.current(t)
+            ku, counts = 0, 0
+            for ku in range(3, -1, -1):
+                if num in self.forced_ku:
+                    ku = self.forced_ku[num]
+                counts = int(round((current - self.cal_b[ku]) / self.cal_a[ku]))
+                if abs(counts) < 30000 or num in self.forced_ku:
+                    break
+            counts = max(-32768, min(32767, counts))
+            temperature = max(-128, min(127, int(round(channel.get_temperature(t)))))
+            answer += bytes([ku, temperature & 0xFF])
+            answer += counts.to_bytes(2, byteorder="big", signed=True)
+            answer += max(-32768, min(32767, counts + channel.zero)).to_bytes(2, byteorder="big", signed=True)
+            answer += channel.zero.to_bytes(2, byteorder="big", signed=True)
+        return answer
+
+    def cmd_dac_set(self, data):
+        if len(data) >= 4:
+            self.dac = [int.from_bytes(data[0:2], byteorder="big"), int.from_bytes(data[2:4], byteorder="big")]
+        return data
+
+    def cmd_itb_param_write(self, data):
+        if len(data) >= 8:
+            self.param = [int.from_bytes(data[0:4], byteorder="big"), int.from_bytes(data[4:8], byteorder="big")]
+        return data
+
+    def cmd_itb_param_read(self, data):
+        return self.param[0].to_bytes(4, byteorder="big") + self.param[1].to_bytes(4, byteorder="big")
+
+    def cmd_dbg_start(self, data):
+        self.dbg = list(data[0:3])
+        if len(data) >= 2 and data[1] < len(self.cal_a):
+            self.forced_ku[data[0]] = data[1]
+        return data
+
+    # обмен #
+    def answer_form(self, request, data):
+        answer = bytearray([0x00, self.address, request[2], request[3], request[4], len(data)]) + bytes(data)
+        return answer + bytes(crc16.calc_modbus_crc16_bytes(answer))
+
+    def rx_thread_function(self):
+        buf = bytearray(b"")
+        rx_free = tx_free = time.perf_counter()  # моменты освобождения линий приема и передачи
+        while not self._close_event.is_set():
+            try:
+                buf += os.read(self.master, 1024)
+            except OSError:
+                return
+            time_read = time.perf_counter()
+            while len(buf) >= 8:
+                frame_len = buf[5] + 8
+                if len(buf) < frame_len:
+                    break
+                request = buf[:frame_len]
+                if crc16.calc(request, frame_len - 2) != ((request[-2] << 8) | request[-1]):
+                    # неверная CRC запроса: ищем следующий запрос к нашему адресу
+                    self.crc_errors += 1
+                    start = buf.find(bytes([self.address]), 1)
+                    del buf[:start if start > 0 else len(buf)]
+                    continue
+                del buf[:frame_len]
+                self.requests += 1
+                if request[0] != self.address:
+                    continue
+                handler = self.handlers.get(request[4], self.cmd_mirror)
+                answer = self.answer_form(request, handler(request[6:frame_len - 2]))
+                if self.baudrate:
+                    rx_free = max(rx_free, time_read) + frame_len * 10 / self.baudrate
+                    tx_free = max(tx_free, rx_free + self.delay) + len(answer) * 10 / self.baudrate
+                else:
+                    tx_free = time_read + self.delay
+                if self.random.random() < self.drop:
+                    self.dropped += 1
+                    continue
+                self.tx_queue.put([tx_free, answer])
+
+    def tx_thread_function(self):
+        while True:
+            time_send, answer = self.tx_queue.get()
+            if answer is None:
+                return
+            time.sleep(max(0., time_send - time.perf_counter()))
+            try:
+                os.write(self.master, answer)
+                self.answers += 1
+            except OSError:
+                return
+
+    def close(self):
+        self._close_event.set()
+        self.tx_queue.put([0, None])
+        os.close(self.master)
+        os.close(self.slave)
+
+
+if __name__ == "__main__":
+    # имитатор для ручной проверки клиента: python itb_sim.py [скорость]
+    sim = ITBSimulator(baudrate=int(sys.argv[1]) if len(sys.argv) > 1 else 9600,
+                       channels=[SimChannel(offset=1E-9 * 10 ** num, noise=1E-11) for num in range(4)])
+    print("ITB simulator port:", sim.port)
+    try:
+        while True:
+            time.sleep(1)
+            print("requests %d, answers %d" % (sim.requests, sim.answers))
+    except KeyboardInterrupt:
+        sim.close()
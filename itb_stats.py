@@ -0,0 +1,122 @@
+import math
+import collections
+import threading
+
+ku_num = 4  # число КУ (индексы cal_a/cal_b)
+
+
+class RunningStats:
+    """
+    Среднее, СКО, минимум и максимум ряда за все время по алгоритму Уэлфорда: O(1) на точку,
+    без хранения точек и пересчета.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.  # сумма квадратов отклонений от среднего
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def std(self):
+        # выборочное СКО
+        return math.sqrt(max(self.m2, 0.) / (self.count - 1)) if self.count > 1 else 0.
+
+    def snapshot(self):
+        return {"count": self.count,
+                "mean": self.mean,
+                "std": self.std(),
+                "min": self.min if self.min is not None else 0.,
+                "max": self.max if self.max is not None else 0.}
+
+
+class WindowStats(RunningStats):
+    """
+    Те же величины за последние length секунд: точки, вышедшие из окна, исключаются обратным шагом
+    Уэлфорда, минимум и максимум - по монотонным очередям (O(1) в среднем на точку).
+    """
+    def __init__(self, length=60.):
+        RunningStats.__init__(self)
+        self.length = length
+        self.points = collections.deque()  # (время, значение)
+        self.min_queue = collections.deque()  # возрастающие значения - кандидаты в минимум
+        self.max_queue = collections.deque()  # убывающие значения - кандидаты в максимум
+
+    def add(self, value, t=0.):
+        self.points.append((t, value))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        while self.min_queue and self.min_queue[-1][1] > value:
+            self.min_queue.pop()
+        self.min_queue.append((t, value))
+        while self.max_queue and self.max_queue[-1][1] < value:
+            self.max_queue.pop()
+        self.max_queue.append((t, value))
+        self.expire(t)
+
+    def expire(self, t):
+        while self.points and t - self.points[0][0] > self.length:
+            t_old, value = self.points.popleft()
+            if self.count == 1:
+                self.count, self.mean, self.m2 = 0, 0., 0.
+            else:
+                mean_old = self.mean
+                self.count -= 1
+                self.mean -= (value - mean_old) / self.count
+                self.m2 -= (value - mean_old) * (value - self.mean)
+            if self.min_queue and self.min_queue[0][0] <= t_old:
+                self.min_queue.popleft()
+            if self.max_queue and self.max_queue[0][0] <= t_old:
+                self.max_queue.popleft()
+        self.min = self.min_queue[0][1] if self.min_queue else None
+        self.max = self.max_queue[0][1] if self.max_queue else None
+
+
+class ChannelStats:
+    """
+    Статистика тока канала отдельно по каждому КУ: за все время и за скользящие окна windows (с).
+    add() вызывается потоком разбора, snapshot() - из любого потока.
+    """
+    def __init__(self, windows=(60.,)):
+        self.windows = list(windows)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.run = [RunningStats() for ku in range(ku_num)]
+            self.window = [[WindowStats(length) for length in self.windows] for ku in range(ku_num)]
+
+    def add(self, t, ku, current):
+        with self.lock:
+            self.run[ku].add(current)
+            for stats in self.window[ku]:
+                stats.add(current, t)
+
+    def snapshot(self, t=None):
+        """
+        :param t: текущее время (в шкале времени add), чтобы исключить из окон устаревшие точки без новых данных
+        :return: {КУ: {"run": {...}, "window": {длина окна: {...}}}} - только КУ с данными за все время
+        """
+        with self.lock:
+            result = {}
+            for ku in range(ku_num):
+                if not self.run[ku].count:
+                    continue
+                if t is not None:
+                    for stats in self.window[ku]:
+                        stats.expire(t)
+                result[ku] = {"run": self.run[ku].snapshot(),
+                              "window": {stats.length: stats.snapshot() for stats in self.window[ku]}}
+            return result
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import struct
+import bisect
+import threading
+import numpy
+
+meta_file_name = "meta.json"
+index_file_name = "index.bin"
+index_record = struct.Struct("<ddQQ")  # время первой и последней строки блока, номер первой строки, число строк
+
+# поля ITBChannel.data после времени (ITBChannel.data[1:])
+channel_fields = ["current", "temp", "adc_current", "adc_signal", "adc_zero", "ku"]
+
+
+def channels_fields(channel_num):
+    return ["time"] + ["ch%d_%s" % (num, field) for num in range(channel_num) for field in channel_fields]
+
+
+class ColumnStore:
+    """
+    Хранилище рядов измерений на диске: каталог с отдельным файлом на каждое поле (столбец, сырые значения dtype),
+    описанием meta.json и индексом блоков index.bin.
+
+    Строки накапливаются в памяти блоками по chunk_size и записываются на диск одним вызовом на столбец;
+    запись индекса блока (время первой и последней строки) выполняется после записи столбцов, поэтому
+    после аварийного завершения хранилище открывается с последнего полностью записанного блока.
+    Первое поле - время, строки добавляются в порядке его возрастания. Чтение диапазона времени - двоичный
+    поиск по индексу блоков и по столбцу времени (numpy.memmap), без просмотра файлов.
+
+    Пример:
+        store = ColumnStore("itb_store", fields=channels_fields(2))
+        store.append(row)
+        data = store.read(t_start, t_stop)  # {поле: numpy.ndarray}
+        store.close()
+    """
+    def __init__(self, path, fields=None, chunk_size=4096, dtype="<f8"):
+        self.path = path
+        self.lock = threading.Lock()
+        meta_path = os.path.join(path, meta_file_name)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as file:
+                meta = json.load(file)
+            if fields is not None and list(fields) != meta["fields"]:
+                raise ValueError("Store %s has fields %s" % (path, meta["fields"]))
+            fields, chunk_size, dtype = meta["fields"], meta["chunk_size"], meta["dtype"]
+        else:
+            if not fields:
+                raise ValueError("Store %s does not exist, fields are required" % path)
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, "w") as file:
+                json.dump({"fields": list(fields), "chunk_size": chunk_size, "dtype": numpy.dtype(dtype).str}, file)
+        self.fields = list(fields)
+        self.chunk_size = chunk_size
+        self.dtype = numpy.dtype(dtype)
+        # индекс блоков
+        self.chunks = self._read_index()  # [[время первой строки, время последней строки, первая строка, строк]]
+        # блоки, которые есть в индексе, но не целиком попали в столбцы (сбой до сброса кэша ОС на диск), отбрасываются:
+        # иначе truncate ниже дополнил бы столбцы нулями
+        rows_on_disk = min([self._column_rows(field) for field in self.fields])
+        while self.chunks and self.chunks[-1][2] + self.chunks[-1][3] > rows_on_disk:
+            self.chunks.pop()
+        self.chunk_times = [chunk[0] for chunk in self.chunks]
+        self.rows = self.chunks[-1][2] + self.chunks[-1][3] if self.chunks else 0  # строк на диске
+        # файлы столбцов: данные после последнего записанного блока отбрасываются
+        self.files = []
+        for field in self.fields:
+            file = open(self._column_path(field), "ab")
+            file.truncate(self.rows * self.dtype.itemsize)
+            self.files.append(file)
+        self.index_file = open(os.path.join(path, index_file_name), "ab")
+        self.index_file.truncate(len(self.chunks) * index_record.size)
+        self._maps = {}  # {поле: numpy.memmap} для чтения
+        # блок в памяти
+        self.chunk = numpy.zeros((len(self.fields), chunk_size), dtype=self.dtype)
+        self.chunk_rows = 0
+
+    def _column_path(self, field):
+        return os.path.join(self.path, field + ".bin")
+
+    def _column_rows(self, field):
+        try:
+            return os.path.getsize(self._column_path(field)) // self.dtype.itemsize
+        except OSError:
+            return 0
+
+    def _read_index(self):
+        chunks = []
+        try:
+            with open(os.path.join(self.path, index_file_name), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return chunks
+        for offset in range(0, len(data) - index_record.size + 1, index_record.size):
+            chunks.append(list(index_record.unpack_from(data, offset)))
+        return chunks
+
+    def __len__(self):
+        return self.rows + self.chunk_rows
+
+    def append(self, row):
+        """
+        :param row: значения всех полей строки, первое - время
+        """
+        with self.lock:
+            self.chunk[:, self.chunk_rows] = row
+            self.chunk_rows += 1
+            if self.chunk_rows >= self.chunk_size:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.chunk_rows:
+            return
+        for num, file in enumerate(self.files):
+            file.write(self.chunk[num, :self.chunk_rows].tobytes())
+            file.flush()
+        chunk = [float(self.chunk[0, 0]), float(self.chunk[0, self.chunk_rows - 1]), self.rows, self.chunk_rows]
+        self.index_file.write(index_record.pack(*chunk))
+        self.index_file.flush()
+        self.chunks.append(chunk)
+        self.chunk_times.append(chunk[0])
+        self.rows += self.chunk_rows
+        self.chunk_rows = 0
+
+    def _column(self, field):
+        # отображение столбца в память (пересоздается, если файл вырос)
+        if not self.rows:
+            return numpy.zeros(0, dtype=self.dtype)
+        column = self._maps.get(field)
+        if column is None or len(column) < self.rows:
+            column = numpy.memmap(self._column_path(field), dtype=self.dtype, mode="r", shape=(self.rows,))
+            self._maps[field] = column
+        return column[:self.rows]
+
+    def find(self, t_start, t_stop):
+        """
+        :return: (первая строка, строка после последней) строк на диске с временем в [t_start, t_stop]
+        """
+        if not self.rows:
+            return 0, 0
+        times = self._column(self.fields[0])
+        # блоки, в которых могут лежать границы диапазона; строки со временем t_start могут быть и в конце блока,
+        # предшествующего блокам, которые начинаются с t_start
+        chunk_start = max(0, bisect.bisect_left(self.chunk_times, t_start) - 1)
+        chunk_stop = bisect.bisect_right(self.chunk_times, t_stop)
+        row_start = self.chunks[chunk_start][2]
+        row_stop = self.chunks[chunk_stop - 1][2] + self.chunks[chunk_stop - 1][3] if chunk_stop else 0
+        start = row_start + int(numpy.searchsorted(times[row_start:row_stop], t_start, side="left"))
+        stop = row_start + int(numpy.searchsorted(times[row_start:row_stop], t_stop, side="right"))
+        return start, max(start, stop)
+
+    def read(self, t_start=-numpy.inf, t_stop=numpy.inf, fields=None):
+        """
+        Строки с временем в [t_start, t_stop], включая еще не записанные на диск.
+
+        :param fields: список полей (None - все поля)
+        :return: {поле: numpy.ndarray}; данные с диска - срезы numpy.memmap без копирования
+        """
+        fields = self.fields if fields is None else fields
+        with self.lock:
+            start, stop = self.find(t_start, t_stop)
+            result = {field: self._column(field)[start:stop] for field in fields}
+            if self.chunk_rows:
+                times = self.chunk[0, :self.chunk_rows]
+                chunk_start = int(numpy.searchsorted(times, t_start, side="left"))
+                chunk_stop = int(numpy.searchsorted(times, t_stop, side="right"))
+                if chunk_stop > chunk_start:
+                    for field in fields:
+                        chunk_data = self.chunk[self.fields.index(field), chunk_start:chunk_stop]
+                        result[field] = numpy.concatenate((result[field], chunk_data))
+        return result
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            for file in self.files:
+                file.close()
+            self.files = []
+            self.index_file.close()
+            self._maps = {}
+
+
+class StoreSink:
+    """
+    Приемник данных ITBData (ITBData.add_sink): после разбора каждого ответа get_channel_data добавляет
+    в хранилище строку с временем (time.time()) и данными всех каналов.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.time_offset = time.time() - time.perf_counter()  # время каналов - time.perf_counter()
+
+    def __call__(self, channels):
+        row = [channels[0].data[0] + self.time_offset]
+        for channel in channels:
+            row.extend(channel.data[1:])
+        self.store.append(row)
+
+    def close(self):
+        self.store.close()
@@ -7,6 +7,7 @@ import time
 import configparser
 import os
 import itb_data
+import itb_events
 import data_graph
 
 
@@ -22,6 +23,10 @@ class MainWindow(QtWidgets.QMainWindow, main_win.Ui_MainWindow):
         # класс для управления ДНТ
         self.itb = itb_data.ITBData(debug=True, serial_numbers=["207733835048"], baudrate=9600)
         self.reconnectPButt.clicked.connect(self.itb.serial.reconnect)
+        # состояние связи отображается по событию, в потоке интерфейса
+        self.itb.subscribe([itb_events.EVENT_LINK], self.link_state_changed, delivery=itb_events.DELIVERY_QT,
+                           max_len=10)
+        self.statusLEdit.setText(self.itb.serial.state_string[self.itb.serial.state])
         # график для отрисовки показаний
         self.graph_layout = data_graph.Layout(self.dataGView)
         self.dataGView.setLayout(self.graph_layout)
@@ -53,12 +58,15 @@ class MainWindow(QtWidgets.QMainWindow, main_win.Ui_MainWindow):
         self.dbgPButton.clicked.connect(self.dbg_start)
         # обновление gui
         self.channels_data_tables_init()
+        self.channels_stats_table_init()
         self.DataUpdateTimer = QtCore.QTimer()
         self.DataUpdateTimer.timeout.connect(self.update_ui)
         self.DataUpdateTimer.start(1000)
         # логи
         self.itb_log_file = None
         self.log_str = ""
+        self.ui_generation = -1  # снимок данных ITBData, уже выведенный в интерфейс
+        self.ui_channels_generation = -1
         self.recreate_log_files()
         self.logRestartPButt.clicked.connect(self.recreate_log_files)
 
@@ -75,8 +83,44 @@ class MainWindow(QtWidgets.QMainWindow, main_win.Ui_MainWindow):
                 self.channelDataTWidget.setColumnWidth(column, 80)
         self.channelDataTWidget.setRowHeight(self.channelDataTWidget.rowCount() - 1, 10)
 
+    def channels_stats_table_init(self):
+        # таблица статистики тока по каналам и КУ справа от таблицы данных каналов
+        self.stats_column_name = ["N", "Среднее, А", "СКО, А", "Мин., А", "Макс., А",
+                                  "Среднее (%.0f с), А" % self.itb.stats_windows[0],
+                                  "СКО (%.0f с), А" % self.itb.stats_windows[0]]
+        self.channelStatsTWidget = QtWidgets.QTableWidget(self.dataGBox)
+        self.channelStatsTWidget.setObjectName("channelStatsTWidget")
+        self.channelStatsTWidget.setMinimumSize(QtCore.QSize(400, 200))
+        self.channelStatsTWidget.setFont(self.channelDataTWidget.font())
+        self.channelStatsTWidget.setColumnCount(len(self.stats_column_name))
+        self.channelStatsTWidget.setHorizontalHeaderLabels(self.stats_column_name)
+        self.channelStatsTWidget.horizontalHeader().setDefaultSectionSize(90)
+        self.channelStatsTWidget.verticalHeader().setDefaultSectionSize(30)
+        self.gridLayout_3.addWidget(self.channelStatsTWidget, 1, 3, 4, 1)
+        self.statsResetPButt = QtWidgets.QPushButton("Сброс статистики", self.dataGBox)
+        self.statsResetPButt.clicked.connect(self.itb.reset_stats)
+        self.gridLayout_3.addWidget(self.statsResetPButt, 0, 3, 1, 1, Qt.AlignTop)
+
+    def channels_stats_table_refresh(self):
+        rows = []
+        for num, channel_stats in enumerate(self.itb.get_stats_snapshot()):
+            for ku, stats in sorted(channel_stats.items()):
+                window = stats["window"][self.itb.stats_windows[0]]
+                rows.append(["К%d КУ%d" % (num, 10 ** ku),
+                             [stats["run"]["count"], stats["run"]["mean"], stats["run"]["std"], stats["run"]["min"],
+                              stats["run"]["max"], window["mean"], window["std"]]])
+        self.channelStatsTWidget.setRowCount(len(rows))
+        self.channelStatsTWidget.setVerticalHeaderLabels([row[0] for row in rows])
+        for row, (name, values) in enumerate(rows):
+            for column, value in enumerate(values):
+                table_item = QtWidgets.QTableWidgetItem(("%d" % value) if column == 0 else ("%.4G" % value))
+                table_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.channelStatsTWidget.setItem(row, column, table_item)
+
     def reset_graph_data(self):
         self.itb.reset_channel_graph_data()
+        self.graph_layout.reset_time_range()
+        self.ui_channels_generation = -1
 
     def single_measurement(self):
         self.itb.cmd_start_measure(mode="single")
@@ -110,27 +154,43 @@ class MainWindow(QtWidgets.QMainWindow, main_win.Ui_MainWindow):
 
     def update_ui(self):
         try:
+            # один согласованный снимок данных на весь цикл обновления
+            snapshot = self.itb.get_snapshot()
+            channels_updated = snapshot.channels_generation != self.ui_channels_generation
+            self.ui_channels_generation = snapshot.channels_generation
             # заоплнение таблицы c данными
-            for row, channel in enumerate(self.itb.channels):
-                for column in range(len(channel.data_name)):
-                    table_item = QtWidgets.QTableWidgetItem("%.4G" % channel.data[column])
-                    table_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                    self.channelDataTWidget.setItem(row, column, table_item)
+            if channels_updated:
+                for row, channel_data in enumerate(snapshot.channels):
+                    for column in range(len(channel_data)):
+                        table_item = QtWidgets.QTableWidgetItem("%.4G" % channel_data[column])
+                        table_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                        self.channelDataTWidget.setItem(row, column, table_item)
+            self.channels_stats_table_refresh()
             # отрисовка графика
-            if self.itb.get_channels_redraw_status():
-                self.graph_layout.plot_channel_current(self.itb.get_channels_graph_data())
+            if channels_updated:
+                # вся история с прореживанием: по две точки (минимум и максимум) на пиксель ширины графика
+                # (или видимый после масштабирования диапазон времени)
+                points = 2 * max(100, self.graph_layout.canvas.width())
+                t_start, t_stop = self.graph_layout.get_time_range()
+                self.graph_layout.plot_channel_current(self.itb.get_channels_graph_data(points=points, t_start=t_start,
+                                                                                        t_stop=t_stop))
             # логи
-            log_str_tmp = self.itb.get_log_file_data()
+            if snapshot.generation == self.ui_generation:
+                log_str_tmp = self.log_str
+            else:
+                self.ui_generation = snapshot.generation
+                log_str_tmp = self.itb.get_log_file_data(snapshot)
             if self.log_str == log_str_tmp:
                 pass
             else:
                 self.log_str = log_str_tmp
                 self.itb_log_file.write(self.log_str + "\n")
-            # отображение состояния подключения
-            self.statusLEdit.setText(self.itb.serial.state_string[self.itb.serial.state])
         except Exception as error:
             print("update_ui: " + str(error))
 
+    def link_state_changed(self, event):
+        self.statusLEdit.setText(self.itb.serial.state_string[event.data])
+
     def dac_set(self):
         dac_ch_1 = self.dac1VoltageSBox.value() / 20.  # делим на 10 из-за усиления сигнала для ЦАП1
         dac_ch_2 = self.dac2VoltageSBox.value()
@@ -286,6 +346,7 @@ class MainWindow(QtWidgets.QMainWindow, main_win.Ui_MainWindow):
     def closeEvent(self, event):
         self.close_log_file(file=self.itb_log_file)
         self.save_main_cfg()
+        self.itb.close()
         self.close()
         pass
 
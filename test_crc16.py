@@ -0,0 +1,179 @@
+import re
+import random
+import unittest
+import numpy
+import crc16
+
+# Сверка crc16 с прежними (побайтными табличными) реализациями, которые служат эталоном.
+# Запуск: python -m unittest test_crc16 (или python -m pytest test_crc16.py)
+
+
+def legacy_calc(buf, buf_len, endian="big"):
+    crc = 0x1D0F
+    for i in range(buf_len):
+        if endian == "big":
+            first, second = (buf[i] >> 8) & 0x00FF, (buf[i] >> 0) & 0x00FF
+        else:
+            first, second = (buf[i] >> 0) & 0x00FF, (buf[i] >> 8) & 0x00FF
+        index = ((crc >> 8) & 0xFFFF) ^ first
+        crc = ((crc << 8) ^ (crc16.crc16tab[index])) & 0xFFFF
+        index = ((crc >> 8) & 0xFFFF) ^ second
+        crc = ((crc << 8) ^ (crc16.crc16tab[index])) & 0xFFFF
+    return crc
+
+
+def legacy_calc_str(buf_string, endian="big"):
+    pattern = re.compile(r"([A-F0-9]{4})")
+    data_int = [int(var, 16) for var in pattern.findall(buf_string.replace(" ", "").upper())]
+    return legacy_calc(data_int, len(data_int), endian=endian)
+
+
+def legacy_calc_bytes(buf, buf_len):
+    d = 1
+    crc = 0x1D0F
+    for i in range(buf_len):
+        index = ((crc >> 8) ^ buf[i + d]) & 0x00FF
+        crc = (crc << 8) ^ crc16.crc16tab[index]
+        crc &= 0xFFFF
+        d = -d
+    return crc
+
+
+def legacy_calc_modbus_crc16_bytes(data):
+    register = 0xFFFF
+    for byte in data:
+        register = (register >> 8) ^ crc16._CRC16TABLE[(register ^ byte) & 0xFF]
+    return [((register >> 0) & 0xFF), ((register >> 8) & 0xFF)]
+
+
+def legacy_modbus_crc16(bytes_data):
+    crc_list = legacy_calc_modbus_crc16_bytes(bytes_data)
+    return (crc_list[0] << 8) + crc_list[1]
+
+
+class TestCcitt(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(11)
+
+    def random_bytes(self, length):
+        return bytes(self.rnd.getrandbits(8) for i in range(length))
+
+    def test_calc_words(self):
+        for length in list(range(0, 20)) + [63, 64, 255]:
+            words = [self.rnd.getrandbits(16) for i in range(length)]
+            for endian in ("big", "little"):
+                self.assertEqual(crc16.calc(words, length, endian=endian), legacy_calc(words, length, endian=endian))
+                self.assertEqual(crc16.calc(words + [0x1234], length, endian=endian),
+                                 legacy_calc(words, length, endian=endian))
+
+    def test_calc_byte_inputs(self):
+        # байты запроса - слова со старшим байтом 0
+        for length in range(0, 40):
+            data = self.random_bytes(length)
+            for endian in ("big", "little"):
+                expected = legacy_calc(list(data), length, endian=endian)
+                for buf in (data, bytearray(data), memoryview(data), list(data)):
+                    self.assertEqual(crc16.calc(buf, length, endian=endian), expected)
+                self.assertEqual(crc16.calc(data + b"\xFF", length, endian=endian), expected)
+
+    def test_calc_to_list(self):
+        for length in range(0, 20):
+            data = list(self.random_bytes(length))
+            for endian in ("big", "little"):
+                crc = legacy_calc(data, length, endian=endian)
+                self.assertEqual(crc16.calc_to_list(data, length, endian=endian), [(crc >> 8) & 0xFF, crc & 0xFF])
+
+    def test_calc_str(self):
+        for length in range(0, 20):
+            words = [self.rnd.getrandbits(16) for i in range(length)]
+            for text in (" ".join(["%04X" % var for var in words]), "".join(["%04x" % var for var in words])):
+                for endian in ("big", "little"):
+                    self.assertEqual(crc16.calc_str(text, endian=endian), legacy_calc_str(text, endian=endian))
+
+    def test_calc_bytes(self):
+        for length in range(0, 40, 2):
+            data = self.random_bytes(length)
+            for buf in (data, bytearray(data), list(data)):
+                self.assertEqual(crc16.calc_bytes(buf, length), legacy_calc_bytes(data, length))
+        # нечетная длина: прежний расчет обращается к байту после последнего
+        data = self.random_bytes(16)
+        for length in range(1, 15, 2):
+            self.assertEqual(crc16.calc_bytes(data, length), legacy_calc_bytes(data, length))
+
+    def test_ccitt(self):
+        for length in range(0, 40, 2):
+            data = self.random_bytes(length)
+            # calc_bytes обрабатывает байты попарно в обратном порядке: для переставленных байт - прямой порядок
+            expected = legacy_calc_bytes(bytes(data[i ^ 1] for i in range(length)), length)
+            for buf in (data, bytearray(data), memoryview(data), list(data)):
+                self.assertEqual(crc16.ccitt(buf), expected)
+
+    def test_calc_check_batch(self):
+        frames, expected = [], []
+        for num in range(200):
+            data = list(self.random_bytes(self.rnd.randint(0, 30)))
+            crc = legacy_calc(data, len(data))
+            frame = data + [(crc >> 8) & 0xFF, crc & 0xFF]
+            valid = num % 3 != 0
+            if not valid:
+                frame[self.rnd.randrange(len(frame))] ^= 1 << self.rnd.randrange(8)
+                valid = legacy_calc(frame[:-2], len(frame) - 2) == ((frame[-2] << 8) | frame[-1])
+            frames.append(bytes(frame) if num % 2 else frame)
+            expected.append(valid)
+        frames.append(b"\x01")
+        expected.append(False)
+        self.assertEqual(crc16.calc_check_batch(frames).tolist(), expected)
+        self.assertEqual(crc16.calc_check_batch([]).tolist(), [])
+
+    def test_calc_rows(self):
+        for length in (0, 1, 6, 7, 40):
+            data = [self.random_bytes(length) for i in range(5)]
+            rows = numpy.frombuffer(b"".join(data), dtype=numpy.uint8).reshape(5, length)
+            self.assertEqual(crc16.calc_rows(rows).tolist(), [legacy_calc(list(var), length) for var in data])
+
+
+class TestModbus(unittest.TestCase):
+    def setUp(self):
+        self.rnd = random.Random(12)
+
+    def random_bytes(self, length):
+        return bytes(self.rnd.getrandbits(8) for i in range(length))
+
+    def test_modbus_crc16(self):
+        self.assertEqual(crc16.modbus_crc16([0x00, 0x01, 0xC1, 0x00, 0x01, 0x00]),
+                         legacy_modbus_crc16([0x00, 0x01, 0xC1, 0x00, 0x01, 0x00]))
+        for length in list(range(0, 40)) + [255, 256, 263]:
+            data = self.random_bytes(length)
+            expected = legacy_modbus_crc16(data)
+            for buf in (data, bytearray(data), memoryview(data), list(data), memoryview(b"\x55" + data)[1:]):
+                self.assertEqual(crc16.modbus_crc16(buf), expected)
+                self.assertEqual(crc16.calc_modbus_crc16_bytes(buf), legacy_calc_modbus_crc16_bytes(data))
+
+    def test_frame_with_crc(self):
+        # кадр вместе с его CRC (младшим байтом вперед) дает 0
+        for length in range(0, 40):
+            data = self.random_bytes(length)
+            frame = data + bytes(legacy_calc_modbus_crc16_bytes(data))
+            self.assertEqual(crc16.modbus_crc16(frame), 0)
+
+    def test_modbus_batch(self):
+        frames = [self.random_bytes(self.rnd.choice([0, 1, 7, 8, 9, 40, 41])) for i in range(300)]
+        frames = [frame if num % 3 else bytearray(frame) for num, frame in enumerate(frames)]
+        frames.append(memoryview(b"\x00" + bytes(frames[5]))[1:])
+        self.assertEqual(crc16.modbus_batch(frames).tolist(), [legacy_modbus_crc16(frame) for frame in frames])
+        self.assertEqual(crc16.modbus_batch([]).tolist(), [])
+
+    def test_modbus_check_batch(self):
+        frames, expected = [], []
+        for num in range(300):
+            data = self.random_bytes(self.rnd.randint(0, 40))
+            frame = bytearray(data + bytes(legacy_calc_modbus_crc16_bytes(data)))
+            if num % 4 == 0:
+                frame[self.rnd.randrange(len(frame))] ^= 1 << self.rnd.randrange(8)
+            frames.append(frame)
+            expected.append(legacy_modbus_crc16(frame) == 0)
+        self.assertEqual(crc16.modbus_check_batch(frames).tolist(), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
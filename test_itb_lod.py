@@ -0,0 +1,122 @@
+import unittest
+import numpy
+import itb_lod
+
+# Пирамида минимумов/максимумов MinMaxPyramid: прореживание, сохранение выбросов, ограничение истории max_len.
+# Запуск: python -m unittest test_itb_lod (или python -m pytest test_itb_lod.py)
+
+
+def rebuilt(pyramid):
+    # пирамида, заново построенная по точкам, оставшимся в истории
+    fresh = itb_lod.MinMaxPyramid(factor=pyramid.factor)
+    fresh.extend(pyramid.times[:pyramid.count], pyramid.values[:pyramid.count])
+    return fresh
+
+
+class TestMinMaxPyramid(unittest.TestCase):
+    def setUp(self):
+        self.rnd = numpy.random.RandomState(18)
+
+    def series(self, n):
+        times = numpy.cumsum(self.rnd.uniform(0.5, 1.5, n))
+        values = self.rnd.normal(size=n)
+        # выбросы, которые должны попасть в любое прореживание
+        values[self.rnd.randint(n, size=5)] = self.rnd.choice([-100., 100.], size=5)
+        return times, values
+
+    def check_query(self, pyramid, times, values, t_start, t_stop, points):
+        result_times, result_values = pyramid.query(t_start, t_stop, points=points)
+        mask = numpy.ones(len(times), dtype=bool)
+        if t_start is not None:
+            mask &= times >= t_start
+        if t_stop is not None:
+            mask &= times <= t_stop
+        in_range = mask.sum()
+        if in_range <= points:
+            numpy.testing.assert_array_equal(result_times, times[mask])
+            numpy.testing.assert_array_equal(result_values, values[mask])
+            return
+        self.assertGreaterEqual(len(result_times), points // 2)
+        self.assertLessEqual(len(result_times), points)
+        self.assertTrue(numpy.all(numpy.diff(result_times) >= 0))
+        self.assertGreaterEqual(result_times[0], times[mask][0])
+        self.assertLessEqual(result_times[-1], times[mask][-1])
+        # каждая точка результата - исходная точка диапазона
+        index = numpy.searchsorted(times, result_times)
+        numpy.testing.assert_array_equal(times[index], result_times)
+        numpy.testing.assert_array_equal(values[index], result_values)
+        self.assertEqual(result_values.max(), values[mask].max())
+        self.assertEqual(result_values.min(), values[mask].min())
+
+    def test_small(self):
+        pyramid = itb_lod.MinMaxPyramid()
+        self.assertEqual([len(var) for var in pyramid.query()], [0, 0])
+        for t in range(10):
+            pyramid.append(float(t), float(-t))
+        times, values = pyramid.query(points=100)
+        numpy.testing.assert_array_equal(times, numpy.arange(10.))
+        numpy.testing.assert_array_equal(values, -numpy.arange(10.))
+        self.assertEqual([len(var) for var in pyramid.query(20., 30.)], [0, 0])
+
+    def test_query(self):
+        times, values = self.series(100000)
+        for factor in (2, 4, 7):
+            pyramid = itb_lod.MinMaxPyramid(factor=factor, capacity=16)
+            # добавление частями разного размера, запрос между частями
+            pos = 0
+            for size in (1, 5, 1000, 3, 40000, 58991):
+                pyramid.extend(times[pos:pos + size], values[pos:pos + size])
+                pos += size
+                self.check_query(pyramid, times[:pos], values[:pos], None, None, 500)
+            for points in (10, 100, 1000, 1001, 5000):
+                self.check_query(pyramid, times, values, None, None, points)
+            for t_start, t_stop in ((1000., 2000.), (times[17], times[-3]), (10., 40000.), (times[-50], None),
+                                    (None, times[333])):
+                self.check_query(pyramid, times, values, t_start, t_stop, 300)
+
+    def test_append_matches_extend(self):
+        times, values = self.series(5000)
+        appended = itb_lod.MinMaxPyramid()
+        for t, value in zip(times, values):
+            appended.append(t, value)
+        extended = itb_lod.MinMaxPyramid()
+        extended.extend(times, values)
+        for points in (50, 400):
+            for result, expected in zip(appended.query(points=points), extended.query(points=points)):
+                numpy.testing.assert_array_equal(result, expected)
+
+    def test_max_len(self):
+        times, values = self.series(50000)
+        for factor in (2, 4):
+            pyramid = itb_lod.MinMaxPyramid(factor=factor, capacity=64, max_len=3000)
+            pos = 0
+            for step, size in enumerate((1, 700, 1, 2000, 13, 1499, 999, 1, 3000)):
+                # запросы между добавлениями строят уровни, которые затем сдвигаются при отбрасывании
+                if step % 2:
+                    for t, value in zip(times[pos:pos + size], values[pos:pos + size]):
+                        pyramid.append(t, value)
+                else:
+                    pyramid.extend(times[pos:pos + size], values[pos:pos + size])
+                pos += size
+                pyramid.query(points=100)
+                self.assertLessEqual(len(pyramid), 3000)
+                self.assertLessEqual(len(pyramid.times), 3000)
+                # остаются последние точки
+                kept = pyramid.count
+                numpy.testing.assert_array_equal(pyramid.times[:kept], times[pos - kept:pos])
+                # уровни после сдвига совпадают с уровнями, построенными заново
+                fresh = rebuilt(pyramid)
+                for points in (50, 300, 1000):
+                    for result, expected in zip(pyramid.query(points=points), fresh.query(points=points)):
+                        numpy.testing.assert_array_equal(result, expected)
+                self.check_query(pyramid, times[pos - kept:pos], values[pos - kept:pos], None, None, 200)
+
+    def test_clear(self):
+        pyramid = itb_lod.MinMaxPyramid()
+        times, values = self.series(1000)
+        pyramid.extend(times, values)
+        pyramid.query(points=10)
+        pyramid.clear()
+        self.assertEqual(len(pyramid), 0)
+        pyramid.extend(times[:5], values[:5])
+        numpy.testing.assert_array_equal(pyramid.query()[1], values[:5])
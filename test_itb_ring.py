@@ -0,0 +1,68 @@
+import collections
+import unittest
+import numpy
+import itb_ring
+
+# Кольцевой буфер RingBuffer: сверка с collections.deque той же емкости.
+# Запуск: python -m unittest test_itb_ring (или python -m pytest test_itb_ring.py)
+
+
+class TestRingBuffer(unittest.TestCase):
+    def check(self, ring, reference):
+        expected = numpy.array(list(reference), dtype=float).reshape(-1, ring.fields).T
+        self.assertEqual(len(ring), len(reference))
+        numpy.testing.assert_array_equal(ring.view(), expected)
+        for n in (0, 1, len(reference) // 2, len(reference), len(reference) + 5):
+            numpy.testing.assert_array_equal(ring.view(n=n), expected[:, expected.shape[1] - min(n, len(reference)):])
+        for field in range(ring.fields):
+            numpy.testing.assert_array_equal(ring.view(field=field), expected[field])
+
+    def test_append(self):
+        ring = itb_ring.RingBuffer(fields=2, capacity=5)
+        reference = collections.deque(maxlen=5)
+        self.check(ring, reference)
+        for i in range(13):
+            ring.append([i, -i])
+            reference.append([i, -i])
+            self.check(ring, reference)
+        self.assertEqual(ring.appended, 13)
+
+    def test_extend(self):
+        rnd = numpy.random.RandomState(16)
+        ring = itb_ring.RingBuffer(fields=3, capacity=7)
+        reference = collections.deque(maxlen=7)
+        counter = 0
+        # пачки меньше, равные и больше емкости, с переходом через конец буфера
+        for rows_num in (0, 1, 3, 7, 2, 10, 6, 15, 1):
+            rows = counter + numpy.arange(3 * rows_num).reshape(rows_num, 3)
+            counter += 3 * rows_num
+            ring.extend(rows.T)
+            reference.extend(rows.tolist())
+            self.check(ring, reference)
+        self.assertEqual(ring.appended, 45)
+        # смешанные append и extend
+        for i in range(20):
+            if rnd.randint(2):
+                ring.append([i, i, i])
+                reference.append([i, i, i])
+            else:
+                rows = numpy.full((3, i % 9), i, dtype=float)
+                ring.extend(rows)
+                reference.extend(rows.T.tolist())
+            self.check(ring, reference)
+
+    def test_view_read_only(self):
+        ring = itb_ring.RingBuffer(fields=1, capacity=3)
+        ring.append([1.])
+        with self.assertRaises(ValueError):
+            ring.view(field=0)[0] = 2.
+        self.assertEqual(ring.buffer[0, 0], 1.)
+
+    def test_clear(self):
+        ring = itb_ring.RingBuffer(fields=1, capacity=4)
+        ring.extend([[1., 2., 3.]])
+        ring.clear()
+        self.assertEqual(len(ring), 0)
+        self.assertEqual(ring.view().shape, (1, 0))
+        ring.append([5.])
+        numpy.testing.assert_array_equal(ring.view(field=0), [5.])
@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+import itb_scheduler
+
+# Очередь команд CommandScheduler: приоритеты, объединение одинаковых запросов чтения, переполнение.
+# Запуск: python -m unittest test_itb_scheduler (или python -m pytest test_itb_scheduler.py)
+
+
+def drain(scheduler):
+    commands = []
+    command = scheduler.get(timeout=0)
+    while command is not None:
+        commands.append(command)
+        command = scheduler.get(timeout=0)
+    return commands
+
+
+class TestCommandScheduler(unittest.TestCase):
+    def test_priorities(self):
+        scheduler = itb_scheduler.CommandScheduler()
+        scheduler.put(0x01, priority=itb_scheduler.PRIORITY_BACKGROUND)
+        scheduler.put(0x03)
+        scheduler.put(0x00, [1])
+        scheduler.put(0x02, [1])
+        scheduler.put(0x04, [0, 0, 0, 0])
+        # управление - раньше чтения, фоновый опрос - последним; внутри класса - по порядку постановки
+        self.assertEqual([cmd for cmd, data in drain(scheduler)], [0x02, 0x04, 0x03, 0x00, 0x01])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_coalescing(self):
+        scheduler = itb_scheduler.CommandScheduler()
+        self.assertTrue(scheduler.put(0x03))
+        self.assertFalse(scheduler.put(0x03))
+        # запросы с данными (зеркало) и управление не объединяются
+        self.assertTrue(scheduler.put(0x00, [1]))
+        self.assertTrue(scheduler.put(0x00, [1]))
+        self.assertTrue(scheduler.put(0x02, [1]))
+        self.assertTrue(scheduler.put(0x02, [1]))
+        # свой ключ - отдельный запрос
+        self.assertTrue(scheduler.put(0x03, key=("calibration", 0)))
+        self.assertFalse(scheduler.put(0x03, key=("calibration", 0)))
+        self.assertEqual(len(scheduler), 6)
+        self.assertEqual(scheduler.get_metrics()["coalesced"], 2)
+        # после извлечения тот же запрос снова ставится в очередь
+        drain(scheduler)
+        self.assertTrue(scheduler.put(0x03))
+
+    def test_drop_oldest(self):
+        scheduler = itb_scheduler.CommandScheduler(max_len=3, overflow="drop_oldest")
+        scheduler.put(0x03)
+        for i in range(4):
+            scheduler.put(0x00, [i])
+        self.assertEqual(drain(scheduler), [(0x00, [1]), (0x00, [2]), (0x00, [3])])
+        self.assertEqual(scheduler.get_metrics()["dropped"], 2)
+        # ключ отброшенной команды освобожден: тот же запрос снова ставится в очередь
+        self.assertTrue(scheduler.put(0x03))
+
+    def test_drop_new(self):
+        scheduler = itb_scheduler.CommandScheduler(max_len=2, overflow="drop_new")
+        self.assertTrue(scheduler.put(0x00, [0]))
+        self.assertTrue(scheduler.put(0x00, [1]))
+        self.assertFalse(scheduler.put(0x00, [2]))
+        self.assertEqual(drain(scheduler), [(0x00, [0]), (0x00, [1])])
+
+    def test_control_never_dropped(self):
+        scheduler = itb_scheduler.CommandScheduler(max_len=2)
+        for i in range(10):
+            self.assertTrue(scheduler.put(0x04, [i, 0, 0, 0]))
+        self.assertEqual(len(drain(scheduler)), 10)
+        self.assertEqual(scheduler.get_metrics()["dropped"], 0)
+
+    def test_get_wait(self):
+        scheduler = itb_scheduler.CommandScheduler()
+        time_start = time.perf_counter()
+        self.assertIsNone(scheduler.get(timeout=0.05))
+        self.assertGreaterEqual(time.perf_counter() - time_start, 0.04)
+        timer = threading.Timer(0.05, scheduler.put, args=(0x03,))
+        timer.start()
+        self.assertEqual(scheduler.get(timeout=2.), (0x03, None))
+        timer.join()
+
+    def test_clear(self):
+        scheduler = itb_scheduler.CommandScheduler()
+        scheduler.put(0x03)
+        scheduler.put(0x02, [0])
+        scheduler.clear()
+        self.assertEqual(len(scheduler), 0)
+        self.assertTrue(scheduler.put(0x03))
@@ -0,0 +1,181 @@
+import os
+import time
+import unittest
+import itb_serial
+
+# Транспорт ITBSerial: оценка таймаута ответа и обмен с имитатором ИТБ (itb_sim, псевдотерминал - только POSIX).
+# Запуск: python -m unittest test_itb_serial (или python -m pytest test_itb_serial.py)
+
+
+class TestRTOEstimator(unittest.TestCase):
+    def test_initial_timeout(self):
+        rto = itb_serial.RTOEstimator(rto_init=0.5, rto_min=0.05, rto_max=0.5)
+        self.assertEqual(rto.timeout((3, 0)), 0.5)
+        rto = itb_serial.RTOEstimator(rto_init=0.5, adaptive=False)
+        rto.update((3, 0), 0.01)
+        self.assertEqual(rto.timeout((3, 0)), 0.5)
+
+    def test_granularity_on_stable_link(self):
+        # при неизменном RTT RTTVAR стремится к 0, таймаут остается не меньше SRTT + granularity
+        rto = itb_serial.RTOEstimator(rto_init=0.5, rto_min=0.01, rto_max=0.5, granularity=0.02)
+        for i in range(300):
+            rto.update((3, 0), 0.050)
+        self.assertAlmostEqual(rto.timeout((3, 0)), 0.070, places=6)
+
+    def test_variance_and_bounds(self):
+        rto = itb_serial.RTOEstimator(rto_init=0.5, rto_min=0.05, rto_max=0.5, granularity=0.)
+        rto.update((3, 0), 0.1)
+        # первое измерение: SRTT = RTT, RTTVAR = RTT / 2
+        self.assertAlmostEqual(rto.timeout((3, 0)), 0.3)
+        rto = itb_serial.RTOEstimator(rto_init=0.5, rto_min=0.05, rto_max=0.5, granularity=0.)
+        for i in range(300):
+            rto.update((0, 1), 0.001)
+        self.assertEqual(rto.timeout((0, 1)), 0.05)
+
+    def test_backoff(self):
+        rto = itb_serial.RTOEstimator(rto_init=0.5, rto_min=0.01, rto_max=10., granularity=0.02)
+        for i in range(100):
+            rto.update((3, 0), 0.05)
+        timeout = rto.timeout((3, 0))
+        rto.backoff((3, 0))
+        self.assertAlmostEqual(rto.timeout((3, 0)), 2 * timeout)
+        rto.backoff((3, 0))
+        self.assertAlmostEqual(rto.timeout((3, 0)), 4 * timeout)
+        rto.update((3, 0), 0.05)
+        self.assertLess(rto.timeout((3, 0)), 2 * timeout)
+        # откат по неизвестному ключу не создает статистику
+        rto.backoff((1, 0))
+        self.assertEqual(rto.timeout((1, 0)), 0.5)
+
+    def test_min_not_below_read_timeout(self):
+        itb = itb_serial.ITBSerial(timeout=0.08, read_timeout_min=0.05)
+        try:
+            self.assertEqual(itb.rto.rto_min, 0.08)
+        finally:
+            itb._close_event.set()
+
+
+class TestAnswerMatching(unittest.TestCase):
+    # сопоставление ответов с запросами в окне без открытого порта: in_flight заполняется вручную
+    def setUp(self):
+        self.itb = itb_serial.ITBSerial()
+
+    def tearDown(self):
+        self.itb._close_event.set()
+
+    def send(self, seq, cmd, time_send=None):
+        self.itb.in_flight[seq] = [cmd, time.perf_counter() if time_send is None else time_send, (cmd, 0)]
+
+    def test_in_order(self):
+        self.send(5, 0x03)
+        self.send(6, 0x01)
+        self.itb.check_answer(5, 0x03, b"\x01")
+        self.itb.check_answer(6, 0x01, b"\x02")
+        self.assertEqual([self.itb.get_answer(timeout=0), self.itb.get_answer(timeout=0)],
+                         [(0x03, b"\x01"), (0x01, b"\x02")])
+        self.assertEqual(len(self.itb.in_flight), 0)
+        self.assertEqual(sum(self.itb.out_of_order_answers.values()), 0)
+        self.assertEqual(self.itb.state, 1)
+
+    def test_out_of_order(self):
+        self.send(5, 0x03)
+        self.send(6, 0x03)
+        self.itb.check_answer(6, 0x03, b"")
+        self.assertEqual(self.itb.out_of_order_answers[6], 1)
+        self.assertEqual(list(self.itb.in_flight), [5])
+        self.itb.check_answer(5, 0x03, b"")
+        self.assertEqual(sum(self.itb.out_of_order_answers.values()), 1)
+        self.assertEqual(len(self.itb.in_flight), 0)
+
+    def test_unexpected(self):
+        self.send(5, 0x03)
+        self.itb.check_answer(7, 0x03, b"")
+        # верный номер, другая команда: запрос остается в окне
+        self.itb.check_answer(5, 0x01, b"")
+        self.assertEqual(self.itb.unexpected_answers, 2)
+        self.assertEqual(list(self.itb.in_flight), [5])
+        self.assertIsNone(self.itb.get_answer(timeout=0))
+
+    def test_timeout_of_oldest_only(self):
+        # таймаут следующего запроса отсчитывается от неответа на предыдущий, а не от отправки
+        time_send = time.perf_counter() - 2 * self.itb.read_timeout
+        self.send(5, 0x03, time_send)
+        self.send(6, 0x03, time_send)
+        self.itb.check_answer_timeouts()
+        self.assertEqual(list(self.itb.in_flight), [6])
+        self.assertEqual(self.itb.lost_answers[5], 1)
+        self.assertEqual(self.itb.nansw, 1)
+        self.assertEqual(self.itb.state, -3)
+
+    def test_seq_wrap(self):
+        self.itb.seq_num = 255
+        self.assertEqual(self.itb.data_to_send_form(cmd=0x03)[2], 0xFF)
+        self.assertEqual(self.itb.data_to_send_form(cmd=0x03)[2], 0x00)
+
+
+@unittest.skipUnless(os.name == "posix", "имитатор ИТБ работает на псевдотерминале")
+class TestSimulatorLink(unittest.TestCase):
+    def setUp(self):
+        import itb_sim
+        self.sim = itb_sim.ITBSimulator(baudrate=9600, channel_num=4)
+        self.itb = itb_serial.ITBSerial(port=self.sim.port, baudrate=9600)
+        self.assertTrue(self.itb.open_port())
+
+    def tearDown(self):
+        self.itb.close_id()
+        self.itb._close_event.set()
+        self.itb.read_write_thread.join(1.)
+        self.sim.close()
+
+    def exchange(self, req_type, requests_num):
+        answers = []
+        for i in range(requests_num):
+            self.itb.request(req_type=req_type)
+            while len(answers) + self.itb.nansw <= i:
+                answer = self.itb.get_answer(timeout=0.01)
+                if answer is not None:
+                    answers.append(answer)
+        time.sleep(0.2)
+        answer = self.itb.get_answer(timeout=0.)
+        while answer is not None:
+            answers.append(answer)
+            answer = self.itb.get_answer(timeout=0.)
+        return answers
+
+    def test_no_losses_with_adaptive_timeout(self):
+        # чистая линия: адаптивный таймаут не должен терять ответы из-за джиттера времени ответа
+        answers = self.exchange("get_channel_data", 150)
+        self.assertEqual(len(answers), 150)
+        self.assertEqual(self.itb.nansw, 0)
+        self.assertEqual(self.itb.unexpected_answers, 0)
+        self.assertTrue(all(cmd == 0x03 and len(data) == 4 * 8 for cmd, data in answers))
+
+    def test_window(self):
+        # окно из 4 запросов: ответы приходят по порядку и сопоставляются со своими запросами
+        self.itb.window = 4
+        self.itb.com_queue.max_len = 100
+        for i in range(100):
+            self.itb.request(req_type="mirror", data=[i])
+        answers = []
+        time_stop = time.perf_counter() + 10.
+        while len(answers) + self.itb.nansw < 100 and time.perf_counter() < time_stop:
+            answer = self.itb.get_answer(timeout=0.1)
+            if answer is not None:
+                answers.append(answer)
+        self.assertEqual(answers, [(0x00, bytes([i])) for i in range(100)])
+        self.assertEqual(self.itb.nansw, 0)
+        self.assertEqual(self.itb.unexpected_answers, 0)
+        self.assertEqual(sum(self.itb.out_of_order_answers.values()), 0)
+
+    def test_dropped_answers_counted(self):
+        # неответ учитывается один раз, после него таймаут по ключу снова сходится к статистике RTT
+        self.exchange("get_channel_data", 20)
+        self.sim.drop = 0.2
+        answers = self.exchange("get_channel_data", 60)
+        self.assertEqual(len(answers) + self.itb.nansw, 60)
+        self.assertEqual(self.itb.nansw, self.sim.dropped)
+        self.assertEqual(self.itb.unexpected_answers, 0)
+        self.sim.drop = 0.
+        self.exchange("get_channel_data", 5)
+        srtt, rttvar, timeout, count = self.itb.rto.get_stat()[(0x03, 0)]
+        self.assertLess(timeout, self.itb.read_timeout)
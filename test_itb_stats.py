@@ -0,0 +1,91 @@
+import unittest
+import numpy
+import itb_stats
+
+# Статистика по алгоритму Уэлфорда: RunningStats, WindowStats (скользящее окно) и ChannelStats (по КУ),
+# сверка с numpy по тем же точкам.
+# Запуск: python -m unittest test_itb_stats (или python -m pytest test_itb_stats.py)
+
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.rnd = numpy.random.RandomState(19)
+
+    def check(self, stats, values):
+        values = numpy.asarray(values, dtype=float)
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot["count"], len(values))
+        if not len(values):
+            self.assertEqual((snapshot["mean"], snapshot["std"], snapshot["min"], snapshot["max"]), (0., 0., 0., 0.))
+            return
+        scale = max(1., numpy.abs(values).max())
+        self.assertAlmostEqual(snapshot["mean"] / scale, values.mean() / scale, places=9)
+        std = values.std(ddof=1) if len(values) > 1 else 0.
+        self.assertAlmostEqual(snapshot["std"] / scale, std / scale, places=6)
+        self.assertEqual(snapshot["min"], values.min())
+        self.assertEqual(snapshot["max"], values.max())
+
+    def test_running(self):
+        stats = itb_stats.RunningStats()
+        self.check(stats, [])
+        values = 1e3 + self.rnd.normal(scale=5., size=5000)  # большое среднее при малом разбросе
+        for num, value in enumerate(values):
+            stats.add(value)
+            if num in (0, 1, 2, 100, 4999):
+                self.check(stats, values[:num + 1])
+
+    def test_window(self):
+        stats = itb_stats.WindowStats(length=10.)
+        self.check(stats, [])
+        times = numpy.cumsum(self.rnd.uniform(0., 0.5, 3000))
+        times[500:510] = times[500]  # точки с одинаковым временем выходят из окна вместе
+        times[510:] += times[500] - times[510]
+        values = self.rnd.normal(size=3000)
+        values[::97] = 50.  # выбросы, после выхода которых из окна максимум должен уменьшиться
+        values[1000:1200] = numpy.linspace(5., -5., 200)  # монотонный участок для очередей минимума/максимума
+        for num, (t, value) in enumerate(zip(times, values)):
+            stats.add(value, t)
+            mask = (times[:num + 1] >= t - 10.)
+            if num % 37 == 0 or 495 <= num <= 515:
+                self.check(stats, values[:num + 1][mask])
+        # без новых точек окно пустеет по времени
+        stats.expire(times[-1] + 5.)
+        self.check(stats, values[times >= times[-1] - 5.])
+        stats.expire(times[-1] + 100.)
+        self.check(stats, [])
+        stats.add(3., times[-1] + 101.)
+        self.check(stats, [3.])
+
+    def test_channel_stats(self):
+        stats = itb_stats.ChannelStats(windows=(5., 50.))
+        self.assertEqual(stats.snapshot(), {})
+        times = numpy.arange(200.)
+        kus = self.rnd.choice([0, 2, 3], size=200)
+        currents = self.rnd.normal(loc=kus * 10., size=200)
+        for t, ku, current in zip(times, kus, currents):
+            stats.add(t, int(ku), current)
+        self.assertEqual(sorted(stats.snapshot()), [0, 2, 3])
+        # окно КУ обновляется только его точками: текущее время исключает точки, вышедшие из окна с тех пор
+        snapshot = stats.snapshot(t=times[-1])
+        for ku in (0, 2, 3):
+            mask = kus == ku
+            self.assertEqual(snapshot[ku]["run"]["count"], mask.sum())
+            self.assertAlmostEqual(snapshot[ku]["run"]["mean"], currents[mask].mean(), places=9)
+            self.assertAlmostEqual(snapshot[ku]["run"]["std"], currents[mask].std(ddof=1), places=9)
+            for length in (5., 50.):
+                window = mask & (times >= times[-1] - length)
+                self.assertEqual(snapshot[ku]["window"][length]["count"], window.sum())
+                if window.sum():
+                    self.assertAlmostEqual(snapshot[ku]["window"][length]["mean"], currents[window].mean(), places=9)
+                    self.assertEqual(snapshot[ku]["window"][length]["max"], currents[window].max())
+        # snapshot с текущим временем исключает из окон устаревшие точки, статистика за все время остается
+        snapshot = stats.snapshot(t=times[-1] + 60.)
+        for ku in (0, 2, 3):
+            self.assertEqual(snapshot[ku]["window"][50.]["count"], 0)
+            self.assertEqual(snapshot[ku]["run"]["count"], (kus == ku).sum())
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
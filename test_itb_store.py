@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import itb_store
+
+# Хранилище ColumnStore: запись и чтение диапазонов времени, восстановление после аварийного завершения.
+# Запуск: python -m unittest test_itb_store (или python -m pytest test_itb_store.py)
+
+
+class TestColumnStore(unittest.TestCase):
+    fields = ["time", "a", "b"]
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), "store")
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.path))
+
+    def rows(self, times):
+        return [[t, 2 * t, -t] for t in times]
+
+    def fill(self, store, times):
+        for row in self.rows(times):
+            store.append(row)
+
+    def check_read(self, store, times, t_start, t_stop):
+        times = numpy.asarray(times, dtype=float)
+        expected = times[(times >= t_start) & (times <= t_stop)]
+        data = store.read(t_start, t_stop)
+        numpy.testing.assert_array_equal(data["time"], expected)
+        numpy.testing.assert_array_equal(data["a"], 2 * expected)
+        numpy.testing.assert_array_equal(data["b"], -expected)
+
+    def test_read_ranges(self):
+        store = itb_store.ColumnStore(self.path, fields=self.fields, chunk_size=4)
+        times = numpy.arange(0., 23.) / 2
+        self.fill(store, times)
+        # 5 блоков на диске и 3 строки в памяти
+        self.assertEqual((store.rows, store.chunk_rows, len(store)), (20, 3, 23))
+        for t_start, t_stop in ((-1., 100.), (0., 0.), (1.5, 1.5), (1.6, 1.9), (1.75, 9.25), (3., 11.), (9.5, 11.),
+                                (10.5, 10.5), (20., 30.), (-5., -1.), (5., 2.)):
+            self.check_read(store, times, t_start, t_stop)
+        self.assertEqual(list(store.read(fields=["b"])), ["b"])
+        store.close()
+        store = itb_store.ColumnStore(self.path)
+        self.assertEqual(store.fields, self.fields)
+        self.check_read(store, times, 2., 7.)
+        store.close()
+
+    def test_equal_times_across_chunks(self):
+        # одинаковое время на границе блоков: строки с t_start в конце предыдущего блока не теряются
+        store = itb_store.ColumnStore(self.path, fields=self.fields, chunk_size=3)
+        times = [1., 2., 3., 3., 3., 3., 4., 5., 5., 5.]
+        self.fill(store, times)
+        for t_start, t_stop in ((3., 3.), (3., 4.), (2., 3.), (5., 5.), (4., 5.)):
+            self.check_read(store, times, t_start, t_stop)
+        store.close()
+
+    def test_fields_mismatch(self):
+        itb_store.ColumnStore(self.path, fields=self.fields).close()
+        with self.assertRaises(ValueError):
+            itb_store.ColumnStore(self.path, fields=["time", "c"])
+        with self.assertRaises(ValueError):
+            itb_store.ColumnStore(self.path + "_new")
+
+    def test_crash_recovery(self):
+        store = itb_store.ColumnStore(self.path, fields=self.fields, chunk_size=4)
+        self.fill(store, range(10))  # 2 блока на диске, 2 строки в памяти теряются
+        # аварийное завершение во время записи следующего блока: часть столбцов и часть записи индекса
+        store.files[0].write(numpy.zeros(3).tobytes())
+        store.files[0].flush()
+        store.index_file.write(b"\x01" * 7)
+        store.index_file.flush()
+        store = itb_store.ColumnStore(self.path)
+        self.assertEqual(len(store), 8)
+        self.check_read(store, range(8), -1., 100.)
+        # запись продолжается после последнего целого блока
+        self.fill(store, range(8, 14))
+        store.close()
+        store = itb_store.ColumnStore(self.path)
+        self.check_read(store, range(14), -1., 100.)
+        self.assertEqual(os.path.getsize(os.path.join(self.path, itb_store.index_file_name)),
+                         4 * itb_store.index_record.size)
+        store.close()
+
+    def test_crash_recovery_short_column(self):
+        # индекс записан, но столбец на диск попал не целиком (сбой питания): блок отбрасывается,
+        # а не дополняется нулями
+        store = itb_store.ColumnStore(self.path, fields=self.fields, chunk_size=4)
+        self.fill(store, range(12))
+        store.close()
+        column_path = os.path.join(self.path, "b.bin")
+        with open(column_path, "r+b") as file:
+            file.truncate(10 * 8)
+        store = itb_store.ColumnStore(self.path)
+        self.assertEqual(len(store), 8)
+        self.check_read(store, range(8), -1., 100.)
+        store.close()
+        self.assertEqual(os.path.getsize(os.path.join(self.path, "a.bin")), 8 * 8)
+
+    def test_store_sink(self):
+        class Channel:
+            def __init__(self, data):
+                self.data = data
+        store = itb_store.ColumnStore(self.path, fields=itb_store.channels_fields(2), chunk_size=2)
+        sink = itb_store.StoreSink(store)
+        for i in range(3):
+            sink([Channel([float(i)] + [10. * i + j for j in range(6)]),
+                  Channel([float(i)] + [100. * i + j for j in range(6)])])
+        data = store.read()
+        numpy.testing.assert_allclose(data["time"] - sink.time_offset, [0., 1., 2.])
+        numpy.testing.assert_array_equal(data["ch1_ku"], [5., 105., 205.])
+        sink.close()